@@ -0,0 +1,83 @@
+import os
+from dataclasses import dataclass
+
+from src.ffmpeg_utils import format_seconds, run_ffmpeg
+
+# Encoder arguments per synthetic codec; the GOP is forced to a fixed length
+_CODEC_ARGS = {
+    "h264": lambda gop: ["-c:v", "libx264", "-preset", "veryfast", "-g", str(gop),
+                         "-keyint_min", str(gop), "-sc_threshold", "0"],
+    "hevc": lambda gop: ["-c:v", "libx265", "-preset", "veryfast", "-tag:v", "hvc1",
+                         "-x265-params", f"keyint={gop}:min-keyint={gop}:scenecut=0:log-level=error"],
+    "mpeg4": lambda gop: ["-c:v", "mpeg4", "-q:v", "4", "-g", str(gop)],
+}
+
+
+@dataclass(frozen=True)
+class SyntheticVideo:
+    """Parameters of a generated test video"""
+    width: int
+    height: int
+    fps: int
+    duration: float
+    gop: int
+    codec: str = "h264"
+    audio: bool = True
+
+    @property
+    def name(self):
+        audio = "audio" if self.audio else "mute"
+        return f"{self.codec}_{self.width}x{self.height}_{self.fps}fps_gop{self.gop}_{audio}"
+
+    def filename(self):
+        return f"{self.name}_{self.duration:g}s.mp4"
+
+
+# From small and frequent keyframes to large and sparse ones
+DEFAULT_VIDEOS = [
+    SyntheticVideo(640, 360, 30, 20, 30),
+    SyntheticVideo(1280, 720, 30, 20, 250),
+    SyntheticVideo(1920, 1080, 60, 10, 60, audio=False),
+    SyntheticVideo(1280, 720, 30, 10, 60, codec="hevc", audio=False),
+    SyntheticVideo(854, 480, 25, 15, 12, codec="mpeg4"),
+]
+QUICK_VIDEOS = DEFAULT_VIDEOS[:1]
+
+
+def generate(video, directory):
+    """Render a synthetic video into directory unless it is already there"""
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, video.filename())
+    if os.path.exists(path):
+        return path
+
+    duration = format_seconds(video.duration)
+    args = ["-f", "lavfi", "-i",
+            f"testsrc2=size={video.width}x{video.height}:rate={video.fps}:duration={duration}"]
+    if video.audio:
+        args += ["-f", "lavfi", "-i", f"sine=frequency=440:sample_rate=48000:duration={duration}",
+                 "-c:a", "aac", "-b:a", "128k"]
+    args += _CODEC_ARGS[video.codec](video.gop) + ["-pix_fmt", "yuv420p"]
+    # Render under a temporary name so an interrupted run is not mistaken for a finished file
+    tmp_path = path + ".part.mp4"
+    run_ffmpeg(args + [tmp_path])
+    os.replace(tmp_path, path)
+    return path
+
+
+def loop(path, times):
+    """Stream-copy path times over into one longer file next to it, unless it is already there"""
+    looped = f"{os.path.splitext(path)[0]}_x{times}.mp4"
+    if times == 1 or os.path.exists(looped):
+        return path if times == 1 else looped
+    list_path = looped + ".txt"
+    with open(list_path, "w", encoding="utf-8") as f:
+        f.write(f"file '{os.path.basename(path)}'\n" * times)
+    tmp_path = looped + ".part.mp4"
+    try:
+        run_ffmpeg(["-f", "concat", "-safe", "0", "-i", os.path.basename(list_path), "-c", "copy",
+                    os.path.basename(tmp_path)], cwd=os.path.dirname(os.path.abspath(path)))
+    finally:
+        os.remove(list_path)
+    os.replace(tmp_path, looped)
+    return looped
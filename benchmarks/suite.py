@@ -0,0 +1,510 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from benchmarks.media import DEFAULT_VIDEOS, QUICK_VIDEOS, generate, loop
+from src.cache import cache_dir, cache_root
+from src.ffmpeg_utils import clear_probe_cache, get_ffmpeg_binary, probe_media, remove_quietly
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CASES = ("load", "seek", "decoders", "scrub", "playback", "audio", "analysis", "trim", "memory")
+
+# Lengths, in copies of the video, the memory benchmark opens
+MEMORY_LOOPS = (1, 8, 64)
+
+# The GUI shows frames in a 640x360 box
+DISPLAY_BOX = (640, 360)
+
+
+def latency_stats(samples):
+    """p50/p95/max of durations in seconds, reported in milliseconds"""
+    if not samples:
+        return {"n": 0}
+    ms = np.asarray(samples) * 1000
+    return {
+        "n": len(samples),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process and of its finished children, in MB"""
+    if resource is None:
+        return {}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit
+    return {"peak_rss_mb": round(own / 1e6, 1), "peak_child_rss_mb": round(children / 1e6, 1)}
+
+
+def _display_frame(image, size, scaled, rgba):
+    # The display path of the GUI: scale first, then convert to RGBA
+    import cv2
+    cv2.resize(image, size, dst=scaled)
+    cv2.cvtColor(scaled, cv2.COLOR_BGR2RGBA, dst=rgba)
+
+
+def _display_buffers(size):
+    width, height = size
+    return np.empty((height, width, 3), np.uint8), np.empty((height, width, 4), np.uint8)
+
+
+def bench_load(path, repeat):
+    """Opening a file the way load_video does, plus building the frame index"""
+    from src.media_index import MediaIndex, index_cache_path
+    from src.media_source import MediaSource
+    from src.playback import fit_size
+
+    first_frame, index_cold, index_warm = [], [], []
+    for _ in range(repeat):
+        clear_probe_cache()
+        started = time.perf_counter()
+        source = MediaSource(path)
+        ret, image, _ = source.read_at(0)
+        size = fit_size(*source.frame_size, *DISPLAY_BOX)
+        _display_frame(image, size, *_display_buffers(size))
+        first_frame.append(time.perf_counter() - started)
+        source.close()
+
+        shutil.rmtree(index_cache_path(path), ignore_errors=True)
+        started = time.perf_counter()
+        MediaIndex.load_or_build(path)
+        index_cold.append(time.perf_counter() - started)
+        started = time.perf_counter()
+        MediaIndex.load_or_build(path)
+        index_warm.append(time.perf_counter() - started)
+    return {
+        "first_frame": latency_stats(first_frame),
+        "index_cold": latency_stats(index_cold),
+        "index_warm": latency_stats(index_warm),
+    }
+
+
+def bench_seek(path, repeat):
+    """Random seeks and single frame steps through FrameSeeker, as the timeline does"""
+    import cv2
+
+    from src.media_index import FrameSeeker, MediaIndex
+    from src.playback import fit_size
+
+    index = MediaIndex.load_or_build(path)
+    cap = cv2.VideoCapture(path)
+    seeker = FrameSeeker(cap, index)
+    info = probe_media(path)
+    size = fit_size(info.width, info.height, *DISPLAY_BOX)
+    buffers = _display_buffers(size)
+    rng = np.random.default_rng(0)
+    last_time = index.time_of(index.frame_count - 1)
+
+    seeks, steps = [], []
+    try:
+        for target in rng.uniform(0, last_time, repeat * 10):
+            started = time.perf_counter()
+            ret, image, _ = seeker.read_at(float(target))
+            if ret:
+                _display_frame(image, size, *buffers)
+            seeks.append(time.perf_counter() - started)
+
+        seeker.seek_frame(0)
+        for _ in range(min(index.frame_count, repeat * 30)):
+            started = time.perf_counter()
+            ret, image, _ = seeker.read_next()
+            if not ret:
+                break
+            _display_frame(image, size, *buffers)
+            steps.append(time.perf_counter() - started)
+    finally:
+        cap.release()
+    return {"random": latency_stats(seeks), "step": latency_stats(steps)}
+
+
+def bench_decoders(path, repeat):
+    """Two consumers stepping through different parts of one MediaSource, and random seeks from threads"""
+    import threading
+
+    from src.media_source import MediaSource
+
+    source = MediaSource(path)
+    source.set_index(source.load_index())
+    index = source.index
+    try:
+        # Like the player and the preview stepping at the same time
+        steps = []
+        first, second = index.frame_count // 4, index.frame_count * 3 // 4
+        for step in range(min(repeat * 30, index.frame_count // 4)):
+            for frame in (first + step, second + step):
+                started = time.perf_counter()
+                source.read_at(float(index.time_of(frame)))
+                steps.append(time.perf_counter() - started)
+
+        rng = np.random.default_rng(0)
+        targets = [float(index.time_of(int(frame))) for frame in rng.integers(0, index.frame_count, repeat * 40)]
+
+        def seek(part):
+            for target in part:
+                source.read_at(target)
+
+        threads = [threading.Thread(target=seek, args=(targets[i::4],)) for i in range(4)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        return {
+            "interleaved": latency_stats(steps),
+            "threaded_seeks_per_second": round(len(targets) / elapsed, 1),
+            "decoders_opened": source.decoders.opened,
+        }
+    finally:
+        source.close()
+
+
+def bench_scrub(path, repeat):
+    """Building the keyframe thumbnails and looking them up while dragging"""
+    from src.media_index import MediaIndex
+    from src.scrub_cache import ThumbnailBuilder, ThumbnailCache
+
+    index = MediaIndex.load_or_build(path)
+    info = probe_media(path)
+    cache = ThumbnailCache()
+    builder = ThumbnailBuilder(path, index, cache, (info.width, info.height))
+    started = time.perf_counter()
+    builder.start()
+    builder.wait()
+    build_time = time.perf_counter() - started
+
+    lookups = []
+    rng = np.random.default_rng(0)
+    for frame in rng.integers(0, index.frame_count, repeat * 100):
+        started = time.perf_counter()
+        cache.nearest(int(frame))
+        lookups.append(time.perf_counter() - started)
+    thumbnails = len(cache)
+    return {
+        "build_s": round(build_time, 3),
+        "thumbnails": thumbnails,
+        "thumbnails_per_s": round(thumbnails / build_time, 1) if build_time > 0 else 0.0,
+        "lookup": latency_stats(lookups),
+    }
+
+
+def bench_playback(path, repeat, seconds=4.0):
+    """Realtime playback through DecodeAheadPlayer, and the decoder's top speed"""
+    import cv2
+
+    from src.media_index import FrameSeeker, MediaIndex
+    from src.playback import DecodeAheadPlayer, PlaybackClock, fit_size
+
+    index = MediaIndex.load_or_build(path)
+    info = probe_media(path)
+    size = fit_size(info.width, info.height, *DISPLAY_BOX)
+    width, height = size
+    shown = np.empty((height, width, 4), np.uint8)
+    seconds = min(seconds, index.time_of(index.frame_count - 1))
+
+    # Realtime: the same loop as play_video, with the copy PhotoImage makes
+    player = DecodeAheadPlayer(path, index, 0.0, size)
+    player.start()
+    clock = PlaybackClock(0.0)
+    ticks = []
+    started = time.perf_counter()
+    while clock.now() < seconds and not player.exhausted:
+        tick = time.perf_counter()
+        taken = player.frame_for(clock.now(), index.frame_duration)
+        if taken is not None:
+            np.copyto(shown, player.slots[taken[0]])
+            player.release(taken[0])
+            ticks.append(time.perf_counter() - tick)
+        due = player.next_due()
+        time.sleep(max(0.001, min(due - clock.now(), 0.05)) if due is not None else 0.005)
+    elapsed = time.perf_counter() - started
+    player.stop()
+    expected = index.count_frames(0.0, seconds)
+
+    # Top speed: decode and scale as fast as possible
+    cap = cv2.VideoCapture(path)
+    seeker = FrameSeeker(cap, index)
+    buffers = _display_buffers(size)
+    frames = 0
+    decode_started = time.perf_counter()
+    for _ in range(min(index.frame_count, repeat * 60)):
+        ret, image, _ = seeker.read_next()
+        if not ret:
+            break
+        _display_frame(image, size, *buffers)
+        frames += 1
+    decode_elapsed = time.perf_counter() - decode_started
+    cap.release()
+    return {
+        "realtime_fps": round(player.shown / elapsed, 2) if elapsed > 0 else 0.0,
+        "source_fps": round(expected / seconds, 2) if seconds > 0 else 0.0,
+        "shown": player.shown,
+        "dropped": player.dropped,
+        "late": player.late,
+        "frame": latency_stats(ticks),
+        "decode_fps": round(frames / decode_elapsed, 2) if decode_elapsed > 0 else 0.0,
+    }
+
+
+def bench_audio(path, repeat):
+    """Time from starting the audio preview to the first audible chunk"""
+    if not probe_media(path).has_audio:
+        return {"skipped": "no audio stream"}
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    import pygame
+
+    from src.audio_stream import StreamingAudio
+
+    pygame.mixer.init(frequency=44100, size=-16, channels=2)
+    audio = StreamingAudio(path)
+    duration = probe_media(path).duration
+    rng = np.random.default_rng(0)
+    starts = []
+    try:
+        for position in rng.uniform(0, duration * 0.8, repeat * 3):
+            started = time.perf_counter()
+            audio.play(float(position))
+            while audio.position() is None and time.perf_counter() - started < 5:
+                time.sleep(0.001)
+            starts.append(time.perf_counter() - started)
+            audio.stop()
+    finally:
+        audio.stop()
+        pygame.mixer.quit()
+    return {"start": latency_stats(starts)}
+
+
+def bench_analysis(path, repeat):
+    """Speed of finding scene changes and silences in the whole file"""
+    from src.analysis import MediaAnalysis
+    from src.media_index import MediaIndex
+
+    index = MediaIndex.load_or_build(path)
+    has_audio = probe_media(path).has_audio
+    duration = index.time_of(index.frame_count - 1) + index.frame_duration
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        analysis = MediaAnalysis.analyze(path, index, has_audio)
+        timings.append(time.perf_counter() - started)
+    elapsed = float(np.median(timings))
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "realtime_factor": round(duration / elapsed, 2),
+        "frames_per_second": round(index.frame_count / elapsed, 1),
+        "markers": len(analysis.markers(index)),
+    }
+
+
+def bench_trim(path, repeat):
+    """Throughput of every trim engine on the middle half of the file"""
+    from src.media_index import MediaIndex
+    from src.trim_engine import TRIM_MODES, trim
+
+    index = MediaIndex.load_or_build(path)
+    duration = index.time_of(index.frame_count - 1)
+    # Start off a keyframe so the copy and smart engines have edges to deal with
+    start = duration * 0.25 + index.frame_duration * 3.5
+    end = duration * 0.75
+    workdir = cache_dir("trims")
+    results = {}
+    for label, mode in TRIM_MODES.items():
+        output = os.path.join(workdir, f"trim_{mode}.mp4")
+        timings, written = [], 0
+        for _ in range(repeat):
+            remove_quietly(output)
+            result = trim(path, start, end, output, mode=mode, index=index)
+            timings.append(result.elapsed)
+            written = os.path.getsize(output)
+        elapsed = float(np.median(timings))
+        results[mode] = {
+            "elapsed_s": round(elapsed, 3),
+            "realtime_factor": round((end - start) / elapsed, 2),
+            "output_mb_per_s": round(written / 1e6 / elapsed, 2),
+            "input_mb_per_s": round(index.byte_size(start, end) / 1e6 / elapsed, 2),
+            "note": result.note,
+        }
+        remove_quietly(output)
+    return results
+
+
+def bench_memory(path, repeat):
+    """Peak memory of opening, indexing, seeking, scrubbing and trimming ever longer copies of the file
+
+    Each length is measured in a fresh process. With memory bounded the
+    peak stays about the same while the duration grows.
+    """
+    results = {}
+    for times in MEMORY_LOOPS:
+        looped = loop(path, times)
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results[f"x{times}"] = pool.submit(_memory_session, looped).result()
+    return results
+
+
+def _memory_session(path):
+    from src.budget import ResourceBudget, current_rss
+    from src.media_index import index_cache_path
+    from src.media_source import MediaSource
+    from src.scrub_cache import ThumbnailBuilder, open_thumbnail_cache
+
+    budget = ResourceBudget()
+    shutil.rmtree(index_cache_path(path), ignore_errors=True)
+    started = time.perf_counter()
+    source = MediaSource(path, budget=budget)
+    index = source.load_index()
+    source.set_index(index)
+    for fraction in (0.1, 0.9, 0.5):
+        source.read_at(source.duration * fraction)
+    thumbnails = open_thumbnail_cache(path, budget.thumbnail_bytes(), spill=False)
+    builder = ThumbnailBuilder(path, index, thumbnails, source.frame_size, budget.thumbnail_interval(source.info))
+    builder.start()
+    builder.wait()
+    output = os.path.join(os.path.dirname(os.path.abspath(path)), "memory-trim.mp4")
+    start = source.duration * 0.4 + index.frame_duration * 3.5
+    try:
+        source.trim([(start, start + source.duration * 0.1)], output, "smart")
+    finally:
+        remove_quietly(output)
+    result = {
+        "duration_s": round(source.duration, 1),
+        "frames": index.frame_count,
+        "decoders": source.max_decoders,
+        "rss_end_mb": round((current_rss() or 0) / 1e6, 1),
+        "elapsed_s": round(time.perf_counter() - started, 2),
+    }
+    source.close()
+    result.update(peak_rss_mb())
+    return result
+
+
+_BENCHMARKS = {
+    "load": bench_load,
+    "seek": bench_seek,
+    "decoders": bench_decoders,
+    "scrub": bench_scrub,
+    "playback": bench_playback,
+    "audio": bench_audio,
+    "analysis": bench_analysis,
+    "trim": bench_trim,
+    "memory": bench_memory,
+}
+
+
+def run_case(case, path, repeat):
+    """Run one benchmark in the current process and append its peak memory"""
+    result = _BENCHMARKS[case](path, repeat)
+    result.update(peak_rss_mb())
+    return result
+
+
+def _run_isolated(case, path, repeat):
+    # A fresh process per case so peak RSS belongs to that case alone
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+        return pool.submit(run_case, case, path, repeat).result()
+
+
+def environment():
+    """What the numbers were measured on, so runs can be compared"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    try:
+        version = subprocess.run([get_ffmpeg_binary(), "-version"], capture_output=True,
+                                 text=True).stdout.splitlines()[0]
+    except (OSError, IndexError):
+        version = ""
+    return {
+        "commit": commit or None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "ffmpeg": version,
+    }
+
+
+def flatten(results, prefix=""):
+    """Map dotted metric names to the numbers of a results tree"""
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, name + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare(baseline, current, report=print):
+    """Print every metric present in both runs with its relative change"""
+    old, new = flatten(baseline["results"]), flatten(current["results"])
+    report(f"{'metric':<70} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name in sorted(old.keys() & new.keys()):
+        change = f"{(new[name] - old[name]) / old[name] * 100:+.1f}%" if old[name] else ""
+        report(f"{name:<70} {old[name]:>12g} {new[name]:>12g} {change:>8}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the trimmer's hot paths on synthetic videos.")
+    parser.add_argument("-o", "--output", help="JSON file for the results (default: benchmark-<commit>.json)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES),
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--quick", action="store_true", help="one small video and fewer repetitions")
+    parser.add_argument("--repeat", type=int, help="repetitions per benchmark (default: 3, quick: 1)")
+    parser.add_argument("--videos", help="directory of the generated videos (default: in the cache)")
+    parser.add_argument("--compare", metavar="BASELINE", help="JSON of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    repeat = args.repeat or (1 if args.quick else 3)
+    videos = QUICK_VIDEOS if args.quick else DEFAULT_VIDEOS
+    # Keep indexes, thumbnails and trims of benchmark runs apart from the user's
+    # caches; the case processes inherit the setting
+    os.environ["VIDEO_TRIMMER_CACHE"] = os.path.join(cache_root(), "benchmarks")
+    directory = args.videos or cache_dir("media")
+
+    run = {"environment": environment(), "repeat": repeat, "results": {}}
+    for video in videos:
+        print(f"Generating {video.name}...", flush=True)
+        path = generate(video, directory)
+        results = run["results"][video.name] = {}
+        for case in args.cases:
+            print(f"  {case}...", flush=True)
+            started = time.perf_counter()
+            try:
+                results[case] = _run_isolated(case, path, repeat)
+            except Exception as e:
+                results[case] = {"error": str(e) or type(e).__name__}
+            print(f"  {case} done in {time.perf_counter() - started:.1f}s", flush=True)
+
+    output = args.output or f"benchmark-{run['environment']['commit'] or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(run, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), run)
+    else:
+        for name, value in sorted(flatten(run["results"]).items()):
+            print(f"{name:<70} {value:>12g}")
+    return 0
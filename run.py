@@ -1,14 +1,54 @@
 # run.py
+import argparse
+
+from src.budget import ResourceBudget, parse_size
+from src.instrumentation import METRICS, MetricsLog, start_profiler
 from src.video_trimmer import VideoTrimmer
 import tkinter as tk
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Video Trimmer")
+    parser.add_argument("--stats", action="store_true", help="start with the performance overlay shown")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="append stage timings to FILE as JSON lines every few seconds and after each trim")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="profile the session into FILE: cProfile for .prof, sampled stacks of all threads otherwise")
+    parser.add_argument("--memory", type=parse_size, metavar="SIZE",
+                        help="memory budget, e.g. 512M; caches are sized from it and dropped above it (default 1G)")
+    parser.add_argument("--temp-space", type=parse_size, metavar="SIZE",
+                        help="temporary disk space one trim may use, e.g. 20G (default: what the disk has free)")
+    parser.add_argument("--temp-dir", metavar="DIR", help="directory for temporary files of trims")
+    parser.add_argument("--large-file", action="store_true",
+                        help="handle every file in large-file mode, not only long or big ones")
+    args = parser.parse_args()
+
+    budget = ResourceBudget.from_env()
+    if args.memory:
+        budget.memory_bytes = args.memory
+    if args.temp_space:
+        budget.temp_bytes = args.temp_space
+    if args.temp_dir:
+        budget.temp_dir = args.temp_dir
+    if args.large_file:
+        budget.large_file = True
+
+    metrics_log = MetricsLog(METRICS, args.metrics) if args.metrics else None
+    profiler = start_profiler(args.profile) if args.profile else None
+    if metrics_log:
+        metrics_log.start()
+
     root = tk.Tk()
-    app = VideoTrimmer(root)
+    app = VideoTrimmer(root, show_stats=args.stats, metrics_log=metrics_log, budget=budget)
     
     def on_closing():
         app.cleanup()
         root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
-    root.mainloop()
\ No newline at end of file
+    try:
+        root.mainloop()
+    finally:
+        if metrics_log:
+            metrics_log.stop()
+        if profiler:
+            profiler.stop()
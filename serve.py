@@ -0,0 +1,7 @@
+# serve.py
+import sys
+
+from src.service import main
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,332 @@
+import json
+import os
+import threading
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+import numpy as np
+
+from src.cache import cache_path
+from src.ffmpeg_utils import FFmpegError, OperationCancelled, format_seconds, get_ffmpeg_binary, start_process
+from src.parallel_encode import plan_chunks
+
+# Bump when the on-disk layout or the metrics change so stale caches are redone
+ANALYSIS_VERSION = 1
+
+# Frames are compared as tiny grayscale images; cuts survive downscaling, noise does not
+ANALYSIS_SIZE = (64, 36)
+HIST_BINS = 16
+# Frames decoded and compared per batch
+BATCH_FRAMES = 256
+
+# Default sensitivity: scene scores run from 0 (identical) to 1 (nothing in common)
+SCENE_THRESHOLD = 0.3
+MIN_SCENE_SECONDS = 1.0
+
+# Audio is measured as mono at a low rate, in short windows
+AUDIO_RATE = 8000
+AUDIO_WINDOW = 0.02
+SILENCE_DB = -40.0
+MIN_SILENCE_SECONDS = 0.5
+# Quietest level stored, for windows of digital silence
+FLOOR_DB = -100.0
+
+# Kinds of suggested cut points
+MARKER_SCENE = "scene"
+MARKER_SILENCE = "silence"
+
+
+class MediaAnalysis:
+    """Per-frame scene-change scores and per-window loudness of a file
+
+    scene_scores  how different each frame is from the one before it, from
+                  0 to 1; frame 0 scores 0
+    loudness      level of every AUDIO_WINDOW of audio in dBFS, empty
+                  without audio
+
+    Only these raw measurements are cached, so the suggested cut points
+    can be recomputed at any sensitivity without decoding again.
+    """
+
+    def __init__(self, scene_scores, loudness):
+        self.scene_scores = scene_scores
+        self.loudness = loudness
+
+    @classmethod
+    def load_or_analyze(cls, path, index, has_audio=True, video_path=None, workers=None, cancel=None,
+                        progress=None):
+        """Return the analysis of path, running it and caching the result on first use
+
+        See analyze() for the arguments.
+        """
+        analysis = cls.load_cached(path, index)
+        if analysis is not None:
+            return analysis
+        analysis = cls.analyze(path, index, has_audio, video_path, workers, cancel, progress)
+        try:
+            analysis.save(cache_path("analysis", path, ".npz"))
+        except OSError:
+            pass
+        return analysis
+
+    @classmethod
+    def load_cached(cls, path, index):
+        """Return the cached analysis of path, or None if it has not been analyzed yet"""
+        cached = cache_path("analysis", path, ".npz")
+        if os.path.exists(cached):
+            try:
+                analysis = cls.load(cached)
+                if len(analysis.scene_scores) == index.frame_count:
+                    return analysis
+            except Exception:
+                pass
+        return None
+
+    @classmethod
+    def analyze(cls, path, index, has_audio=True, video_path=None, workers=None, cancel=None, progress=None):
+        """Measure every frame and the audio of path in one streaming read per chunk
+
+        The video is split at keyframes into chunks, like the parallel
+        encoder does, and every chunk is decoded by its own ffmpeg process
+        straight into tiny grayscale frames, which NumPy compares a batch
+        at a time. The audio is measured on another worker meanwhile.
+        video_path is a file with the same frames at the same times to
+        decode instead, such as the preview proxy. progress is called with
+        the fraction of frames done; setting the threading.Event cancel
+        stops the analysis with OperationCancelled.
+        """
+        workers = workers or os.cpu_count() or 1
+        end = index.frame_times[-1] + index.frame_duration
+        chunks = plan_chunks(index, [(0.0, end)], workers)
+        tracker = _Progress(index.frame_count, progress)
+        margin = index.frame_duration / 2
+
+        # The workers stop on their own event, so a failing worker stops
+        # its siblings without looking like a cancel to the caller
+        stop = threading.Event()
+        if cancel is not None:
+            threading.Thread(target=_forward_cancel, args=(cancel, stop), daemon=True).start()
+        try:
+            with ThreadPoolExecutor(max_workers=workers + 1) as pool:
+                audio = pool.submit(_measure_loudness, path, stop) if has_audio else None
+                parts = [pool.submit(_score_chunk, video_path or path, chunk_start - margin, frames, stop, tracker)
+                         for chunk_start, frames in chunks]
+                futures = parts + ([audio] if audio else [])
+                done, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                failed = [future for future in futures if future in done and future.exception() is not None]
+                if failed:
+                    stop.set()
+                    # The siblings the stop killed fail with OperationCancelled; report the real error
+                    errors = [future.exception() for future in failed]
+                    raise next((e for e in errors if not isinstance(e, OperationCancelled)), errors[0])
+                results = [part.result() for part in parts]
+                loudness = audio.result() if audio else np.empty(0, dtype=np.float32)
+        finally:
+            stop.set()
+
+        scores = np.concatenate([scores for scores, _, _ in results])
+        # The first frame of every chunk is compared with the last frame of the chunk before
+        position = 0
+        for (scores_before, _, last), (_, first, _) in zip(results, results[1:]):
+            position += len(scores_before)
+            if last is not None and first is not None:
+                scores[position] = _frame_scores(last[None], first[None])[0]
+        if len(scores) != index.frame_count:
+            raise FFmpegError(f"Decoded {len(scores)} of {index.frame_count} frames of {path}")
+        scores[0] = 0.0
+        return cls(scores, loudness)
+
+    @classmethod
+    def load(cls, cached):
+        with np.load(cached) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta.get("version") != ANALYSIS_VERSION:
+                raise ValueError("Analysis version mismatch")
+            return cls(data["scene_scores"], data["loudness"])
+
+    def save(self, cached):
+        meta = json.dumps({"version": ANALYSIS_VERSION})
+        tmp = cached + ".tmp.npz"
+        np.savez(tmp, meta=np.array(meta), scene_scores=self.scene_scores, loudness=self.loudness)
+        os.replace(tmp, cached)
+
+    def scene_changes(self, index, threshold=SCENE_THRESHOLD, min_seconds=MIN_SCENE_SECONDS):
+        """Frame boundaries where a new shot starts
+
+        A frame starts a shot when its score reaches threshold and is the
+        highest within min_seconds on either side, so a fade or a burst of
+        flashes yields one cut point instead of many.
+        """
+        scores = self.scene_scores
+        candidates = np.flatnonzero(scores >= threshold)
+        if not len(candidates):
+            return candidates
+        radius = max(1, int(round(min_seconds / index.frame_duration)))
+        # Running maximum over the window, computed only where it is needed
+        peaks = [frame for frame in candidates
+                 if scores[frame] >= scores[max(0, frame - radius):frame + radius + 1].max()]
+        # Equal scores next to each other: keep the first
+        kept = []
+        for frame in peaks:
+            if not kept or frame - kept[-1] > radius:
+                kept.append(frame)
+        return np.asarray(kept, dtype=np.int64)
+
+    def silences(self, threshold_db=SILENCE_DB, min_seconds=MIN_SILENCE_SECONDS):
+        """(start, end) seconds of the stretches quieter than threshold_db for at least min_seconds"""
+        quiet = np.concatenate(([0], (self.loudness < threshold_db).astype(np.int8), [0]))
+        edges = np.diff(quiet)
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        keep = (ends - starts) * AUDIO_WINDOW >= min_seconds
+        return np.stack((starts[keep], ends[keep]), axis=1) * AUDIO_WINDOW
+
+    def markers(self, index, scene_threshold=SCENE_THRESHOLD, silence_db=SILENCE_DB,
+                min_silence=MIN_SILENCE_SECONDS):
+        """Suggested cut points as sorted (boundary, kind) pairs
+
+        Scene markers sit on the first frame of each new shot. Silence
+        markers sit on the frame boundary in the middle of each quiet
+        stretch, which leaves room on both sides of the cut.
+        """
+        points = {int(frame): MARKER_SCENE for frame in self.scene_changes(index, scene_threshold)}
+        for start, end in self.silences(silence_db, min_silence):
+            boundary = index.first_frame_from((start + end) / 2)
+            if 0 < boundary < index.frame_count:
+                points.setdefault(boundary, MARKER_SILENCE)
+        points.pop(0, None)
+        return sorted(points.items())
+
+
+class _Progress:
+    """Frames done over all chunks, reported as a fraction"""
+
+    def __init__(self, total, callback):
+        self.total = total
+        self.callback = callback
+        self.done = 0
+        self._lock = threading.Lock()
+
+    def add(self, frames):
+        if self.callback is None:
+            return
+        with self._lock:
+            self.done += frames
+            fraction = min(1.0, self.done / self.total) if self.total else 1.0
+        self.callback(fraction)
+
+
+def _forward_cancel(cancel, stop):
+    """Set stop once cancel is set; returns when either is"""
+    while not stop.is_set():
+        if cancel.wait(0.1):
+            stop.set()
+
+
+def _check(cancel):
+    if cancel is not None and cancel.is_set():
+        raise OperationCancelled("Analysis cancelled")
+
+
+def _histograms(frames):
+    """Normalized HIST_BINS-bin luma histograms of a (n, h, w) uint8 stack"""
+    count = len(frames)
+    bins = (frames.reshape(count, -1) // (256 // HIST_BINS)).astype(np.int64)
+    bins += np.arange(count, dtype=np.int64)[:, None] * HIST_BINS
+    pixels = frames.shape[1] * frames.shape[2]
+    return np.bincount(bins.ravel(), minlength=count * HIST_BINS).reshape(count, HIST_BINS) / pixels
+
+
+def _frame_scores(before, after):
+    """Scene-change score of each frame in after against the frame at the same place in before
+
+    Combines how far the brightness histogram moved with how much the
+    pixels changed: motion changes pixels but hardly the histogram, a
+    change of lighting the histogram but few edges, while a cut changes
+    both.
+    """
+    moved = np.abs(_histograms(after) - _histograms(before)).sum(axis=1) / 2
+    changed = np.abs(after.astype(np.int16) - before.astype(np.int16)).mean(axis=(1, 2)) / 64
+    return np.sqrt(moved * np.minimum(changed, 1.0)).astype(np.float32)
+
+
+def _score_chunk(path, seek, frames, cancel, tracker):
+    """Decode frames frames from seek; returns (scores, first frame, last frame)
+
+    The first score is left at 0; it depends on the chunk before.
+    """
+    width, height = ANALYSIS_SIZE
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error",
+           # The deblocking filter only matters for the look of full-size frames
+           "-skip_loop_filter", "all",
+           "-ss", format_seconds(max(seek, 0.0)), "-i", path, "-map", "0:v:0", "-an", "-sn",
+           "-frames:v", str(frames), "-vsync", "passthrough",
+           "-vf", f"scale={width}:{height}:flags=area", "-pix_fmt", "gray", "-f", "rawvideo", "-"]
+    proc = start_process(cmd, cancel)
+    # stderr is drained alongside stdout so a flood of errors cannot block ffmpeg
+    stderr = []
+    reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+    reader.start()
+    frame_bytes = width * height
+    scores, first, previous = [], None, None
+    try:
+        while True:
+            data = proc.stdout.read(frame_bytes * BATCH_FRAMES)
+            _check(cancel)
+            count = len(data) // frame_bytes
+            if not count:
+                break
+            batch = np.frombuffer(data, dtype=np.uint8, count=count * frame_bytes).reshape(count, height, width)
+            if first is None:
+                first = batch[0].copy()
+                scores.append(np.zeros(1, dtype=np.float32))
+                pairs = batch
+            else:
+                pairs = np.concatenate((previous[None], batch))
+            if len(pairs) > 1:
+                scores.append(_frame_scores(pairs[:-1], pairs[1:]))
+            previous = batch[-1].copy()
+            tracker.add(count)
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        reader.join()
+    if proc.returncode != 0:
+        message = stderr[0].decode("utf-8", "replace").strip() if stderr else ""
+        raise FFmpegError(message or "Analysis failed")
+    scores = np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+    return scores, first, previous
+
+
+def _measure_loudness(path, cancel):
+    """Level in dBFS of every AUDIO_WINDOW of the first audio stream"""
+    window = int(AUDIO_RATE * AUDIO_WINDOW)
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error",
+           "-i", path, "-map", "0:a:0", "-vn", "-ac", "1", "-ar", str(AUDIO_RATE), "-f", "s16le", "-"]
+    proc = start_process(cmd, cancel)
+    stderr = []
+    reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+    reader.start()
+    levels = []
+    # Whole windows per read, about ten seconds of audio
+    block = window * 2 * 500
+    try:
+        while True:
+            data = proc.stdout.read(block)
+            _check(cancel)
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype=np.int16, count=len(data) // 2).astype(np.float32)
+            usable = len(samples) // window * window
+            if usable:
+                windows = samples[:usable].reshape(-1, window) / 32768
+                rms = np.sqrt((windows * windows).mean(axis=1))
+                levels.append(np.maximum(20 * np.log10(np.maximum(rms, 1e-10)), FLOOR_DB).astype(np.float32))
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+        proc.wait()
+        reader.join()
+    if proc.returncode != 0:
+        message = stderr[0].decode("utf-8", "replace").strip() if stderr else ""
+        raise FFmpegError(message or "Audio analysis failed")
+    return np.concatenate(levels) if levels else np.empty(0, dtype=np.float32)
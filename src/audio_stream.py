@@ -0,0 +1,115 @@
+import subprocess
+import threading
+import time
+
+import pygame
+
+from src.ffmpeg_utils import format_seconds, get_ffmpeg_binary
+
+
+class StreamingAudio:
+    """Audio preview decoded on demand around the playhead
+
+    play() starts an ffmpeg process that decodes from the requested time to
+    raw PCM in the mixer's own format. A feeder thread cuts it into short
+    chunks and queues them on a pygame channel, keeping at most one chunk
+    playing and one queued, so memory stays bounded and nothing is written
+    to disk. Seeking simply restarts decoding at the new position.
+    """
+
+    def __init__(self, path, chunk_seconds=0.25):
+        self.path = path
+        self.chunk_seconds = chunk_seconds
+        frequency, size, channels = pygame.mixer.get_init()
+        self.frequency = frequency
+        self.channels = channels
+        self.size = size
+        self.sample_bytes = abs(size) // 8
+        self.channel = pygame.mixer.Channel(0)
+        self._proc = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Media time and monotonic time at which the current run of chunks started playing
+        self._anchor = None
+        self._queued_until = 0.0
+        self.underruns = 0
+
+    def _pcm_format(self):
+        # pygame reports signed formats as negative sizes and 32 bits as float
+        return {8: "u8", -8: "s8", 16: "u16le", -16: "s16le", 32: "f32le"}.get(self.size, "s16le")
+
+    def play(self, start_time):
+        """Start playing from start_time, replacing whatever was playing"""
+        self.stop()
+        self._stop = threading.Event()
+        cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error",
+               "-ss", format_seconds(start_time), "-i", self.path, "-map", "0:a:0", "-vn",
+               "-f", self._pcm_format(), "-ac", str(self.channels), "-ar", str(self.frequency), "-"]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        with self._lock:
+            self._anchor = None
+            self._queued_until = start_time
+        self._thread = threading.Thread(target=self._feed, args=(self._proc, self._stop, start_time), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+        if self._proc:
+            self._proc.wait()
+            self._proc = None
+        try:
+            self.channel.stop()
+        except pygame.error:
+            pass
+        with self._lock:
+            self._anchor = None
+
+    def _feed(self, proc, stop, start_time):
+        frame_bytes = self.sample_bytes * self.channels
+        chunk_bytes = int(self.frequency * self.chunk_seconds) * frame_bytes
+        media_time = start_time
+        try:
+            while not stop.is_set():
+                data = proc.stdout.read(chunk_bytes)
+                if not data:
+                    break
+                data = data[:len(data) - len(data) % frame_bytes]
+                sound = pygame.mixer.Sound(buffer=data)
+                duration = len(data) / frame_bytes / self.frequency
+
+                # Wait until the channel has room for one more queued chunk
+                while not stop.is_set() and self.channel.get_busy() and self.channel.get_queue() is not None:
+                    time.sleep(self.chunk_seconds / 5)
+                if stop.is_set():
+                    break
+                with self._lock:
+                    if self.channel.get_busy():
+                        self.channel.queue(sound)
+                    else:
+                        # Nothing is playing (first chunk or an underrun): restart the clock here
+                        if self._anchor is not None:
+                            self.underruns += 1
+                        self.channel.play(sound)
+                        self._anchor = (media_time, time.monotonic())
+                    media_time += duration
+                    self._queued_until = media_time
+        finally:
+            proc.stdout.close()
+
+    def position(self):
+        """Media time currently audible, or None when nothing is playing"""
+        with self._lock:
+            if self._anchor is None:
+                return None
+            anchor_media, anchor_clock = self._anchor
+            return min(anchor_media + (time.monotonic() - anchor_clock), self._queued_until)
+
+    @property
+    def playing(self):
+        return self._anchor is not None and self.channel.get_busy()
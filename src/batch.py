@@ -0,0 +1,331 @@
+import argparse
+import csv
+import dataclasses
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+
+from src.encoder_profiles import DEFAULT_PROFILE, PROFILES, autotune, choose_profile, get_profile
+from src.ffmpeg_utils import OperationCancelled, probe_media, remove_quietly
+from src.progress import ProgressEvent
+from src.trim_engine import MODE_COPY, TrimError, check_trim_range, trim
+
+MODES = ("reencode", "copy", "smart", "parallel")
+# "auto" picks a profile per input from the machine's benchmark results
+AUTO_PROFILE = "auto"
+# Seconds between progress reports of running batch jobs
+PROGRESS_INTERVAL = 2.0
+
+
+@dataclass
+class TrimJob:
+    """One manifest entry"""
+    job_id: str
+    input: str
+    start: float
+    end: float
+    output: str
+    mode: str = MODE_COPY
+    profile: str = DEFAULT_PROFILE
+    priority: int = 0
+
+
+def load_manifest(path, default_mode=MODE_COPY, default_profile=DEFAULT_PROFILE):
+    """Read the jobs of a CSV or JSON manifest
+
+    Each entry has input, start, end, output and optionally id, mode,
+    profile and priority.
+    Relative paths are resolved against the manifest's directory and an
+    empty end means the end of the input.
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+    return [parse_job(row, number, base, default_mode, default_profile)
+            for number, row in enumerate(rows, start=1)]
+
+
+def parse_job(row, number, base, default_mode=MODE_COPY, default_profile=DEFAULT_PROFILE):
+    """Build the TrimJob of one manifest entry; number identifies it in errors"""
+    try:
+        end = row.get("end")
+        job = TrimJob(
+            job_id=str(row.get("id") or number),
+            input=os.path.join(base, row["input"]),
+            start=float(row.get("start") or 0),
+            end=float(end) if end not in (None, "") else -1.0,
+            output=os.path.join(base, row["output"]),
+            mode=(row.get("mode") or default_mode).strip(),
+            profile=(row.get("profile") or default_profile).strip(),
+            priority=int(row.get("priority") or 0),
+        )
+    except (AttributeError, KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Manifest entry {number} is invalid: {e}") from e
+    if job.mode not in MODES:
+        raise ValueError(f"Manifest entry {number} has unknown mode {job.mode!r}")
+    if job.profile not in PROFILES and job.profile != AUTO_PROFILE:
+        raise ValueError(f"Manifest entry {number} has unknown profile {job.profile!r}")
+    return job
+
+
+class Journal:
+    """Append-only record of finished jobs, used to resume a batch"""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = {}
+        if os.path.exists(path):
+            line = "\n"
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A crash can leave a truncated last line
+                        continue
+                    if entry.get("status") == "done":
+                        self.done[entry["job_id"]] = entry
+            if not line.endswith("\n"):
+                # End the truncated line so the next entry starts on its own
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("\n")
+
+    def is_done(self, job):
+        entry = self.done.get(job.job_id)
+        return entry is not None and entry.get("output") == job.output and os.path.exists(job.output)
+
+    def record(self, entry):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        if entry.get("status") == "done":
+            self.done[entry["job_id"]] = entry
+
+
+def run_job(job, retries=1, encode_workers=None, progress=None, cancel=None):
+    """Run one job in a worker process, retrying failures; returns a journal entry
+
+    progress is an optional mapping shared with the parent process; the
+    job's latest ProgressEvent is stored in it under job_id as a dict.
+    Setting the Event cancel stops the job and returns a "cancelled" entry.
+    An "auto" profile that was not tuned beforehand is tuned here.
+    """
+    def report(event):
+        progress[job.job_id] = event.as_dict()
+
+    if job.profile == AUTO_PROFILE:
+        tune_profiles([job], report=lambda message: None)
+    attempts = 0
+    error = None
+    while attempts <= retries:
+        attempts += 1
+        try:
+            duration = probe_media(job.input).duration
+            end = duration if job.end < 0 else job.end
+            check_trim_range(job.start, end, duration)
+            profile = get_profile(job.profile)
+            if encode_workers:
+                profile = dataclasses.replace(profile, threads=encode_workers)
+            result = trim(job.input, job.start, end, job.output, mode=job.mode, workers=encode_workers,
+                          profile=profile, progress=report if progress is not None else None, cancel=cancel)
+            return {
+                "job_id": job.job_id,
+                "status": "done",
+                "output": job.output,
+                "attempts": attempts,
+                "elapsed": round(result.elapsed, 3),
+                "duration": round(result.duration, 3),
+                "bytes": os.path.getsize(job.output),
+                "profile": job.profile,
+                "note": result.note,
+                "stages": result.stages,
+            }
+        except OperationCancelled:
+            return {"job_id": job.job_id, "status": "cancelled", "output": job.output,
+                    "attempts": attempts, "error": "cancelled"}
+        except TrimError as e:
+            # Invalid ranges fail the same way every time
+            error = str(e)
+            break
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            remove_quietly(job.output)
+    return {"job_id": job.job_id, "status": "failed", "output": job.output,
+            "attempts": attempts, "error": error}
+
+
+def tune_profiles(jobs, min_psnr=None, max_kbps=None, report=print):
+    """Replace the auto profile of jobs with the fastest one meeting the targets
+
+    Benchmarks run here, before any job starts, so they are not slowed
+    down by the batch itself; results are cached per machine.
+    """
+    chosen = {}
+    for job in jobs:
+        if job.profile != AUTO_PROFILE:
+            continue
+        if job.input not in chosen:
+            try:
+                results = autotune(job.input, report=report)
+                chosen[job.input] = choose_profile(results, min_psnr, max_kbps)
+            except Exception as e:
+                report(f"Cannot benchmark {job.input}: {e}; using {DEFAULT_PROFILE}")
+                chosen[job.input] = DEFAULT_PROFILE
+            report(f"Profile for {os.path.basename(job.input)}: {chosen[job.input]}")
+        job.profile = chosen[job.input]
+
+
+@dataclass
+class BatchSummary:
+    """Totals of a batch run"""
+    total: int = 0
+    done: int = 0
+    skipped: int = 0
+    failed: int = 0
+    wall_time: float = 0.0
+    output_bytes: int = 0
+
+    @property
+    def jobs_per_minute(self):
+        return self.done / self.wall_time * 60 if self.wall_time > 0 else 0.0
+
+    @property
+    def megabytes_per_second(self):
+        return self.output_bytes / 1e6 / self.wall_time if self.wall_time > 0 else 0.0
+
+    def __str__(self):
+        return (f"{self.done} done, {self.skipped} skipped, {self.failed} failed of {self.total} jobs "
+                f"in {self.wall_time:.1f}s ({self.jobs_per_minute:.1f} jobs/min, "
+                f"{self.megabytes_per_second:.1f} MB/s written)")
+
+
+def run_batch(jobs, journal, workers=None, retries=1, report=print, encode_workers=None, progress=None,
+              min_psnr=None, max_kbps=None):
+    """Run jobs on a process pool, skipping those the journal marks as done
+
+    encode_workers is the number of encoders each parallel mode job runs
+    and the number of threads of the encoder of other jobs. progress is
+    called with each running job and its latest ProgressEvent every
+    PROGRESS_INTERVAL seconds. Jobs with the "auto" profile are tuned
+    against min_psnr and max_kbps before any job starts.
+    """
+    summary = BatchSummary(total=len(jobs))
+    pending = []
+    for job in jobs:
+        if journal.is_done(job):
+            summary.skipped += 1
+        else:
+            pending.append(job)
+    # Higher priorities are handed to the pool first
+    pending.sort(key=lambda job: -job.priority)
+    if summary.skipped:
+        report(f"Resuming: {summary.skipped} job(s) already done")
+    tune_profiles(pending, min_psnr, max_kbps, report=report)
+
+    started = time.perf_counter()
+    finished = summary.skipped
+    # Workers store their latest progress in a dict shared through a manager
+    manager = multiprocessing.Manager() if progress is not None else None
+    shared = manager.dict() if manager else None
+    reported = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(run_job, job, retries, encode_workers, shared): job for job in pending}
+            for job in pending:
+                report(f"[queued] {job.job_id}: {os.path.basename(job.input)} "
+                       f"{job.start:.2f}-{'end' if job.end < 0 else f'{job.end:.2f}'} ({job.mode}, {job.profile})")
+            running = set(futures)
+            while running:
+                done, running = wait(running, timeout=PROGRESS_INTERVAL, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = futures[future]
+                    try:
+                        entry = future.result()
+                    except Exception as e:
+                        # The worker process itself died
+                        entry = {"job_id": job.job_id, "status": "failed", "output": job.output,
+                                 "attempts": 1, "error": str(e) or type(e).__name__}
+                    journal.record(entry)
+                    finished += 1
+                    if entry["status"] == "done":
+                        summary.done += 1
+                        summary.output_bytes += entry["bytes"]
+                        speed = entry["duration"] / entry["elapsed"] if entry["elapsed"] else 0.0
+                        report(f"[{finished}/{summary.total}] done {job.job_id} -> {job.output} "
+                               f"in {entry['elapsed']:.1f}s ({speed:.1f}x realtime)")
+                    else:
+                        summary.failed += 1
+                        report(f"[{finished}/{summary.total}] FAILED {job.job_id} after "
+                               f"{entry['attempts']} attempt(s): {entry['error']}")
+                if shared is not None:
+                    for future in running:
+                        job = futures[future]
+                        data = shared.get(job.job_id)
+                        # Only jobs that moved since the last report are reported again
+                        if data is not None and data != reported.get(job.job_id):
+                            reported[job.job_id] = data
+                            progress(job, ProgressEvent(**{field.name: data[field.name]
+                                                           for field in dataclasses.fields(ProgressEvent)}))
+    finally:
+        if manager:
+            manager.shutdown()
+    summary.wall_time = time.perf_counter() - started
+    return summary
+
+
+def print_progress(job, event):
+    print(f"[running] {job.job_id}: {event}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trim many videos without the GUI.")
+    parser.add_argument("manifest", help="CSV or JSON manifest of input, start, end, output[, mode]")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="number of worker processes (default: CPU count)")
+    parser.add_argument("--encode-workers", type=int,
+                        help="encoders per parallel job, or encoder threads per other job "
+                             "(default: CPU count / workers)")
+    parser.add_argument("--retries", type=int, default=1, help="retries per failed job (default: 1)")
+    parser.add_argument("--mode", choices=MODES, default=MODE_COPY,
+                        help="trim mode for entries without one (default: copy)")
+    parser.add_argument("--profile", choices=list(PROFILES) + [AUTO_PROFILE], default=DEFAULT_PROFILE,
+                        help="encoder profile for entries without one (default: balanced)")
+    parser.add_argument("--min-psnr", type=float, default=40.0,
+                        help="quality target of the auto profile in dB (default: 40)")
+    parser.add_argument("--max-kbps", type=float,
+                        help="size target of the auto profile in kbit/s of output")
+    parser.add_argument("--journal", help="journal file (default: <manifest>.journal.jsonl)")
+    parser.add_argument("--restart", action="store_true", help="ignore the journal and run every job")
+    args = parser.parse_args(argv)
+
+    try:
+        jobs = load_manifest(args.manifest, default_mode=args.mode, default_profile=args.profile)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read manifest: {e}", file=sys.stderr)
+        return 2
+
+    journal_path = args.journal or args.manifest + ".journal.jsonl"
+    if args.restart:
+        remove_quietly(journal_path)
+    journal = Journal(journal_path)
+    # Jobs already run side by side, so each encoder only gets the job's share of the cores
+    encode_workers = args.encode_workers or max(1, (os.cpu_count() or 1) // max(1, args.workers or 1))
+    summary = run_batch(jobs, journal, workers=args.workers, retries=args.retries,
+                        encode_workers=encode_workers, progress=print_progress, min_psnr=args.min_psnr,
+                        max_kbps=args.max_kbps)
+    print(summary)
+    return 1 if summary.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
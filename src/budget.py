@@ -0,0 +1,188 @@
+import os
+import re
+import shutil
+import tempfile
+from dataclasses import dataclass
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+MB = 1024 * 1024
+GB = 1024 * MB
+
+# Sources at least this long or this big are handled in large-file mode
+LARGE_FILE_SECONDS = 2 * 3600
+LARGE_FILE_BYTES = 8 * GB
+
+DEFAULT_MEMORY_BUDGET = 1 * GB
+# Free space always left on the disks holding temporary files and caches
+DISK_RESERVE = 512 * MB
+
+# Share of the memory budget the scrub thumbnails may take, and their ceiling
+THUMBNAIL_SHARE = 8
+MAX_THUMBNAIL_BYTES = 64 * MB
+# Scrub thumbnails per file in large-file mode; they also bound the on-disk spill
+LARGE_FILE_THUMBNAILS = 2000
+# Share of the temporary space budget the spilled thumbnails of all files
+# may keep on disk, and their ceiling
+THUMBNAIL_DISK_SHARE = 8
+MAX_THUMBNAIL_DISK_BYTES = 1 * GB
+
+# Share of the memory budget the open decoders may take, and the memory of
+# one decoder per pixel of its frames: reference and threading surfaces
+DECODER_SHARE = 4
+DECODER_BYTES_PER_PIXEL = 24
+# Every open decoder also holds the demuxer's table of all packets of the
+# file, about this much per packet; for a ten-hour MP4 that is over 100 MB
+DEMUXER_BYTES_PER_PACKET = 48
+# Audio packets per second of a typical AAC track
+AUDIO_PACKETS_PER_SECOND = 47
+
+_SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?\s*$", re.IGNORECASE)
+_UNITS = {"": 1, "k": 1024, "m": MB, "g": GB, "t": 1024 * GB}
+
+
+class TempSpaceError(Exception):
+    """Raised when an operation needs more temporary disk space than it may use"""
+
+
+def parse_size(text):
+    """Bytes in a size such as "512M", "1.5GB" or "2048"; raises ValueError"""
+    match = _SIZE_RE.match(str(text))
+    if not match:
+        raise ValueError(f"Not a size: {text!r} (use e.g. 512M or 2G)")
+    return int(float(match.group(1)) * _UNITS[match.group(2).lower()])
+
+
+def format_size(size):
+    for unit, factor in (("GB", GB), ("MB", MB)):
+        if size >= factor:
+            return f"{size / factor:.1f} {unit}"
+    return f"{size} bytes"
+
+
+def current_rss():
+    """Resident memory of this process in bytes, or None where it cannot be read"""
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open("/proc/self/statm", encoding="ascii") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def free_space(path):
+    """Bytes free on the disk holding path, or None if it cannot be checked"""
+    try:
+        return shutil.disk_usage(path).free
+    except OSError:
+        return None
+
+
+def decoder_bytes(info):
+    """Estimated memory of one open decoder of a probed file"""
+    packets_per_second = (info.fps or 30) + (AUDIO_PACKETS_PER_SECOND if info.has_audio else 0)
+    demuxer = int(info.duration * packets_per_second * DEMUXER_BYTES_PER_PACKET)
+    return max(1, info.width * info.height) * DECODER_BYTES_PER_PIXEL + demuxer
+
+
+@dataclass
+class ResourceBudget:
+    """Memory and temporary disk space the app may use
+
+    memory_bytes  target for the resident memory of the process: caches
+                  are sized from it and dropped when the process goes over
+    temp_bytes    temporary files one trim may write in temp_dir; None
+                  for whatever the disk has free beyond DISK_RESERVE
+    temp_dir      where temporary files go; None for the system default
+    large_file    force large-file mode on or off; None decides per source
+
+    Large-file mode keeps per-file caches bounded however long the source
+    is: at most LARGE_FILE_THUMBNAILS scrub thumbnails are made.
+    """
+    memory_bytes: int = DEFAULT_MEMORY_BUDGET
+    temp_bytes: int = None
+    temp_dir: str = None
+    large_file: bool = None
+
+    @classmethod
+    def from_env(cls):
+        """Budget from the VIDEO_TRIMMER_MEMORY, _TEMP_SPACE, _TEMP_DIR and _LARGE_FILE variables"""
+        budget = cls()
+        if os.environ.get("VIDEO_TRIMMER_MEMORY"):
+            budget.memory_bytes = parse_size(os.environ["VIDEO_TRIMMER_MEMORY"])
+        if os.environ.get("VIDEO_TRIMMER_TEMP_SPACE"):
+            budget.temp_bytes = parse_size(os.environ["VIDEO_TRIMMER_TEMP_SPACE"])
+        budget.temp_dir = os.environ.get("VIDEO_TRIMMER_TEMP_DIR") or None
+        if os.environ.get("VIDEO_TRIMMER_LARGE_FILE"):
+            budget.large_file = os.environ["VIDEO_TRIMMER_LARGE_FILE"] not in ("0", "false", "no")
+        return budget
+
+    def is_large(self, info):
+        """True when the probed source is handled in large-file mode"""
+        if self.large_file is not None:
+            return self.large_file
+        try:
+            size = os.path.getsize(info.path)
+        except OSError:
+            size = 0
+        return info.duration >= LARGE_FILE_SECONDS or size >= LARGE_FILE_BYTES
+
+    def thumbnail_bytes(self):
+        """Memory the scrub thumbnails of one file may keep before spilling to disk"""
+        return min(MAX_THUMBNAIL_BYTES, self.memory_bytes // THUMBNAIL_SHARE)
+
+    def thumbnail_disk_bytes(self):
+        """Disk space the spilled scrub thumbnails of all files may keep in the cache"""
+        if self.temp_bytes is None:
+            return MAX_THUMBNAIL_DISK_BYTES
+        return min(MAX_THUMBNAIL_DISK_BYTES, self.temp_bytes // THUMBNAIL_DISK_SHARE)
+
+    def thumbnail_interval(self, info, min_interval=1.0):
+        """Seconds between scrub thumbnails, wider in large-file mode to bound their number"""
+        if not self.is_large(info):
+            return min_interval
+        return max(min_interval, info.duration / LARGE_FILE_THUMBNAILS)
+
+    def decoder_sessions(self, info, limit=4):
+        """Decoders of the source that fit in the budget, at most limit
+
+        Never fewer than two (or limit), so the preview and the player
+        each keep one.
+        """
+        return max(min(2, limit), min(limit, self.memory_bytes // DECODER_SHARE // decoder_bytes(info)))
+
+    def over_memory(self):
+        """True when the process uses more memory than the budget"""
+        rss = current_rss()
+        return rss is not None and rss > self.memory_bytes
+
+    def make_workdir(self, prefix, needed, fallback_dir=None):
+        """Create a directory for about needed bytes of temporary files and return its path
+
+        The directory goes in temp_dir when the files fit in temp_bytes and
+        in the free space there, otherwise in fallback_dir (such as the
+        directory of the output) if that disk has room. Raises
+        TempSpaceError, before anything is written, when neither fits.
+        """
+        if self.temp_bytes is not None and needed > self.temp_bytes:
+            candidates = []
+            reason = f"more than the {format_size(self.temp_bytes)} temporary space budget"
+        else:
+            candidates = [self.temp_dir or tempfile.gettempdir()]
+            reason = "more than is free for temporary files"
+        if fallback_dir:
+            candidates.append(fallback_dir)
+        for parent in candidates:
+            free = free_space(parent)
+            if free is None or free - DISK_RESERVE >= needed:
+                return tempfile.mkdtemp(prefix=prefix, dir=parent)
+        raise TempSpaceError(f"Needs about {format_size(needed)} of temporary files, {reason}")
+
+    def fits_on_disk(self, path, needed):
+        """True when needed bytes can be written next to path without eating into DISK_RESERVE"""
+        free = free_space(os.path.dirname(os.path.abspath(path)))
+        return free is None or free - DISK_RESERVE >= needed
@@ -0,0 +1,31 @@
+import hashlib
+import os
+
+
+def cache_root():
+    """Directory holding all on-disk caches (override with VIDEO_TRIMMER_CACHE)"""
+    root = os.environ.get("VIDEO_TRIMMER_CACHE")
+    if not root:
+        base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME") \
+            or os.path.join(os.path.expanduser("~"), ".cache")
+        root = os.path.join(base, "video-trimmer")
+    return root
+
+
+def cache_dir(kind):
+    """Return (and create) the cache directory for one kind of cached data"""
+    path = os.path.join(cache_root(), kind)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def file_cache_key(path):
+    """Key identifying one version of a file: its absolute path, size and mtime"""
+    st = os.stat(path)
+    raw = f"{os.path.abspath(path)}|{st.st_size}|{st.st_mtime_ns}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def cache_path(kind, path, suffix):
+    """Location of the cached data of the given kind for a source file"""
+    return os.path.join(cache_dir(kind), file_cache_key(path) + suffix)
@@ -0,0 +1,227 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import cv2
+
+from src.instrumentation import METRICS
+from src.media_index import FrameSeeker
+
+
+class DecoderSession:
+    """One OpenCV decoder of a file, used by a single consumer at a time
+
+    With a MediaIndex the decoder is positioned through a FrameSeeker, so
+    reads are frame-exact and stepping forward never seeks; without one it
+    falls back to OpenCV's millisecond seeking.
+    """
+
+    def __init__(self, path, index=None):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            self.cap.release()
+            raise IOError(f"Cannot open video: {path}")
+        self.seeker = None
+        # Time of the frame read last; None before the first read
+        self.last_time = None
+        self.last_used = time.monotonic()
+        if index is not None:
+            self.set_index(index)
+
+    def set_index(self, index):
+        """Start positioning with index, keeping the current position"""
+        if self.seeker is not None:
+            self.seeker.index = index
+            return
+        if self.last_time is not None:
+            # The capture has just returned the frame at last_time
+            position = index.frame_at(self.last_time) + 1
+        else:
+            position = 0
+        self.seeker = FrameSeeker(self.cap, index)
+        self.seeker.next_frame = position
+
+    def cost_to(self, time_sec):
+        """Frames this session has to decode to reach time_sec, or None if it must seek"""
+        if self.seeker is None:
+            return None
+        index = self.seeker.index
+        frame = index.frame_at(time_sec)
+        position = self.seeker.next_frame
+        if frame < position or index.keyframe_at_or_before(frame) > position:
+            return None
+        return frame - position
+
+    def read_at(self, time_sec):
+        """Decode the frame on screen at time_sec; returns (ret, frame, frame_time)"""
+        if self.seeker is not None:
+            ret, frame, frame_time = self.seeker.read_at(time_sec)
+        else:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
+            ret, frame = self.cap.read()
+            frame_time = time_sec
+        if ret:
+            self.last_time = frame_time
+        return ret, frame, frame_time
+
+    def seek(self, time_sec):
+        """Position the decoder so read_next() returns the frame on screen at time_sec"""
+        if self.seeker is not None:
+            self.seeker.seek_frame(self.seeker.index.frame_at(time_sec))
+        else:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
+            # Until the next read, the position counts as just before time_sec
+            self.last_time = max(0.0, time_sec - 1e-6) if time_sec > 0 else None
+
+    def read_next(self):
+        """Decode the next frame in order; returns (ret, frame, frame_time)"""
+        if self.seeker is not None:
+            ret, frame, frame_time = self.seeker.read_next()
+        else:
+            ret, frame = self.cap.read()
+            frame_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if ret:
+            self.last_time = frame_time
+        return ret, frame, frame_time
+
+    def close(self):
+        self.cap.release()
+
+
+class DecoderPool:
+    """Thread-safe pool of reusable decoder sessions of one file
+
+    Every consumer (the preview, the player, a background job) checks a
+    session out with session() and has it to itself until it hands it
+    back, so consumers never move each other's position. Returned
+    sessions stay open for reuse: a request for a time goes to the idle
+    session that reaches it without seeking. If there is none, another
+    decoder is opened, which leaves the idle sessions where their last
+    consumers will probably continue. At most max_sessions decoders are
+    open at once; beyond that the most recently used idle session seeks,
+    or the request waits for one to come back. evict_idle() closes
+    sessions that have not been used for idle_timeout seconds.
+    """
+
+    def __init__(self, path, index=None, max_sessions=4, idle_timeout=30.0):
+        self.path = path
+        self.index = index
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self.reused = 0
+        self._idle = []
+        self._busy = set()
+        # Decoders being opened outside the lock, counted against max_sessions
+        self._opening = 0
+        self._closed = False
+        self._available = threading.Condition()
+
+    def acquire(self, near=None, timeout=None):
+        """Check out a session, preferring one that reaches time near cheaply
+
+        Raises TimeoutError when no session comes free within timeout
+        seconds and IOError once the pool is closed.
+        """
+        with self._available:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while True:
+                if self._closed:
+                    raise IOError(f"Decoder pool is closed: {self.path}")
+                open_sessions = len(self._idle) + len(self._busy) + self._opening
+                session = self._nearest(near)
+                if session is None and self._idle and (near is None or open_sessions >= self.max_sessions):
+                    session = max(self._idle, key=lambda idle: idle.last_used)
+                if session is not None:
+                    self._idle.remove(session)
+                    self._busy.add(session)
+                    self.reused += 1
+                    METRICS.count("decoder_reused")
+                    return session
+                if open_sessions < self.max_sessions:
+                    self._opening += 1
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"All {self.max_sessions} decoders of {self.path} are busy")
+                self._available.wait(remaining)
+        # Opening a decoder is slow; other consumers keep using the pool meanwhile
+        session = None
+        try:
+            session = DecoderSession(self.path, self.index)
+        finally:
+            with self._available:
+                self._opening -= 1
+                if session is not None:
+                    self._busy.add(session)
+                    self.opened += 1
+                    METRICS.count("decoder_opened")
+                else:
+                    self._available.notify()
+        return session
+
+    def _nearest(self, near):
+        """Idle session that reaches time near without seeking, closest first"""
+        if near is None:
+            return None
+        best, best_cost = None, None
+        for session in self._idle:
+            cost = session.cost_to(near)
+            if cost is not None and (best_cost is None or cost < best_cost):
+                best, best_cost = session, cost
+        return best
+
+    def release(self, session):
+        """Hand a session back for reuse"""
+        with self._available:
+            self._busy.discard(session)
+            session.last_used = time.monotonic()
+            if self._closed:
+                session.close()
+            else:
+                if self.index is not None and session.seeker is None:
+                    session.set_index(self.index)
+                self._idle.append(session)
+            self._available.notify()
+
+    @contextmanager
+    def session(self, near=None, timeout=None):
+        """Context manager checking a session out and back in"""
+        session = self.acquire(near, timeout)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def set_index(self, index):
+        """Position sessions with index from now on; busy ones switch when released"""
+        with self._available:
+            self.index = index
+            for session in self._idle:
+                session.set_index(index)
+
+    def evict_idle(self, max_idle=None):
+        """Close sessions unused for max_idle (default idle_timeout) seconds; returns how many were closed"""
+        max_idle = self.idle_timeout if max_idle is None else max_idle
+        now = time.monotonic()
+        with self._available:
+            stale = [session for session in self._idle if now - session.last_used >= max_idle]
+            for session in stale:
+                self._idle.remove(session)
+                session.close()
+        return len(stale)
+
+    @property
+    def open_sessions(self):
+        with self._available:
+            return len(self._idle) + len(self._busy)
+
+    def close(self):
+        """Close the idle sessions now and the busy ones as they are released"""
+        with self._available:
+            self._closed = True
+            for session in self._idle:
+                session.close()
+            self._idle.clear()
+            self._available.notify_all()
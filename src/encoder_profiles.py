@@ -0,0 +1,207 @@
+import dataclasses
+import hashlib
+import json
+import os
+import platform
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+from dataclasses import dataclass
+
+from src.cache import cache_dir
+from src.ffmpeg_utils import format_seconds, get_ffmpeg_binary, probe_media, run_ffmpeg
+
+MATCH_SOURCE = "match-source"
+DEFAULT_PROFILE = "balanced"
+
+# Software encoders able to write the codec of a source again
+SOURCE_ENCODERS = {
+    "h264": "libx264",
+    "hevc": "libx265",
+    "vp8": "libvpx",
+    "vp9": "libvpx-vp9",
+    "mpeg4": "mpeg4",
+}
+SOURCE_AUDIO_ENCODERS = {"aac": "aac", "mp3": "libmp3lame", "opus": "libopus"}
+
+# Encoders that understand x264-style presets and CRF
+_X26X = ("libx264", "libx265")
+
+_PSNR_RE = re.compile(r"PSNR .*?average:([\d.]+|inf)")
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """Encoder settings for every engine that re-encodes video
+
+    crf and video_bitrate are alternatives: a bitrate (in kb/s) wins when
+    both are set. threads 0 leaves the choice to the encoder.
+    """
+    name: str
+    preset: str = "medium"
+    crf: int = None
+    video_bitrate: int = 0
+    audio_bitrate: int = 128
+    encoder: str = "libx264"
+    audio_encoder: str = "aac"
+    pix_fmt: str = "yuv420p"
+    threads: int = 0
+
+    def video_args(self):
+        """ffmpeg output arguments for the video stream"""
+        args = ["-c:v", self.encoder]
+        if self.encoder in _X26X:
+            args += ["-preset", self.preset]
+        if self.video_bitrate:
+            args += ["-b:v", f"{self.video_bitrate}k"]
+        elif self.crf is not None:
+            args += ["-crf", str(self.crf)]
+        if self.pix_fmt:
+            args += ["-pix_fmt", self.pix_fmt]
+        if self.threads:
+            args += ["-threads", str(self.threads)]
+        return args
+
+    def audio_args(self):
+        """ffmpeg output arguments for the audio stream"""
+        return ["-c:a", self.audio_encoder, "-b:a", f"{self.audio_bitrate}k"]
+
+    def for_source(self, info):
+        """Return the concrete settings of this profile for a probed source"""
+        if self.name != MATCH_SOURCE:
+            return self
+        return dataclasses.replace(
+            self,
+            encoder=SOURCE_ENCODERS.get(info.video_codec, "libx264"),
+            audio_encoder=SOURCE_AUDIO_ENCODERS.get(info.audio_codec, "aac"),
+            video_bitrate=info.video_bitrate,
+            audio_bitrate=info.audio_bitrate or self.audio_bitrate,
+            pix_fmt=info.pix_fmt or self.pix_fmt,
+        )
+
+
+PROFILES = {
+    "fastest": EncoderProfile("fastest", preset="ultrafast", crf=23, audio_bitrate=96),
+    # Same settings the re-encode trim always used (libx264 and aac defaults)
+    "balanced": EncoderProfile("balanced", preset="medium", crf=23, audio_bitrate=128),
+    "archive": EncoderProfile("archive", preset="slow", crf=18, audio_bitrate=192),
+    MATCH_SOURCE: EncoderProfile(MATCH_SOURCE, preset="medium", crf=23),
+}
+
+
+def get_profile(profile=None):
+    """Return the EncoderProfile for a profile name; profiles pass through unchanged"""
+    if isinstance(profile, EncoderProfile):
+        return profile
+    try:
+        return PROFILES[profile or DEFAULT_PROFILE]
+    except KeyError:
+        raise ValueError(f"Unknown encoder profile: {profile}") from None
+
+
+def machine_key():
+    """Key identifying this machine and ffmpeg build in the tuning cache"""
+    raw = "|".join([platform.node(), platform.machine(), platform.processor(),
+                    str(os.cpu_count()), get_ffmpeg_binary()])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def source_class(info):
+    """Group sources that encode alike: codec, frame size and frame rate"""
+    return f"{info.video_codec}-{info.width}x{info.height}-{round(info.fps)}"
+
+
+def benchmark_profile(source_path, profile, info, sample_start, sample_seconds):
+    """Encode one sample of the source with a profile and measure it
+
+    Returns the encoding speed in frames per second, the output size per
+    second of media and the PSNR of the sample against the source.
+    """
+    profile = get_profile(profile).for_source(info)
+    frames = max(1, int(sample_seconds * (info.fps or 25)))
+    workdir = tempfile.mkdtemp(prefix="tune_")
+    try:
+        sample = os.path.join(workdir, "sample.mkv")
+        args = ["-ss", format_seconds(sample_start), "-i", source_path,
+                "-map", "0:v:0", "-frames:v", str(frames)] + profile.video_args()
+        if info.has_audio:
+            args += ["-map", "0:a:0", "-t", format_seconds(sample_seconds)] + profile.audio_args()
+        started = time.perf_counter()
+        run_ffmpeg(args + [sample])
+        elapsed = time.perf_counter() - started
+
+        # psnr logs its summary at info level, which run_ffmpeg hides
+        cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-i", sample,
+               "-ss", format_seconds(sample_start), "-i", source_path,
+               "-lavfi", "[0:v][1:v:0]psnr", "-frames:v", str(frames), "-f", "null", "-"]
+        proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        match = _PSNR_RE.search(proc.stderr.decode("utf-8", "replace"))
+        psnr = float(match.group(1)) if match else 0.0
+        return {
+            "fps": round(frames / elapsed, 2) if elapsed > 0 else 0.0,
+            "bytes_per_second": round(os.path.getsize(sample) / sample_seconds),
+            "psnr": min(psnr, 100.0),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _tuning_path():
+    return os.path.join(cache_dir("tuning"), machine_key() + ".json")
+
+
+def load_tuning():
+    """Benchmark results of this machine, keyed by source class then profile"""
+    try:
+        with open(_tuning_path(), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def autotune(source_path, sample_seconds=4.0, refresh=False, report=None):
+    """Benchmark every profile on a sample of source_path, caching the results
+
+    Sources of the same class reuse the results, so a batch of similar
+    files is only benchmarked once per machine.
+    """
+    info = probe_media(source_path)
+    key = source_class(info)
+    tuning = load_tuning()
+    if key in tuning and not refresh:
+        return tuning[key]
+
+    sample_seconds = min(sample_seconds, info.duration)
+    sample_start = max(0.0, (info.duration - sample_seconds) / 2)
+    results = {}
+    for name in PROFILES:
+        if report:
+            report(f"Benchmarking profile {name} on {os.path.basename(source_path)}")
+        results[name] = benchmark_profile(source_path, name, info, sample_start, sample_seconds)
+
+    # Other processes may have tuned other classes in the meantime
+    tuning = load_tuning()
+    tuning[key] = results
+    path = _tuning_path()
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(tuning, f, indent=2)
+    os.replace(tmp_path, path)
+    return results
+
+
+def choose_profile(results, min_psnr=None, max_kbps=None):
+    """Fastest profile whose benchmark meets the quality and size targets
+
+    Falls back to the default profile when none of them does.
+    """
+    candidates = []
+    for name, result in results.items():
+        if min_psnr is not None and result["psnr"] < min_psnr:
+            continue
+        if max_kbps is not None and result["bytes_per_second"] * 8 / 1000 > max_kbps:
+            continue
+        candidates.append((result["fps"], name))
+    return max(candidates)[1] if candidates else DEFAULT_PROFILE
@@ -0,0 +1,265 @@
+import collections
+import dataclasses
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+from dataclasses import dataclass
+
+
+# Seconds between ffmpeg's -progress reports
+PROGRESS_PERIOD = 0.25
+
+
+class FFmpegError(Exception):
+    """Raised when an ffmpeg invocation fails"""
+
+
+class OperationCancelled(Exception):
+    """Raised when a long-running operation is cancelled by its caller"""
+
+
+def get_ffmpeg_binary():
+    """Return the ffmpeg executable bundled with imageio-ffmpeg
+
+    IMAGEIO_FFMPEG_EXE overrides the bundled binary. Without
+    imageio-ffmpeg, the ffmpeg found on PATH is used.
+    """
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return shutil.which("ffmpeg") or "ffmpeg"
+
+
+def run_ffmpeg(args, cwd=None, cancel=None, progress=None):
+    """Run ffmpeg with the given arguments and raise FFmpegError on failure
+
+    cancel is an optional threading.Event; setting it kills ffmpeg and
+    raises OperationCancelled. progress is an optional callable that
+    receives the fields of every -progress report (frame, fps,
+    total_size, out_time_us, ...) as a dict of strings.
+    """
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-y", "-loglevel", "error"]
+    if progress is not None:
+        cmd += ["-progress", "pipe:1", "-stats_period", str(PROGRESS_PERIOD)]
+    cmd += list(args)
+    proc = subprocess.Popen(cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if progress is None:
+        stdout, stderr = communicate(proc, cancel)
+    else:
+        stdout, stderr = b"", _follow_progress(proc, cancel, progress)
+    if proc.returncode != 0:
+        message = stderr.decode("utf-8", "replace").strip().splitlines()
+        raise FFmpegError("\n".join(message[-5:]) or f"ffmpeg exited with code {proc.returncode}")
+    return subprocess.CompletedProcess(cmd, proc.returncode, stdout, stderr)
+
+
+def _follow_progress(proc, cancel, progress, poll_interval=0.2):
+    """Pass ffmpeg's -progress reports to progress until it exits; returns its stderr"""
+    lines = queue.Queue()
+    stderr = []
+
+    def read_stdout():
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    def read_stderr():
+        stderr.append(proc.stderr.read())
+
+    readers = [threading.Thread(target=read_stdout, daemon=True), threading.Thread(target=read_stderr, daemon=True)]
+    for reader in readers:
+        reader.start()
+    fields = {}
+    while True:
+        try:
+            line = lines.get(timeout=poll_interval)
+        except queue.Empty:
+            line = b""
+        if cancel is not None and cancel.is_set():
+            proc.kill()
+            proc.wait()
+            raise OperationCancelled("Operation cancelled")
+        if line is None:
+            break
+        key, sep, value = line.decode("utf-8", "replace").strip().partition("=")
+        if not sep:
+            continue
+        fields[key] = value
+        # Every report ends with progress=continue, or progress=end for the last one
+        if key == "progress":
+            progress(fields)
+            fields = {}
+    proc.wait()
+    for reader in readers:
+        reader.join()
+    return stderr[0] if stderr else b""
+
+
+def start_process(cmd, cancel=None):
+    """Start a process with piped output, killing it as soon as cancel is set
+
+    For callers that stream the output themselves: a read blocked on a
+    killed process returns at once, so they notice the cancel promptly.
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if cancel is not None:
+        def watch():
+            while proc.poll() is None:
+                if cancel.wait(0.1):
+                    proc.kill()
+                    return
+
+        threading.Thread(target=watch, daemon=True).start()
+    return proc
+
+
+def communicate(proc, cancel=None, poll_interval=0.2):
+    """Wait for proc and return its (stdout, stderr), killing it if cancel is set"""
+    if cancel is None:
+        return proc.communicate()
+    while True:
+        try:
+            return proc.communicate(timeout=poll_interval)
+        except subprocess.TimeoutExpired:
+            if cancel.is_set():
+                proc.kill()
+                proc.communicate()
+                raise OperationCancelled("Operation cancelled")
+
+
+@dataclass
+class MediaInfo:
+    """Stream properties of a media file as reported by ffmpeg"""
+    path: str
+    duration: float = 0.0
+    video_codec: str = None
+    pix_fmt: str = None
+    width: int = 0
+    height: int = 0
+    fps: float = 0.0
+    video_bitrate: int = 0
+    audio_codec: str = None
+    audio_rate: int = 0
+    audio_channels: str = None
+    audio_bitrate: int = 0
+
+    @property
+    def has_audio(self):
+        return self.audio_codec is not None
+
+
+_DURATION_RE = re.compile(r"Duration:\s*(\d+):(\d+):(\d+(?:\.\d+)?)")
+_VIDEO_RE = re.compile(r"Stream #\d+:\d+.*?: Video: (\w+)(.*)")
+_AUDIO_RE = re.compile(r"Stream #\d+:\d+.*?: Audio: (\w+)(.*)")
+_SIZE_RE = re.compile(r"\b(\d{2,5})x(\d{2,5})\b")
+_FPS_RE = re.compile(r"([\d.]+) (?:fps|tbr)")
+_RATE_RE = re.compile(r"(\d+) Hz, ([^,]+)")
+_BITRATE_RE = re.compile(r"(\d+) kb/s")
+
+# Probe results by file version, shared by everything that opens the same file
+_PROBE_CACHE_SIZE = 64
+_probe_cache = collections.OrderedDict()
+_probe_lock = threading.Lock()
+
+
+def probe_media(path):
+    """Return the MediaInfo of a media file, probing it only once per file version
+
+    The GUI, the trim engine and the batch runner all ask for the same
+    files, so the result is cached by path, size and modification time and
+    every caller sees the same duration and frame rate.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        raise FFmpegError(f"Cannot read media file: {path}") from None
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _probe_lock:
+        info = _probe_cache.get(key)
+        if info is not None:
+            _probe_cache.move_to_end(key)
+    if info is None:
+        info = _probe(path)
+        with _probe_lock:
+            _probe_cache[key] = info
+            while len(_probe_cache) > _PROBE_CACHE_SIZE:
+                _probe_cache.popitem(last=False)
+    # Callers get their own copy
+    return dataclasses.replace(info, path=path)
+
+
+def clear_probe_cache():
+    """Forget every cached probe result"""
+    with _probe_lock:
+        _probe_cache.clear()
+
+
+def _probe(path):
+    cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-i", path]
+    proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    text = proc.stderr.decode("utf-8", "replace")
+    if "Invalid data found" in text or "No such file" in text:
+        raise FFmpegError(f"Cannot read media file: {path}")
+
+    info = MediaInfo(path=path)
+    match = _DURATION_RE.search(text)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info.duration = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+    # Only the first video and audio streams are used
+    video = _VIDEO_RE.search(text)
+    if video:
+        info.video_codec = video.group(1)
+        details = video.group(2)
+        # Strip parenthesised codec tags so the pixel format is the first field
+        fields = [f.strip() for f in re.sub(r"\([^()]*\)", "", details).split(",")]
+        if len(fields) > 1 and fields[1]:
+            info.pix_fmt = fields[1].split()[0]
+        size = _SIZE_RE.search(details)
+        if size:
+            info.width, info.height = int(size.group(1)), int(size.group(2))
+        fps = _FPS_RE.search(details)
+        if fps:
+            info.fps = float(fps.group(1))
+        bitrate = _BITRATE_RE.search(details)
+        if bitrate:
+            info.video_bitrate = int(bitrate.group(1))
+
+    audio = _AUDIO_RE.search(text)
+    if audio:
+        info.audio_codec = audio.group(1)
+        rate = _RATE_RE.search(audio.group(2))
+        if rate:
+            info.audio_rate = int(rate.group(1))
+            info.audio_channels = rate.group(2).strip()
+        bitrate = _BITRATE_RE.search(audio.group(2))
+        if bitrate:
+            info.audio_bitrate = int(bitrate.group(1))
+    return info
+
+
+def format_seconds(value):
+    """Format seconds for an ffmpeg command line without float noise"""
+    return f"{max(0.0, value):.6f}"
+
+
+def audio_concat_graph(input_index, spans):
+    """Filtergraph cutting spans out of an input's audio and joining them into [a]"""
+    parts = [f"[{input_index}:a:0]atrim=start={format_seconds(start)}:end={format_seconds(end)},"
+             f"asetpts=PTS-STARTPTS[a{n}]" for n, (start, end) in enumerate(spans)]
+    labels = "".join(f"[a{n}]" for n in range(len(spans)))
+    return ";".join(parts + [f"{labels}concat=n={len(spans)}:v=0:a=1[a]"])
+
+
+def remove_quietly(path):
+    """Delete a file if it exists, ignoring errors"""
+    try:
+        if path and os.path.exists(path):
+            os.remove(path)
+    except OSError:
+        pass
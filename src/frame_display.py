@@ -0,0 +1,128 @@
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageTk
+
+from src.instrumentation import METRICS
+from src.playback import fit_size
+
+
+class FrameDisplay:
+    """Draws frames into one persistent PhotoImage and canvas item
+
+    The geometry is computed once per source and canvas size. Frames are
+    scaled and colour-converted straight into preallocated RGBA buffers,
+    which PIL wraps without copying, and the PhotoImage is updated in place
+    with paste(), so showing a frame creates no new Python objects. The
+    cost of every frame shown is recorded for the playback statistics and
+    as the "display" stage of METRICS. set_overlay() writes text over the
+    top left corner of the frame.
+    """
+
+    def __init__(self, canvas, canvas_size=(640, 360)):
+        self.canvas = canvas
+        self.canvas_size = canvas_size
+        self.source_size = None
+        self.size = canvas_size
+        self.photo = None
+        self._item = None
+        self._scaled = None
+        self._rgba = None
+        self._image = None
+        self._overlay = None
+        # Wrappers of the frame buffers handed to show_rgba, keyed by id
+        self._views = {}
+        self.reset_stats()
+
+    def configure(self, source_size, canvas_size=None):
+        """Set up the buffers and canvas item for frames of source_size"""
+        if canvas_size:
+            self.canvas_size = canvas_size
+        if source_size == self.source_size and self.photo is not None and not canvas_size:
+            return
+        self.source_size = source_size
+        self.size = fit_size(*source_size, *self.canvas_size)
+        width, height = self.size
+        self._scaled = np.empty((height, width, 3), dtype=np.uint8)
+        self._rgba = np.empty((height, width, 4), dtype=np.uint8)
+        self._image = self.wrap(self._rgba)
+        self._views = {}
+        self.photo = ImageTk.PhotoImage("RGBA", self.size)
+
+        x = (self.canvas_size[0] - width) // 2
+        y = (self.canvas_size[1] - height) // 2
+        if self._item is None:
+            self._item = self.canvas.create_image(x, y, anchor="nw", image=self.photo)
+        else:
+            self.canvas.coords(self._item, x, y)
+            self.canvas.itemconfigure(self._item, image=self.photo)
+
+    @staticmethod
+    def wrap(rgba):
+        """PIL image sharing the memory of an RGBA array"""
+        height, width = rgba.shape[:2]
+        return Image.frombuffer("RGBA", (width, height), rgba, "raw", "RGBA", 0, 1)
+
+    def show_bgr(self, frame):
+        """Show a decoded BGR frame of the source size"""
+        started = time.perf_counter()
+        cv2.resize(frame, self.size, dst=self._scaled)
+        cv2.cvtColor(self._scaled, cv2.COLOR_BGR2RGBA, dst=self._rgba)
+        self.photo.paste(self._image)
+        self._record(started)
+
+    def show_thumbnail(self, thumbnail):
+        """Show a small RGB thumbnail scaled up to the display size"""
+        started = time.perf_counter()
+        cv2.resize(thumbnail, self.size, dst=self._scaled)
+        cv2.cvtColor(self._scaled, cv2.COLOR_RGB2RGBA, dst=self._rgba)
+        self.photo.paste(self._image)
+        self._record(started)
+
+    def show_rgba(self, rgba):
+        """Show an RGBA frame that already has the display size
+
+        The buffer is wrapped once and the wrapper reused, so buffers that
+        are filled over and over, like decode-ahead slots, are shown
+        without any conversion or copy on the Python side.
+        """
+        started = time.perf_counter()
+        view = self._views.get(id(rgba))
+        if view is None or view[0] is not rgba:
+            view = self._views[id(rgba)] = (rgba, self.wrap(rgba))
+        self.photo.paste(view[1])
+        self._record(started)
+
+    def clear(self):
+        """Forget the wrapped frame buffers, e.g. when a player is discarded"""
+        self._views = {}
+
+    def set_overlay(self, lines):
+        """Show lines of text over the frame; an empty list removes the overlay"""
+        text = "\n".join(lines)
+        if self._overlay is None:
+            if not text:
+                return
+            self._overlay = self.canvas.create_text(6, 6, anchor="nw", fill="yellow", font=("Courier", 9))
+        self.canvas.itemconfigure(self._overlay, text=text)
+        self.canvas.tag_raise(self._overlay)
+
+    def _record(self, started):
+        elapsed = time.perf_counter() - started
+        METRICS.record("display", elapsed)
+        self.frames += 1
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+
+    def reset_stats(self):
+        self.frames = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def mean_ms(self):
+        return self.total_time / self.frames * 1000 if self.frames else 0.0
+
+    def stats_text(self):
+        return f"display {self.mean_ms:.2f} ms/frame avg, {self.max_time * 1000:.2f} ms max"
@@ -0,0 +1,217 @@
+import collections
+import cProfile
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Samples kept per stage for the percentiles
+WINDOW = 512
+
+
+class _Stage:
+    __slots__ = ("count", "total", "max", "recent")
+
+    def __init__(self, window):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+
+class Metrics:
+    """Stage timers and event counters of one session
+
+    record() adds one timing and count() bumps a counter. Both only take a
+    lock for a few dictionary operations, so they are cheap enough to
+    leave on in the playback loop. Totals cover everything since the last
+    reset(); percentiles cover the last WINDOW samples of each stage.
+    """
+
+    def __init__(self, window=WINDOW):
+        self.window = window
+        self._stages = {}
+        self._counters = collections.Counter()
+        self._lock = threading.Lock()
+        self.started = time.time()
+
+    def record(self, stage, seconds):
+        with self._lock:
+            entry = self._stages.get(stage)
+            if entry is None:
+                entry = self._stages[stage] = _Stage(self.window)
+            entry.count += 1
+            entry.total += seconds
+            entry.max = max(entry.max, seconds)
+            entry.recent.append(seconds)
+
+    @contextmanager
+    def timed(self, stage):
+        """Context manager recording how long its body takes as one sample of stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started)
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self.started = time.time()
+
+    def stage(self, name):
+        """Statistics of one stage in milliseconds, or None if it has no samples"""
+        with self._lock:
+            entry = self._stages.get(name)
+            if entry is None or not entry.count:
+                return None
+            count, total, longest, recent = entry.count, entry.total, entry.max, np.asarray(entry.recent)
+        p50, p95 = np.percentile(recent, [50, 95]) * 1000
+        return {"count": count, "total_s": round(total, 4), "mean_ms": round(total / count * 1000, 3),
+                "p50_ms": round(float(p50), 3), "p95_ms": round(float(p95), 3), "max_ms": round(longest * 1000, 3)}
+
+    def snapshot(self):
+        """Every stage and counter, as a JSON-ready dict"""
+        with self._lock:
+            names = list(self._stages)
+            counters = dict(self._counters)
+        return {
+            "time": round(time.time(), 3),
+            "since": round(self.started, 3),
+            "stages": {name: self.stage(name) for name in sorted(names)},
+            "counters": counters,
+        }
+
+    def overlay_lines(self, stages):
+        """Short lines describing the given stages and all counters, for an on-screen overlay"""
+        lines = []
+        for name in stages:
+            stats = self.stage(name)
+            if stats:
+                lines.append(f"{name:<10} {stats['mean_ms']:7.2f} avg {stats['p95_ms']:7.2f} p95 ms")
+        with self._lock:
+            counters = sorted(self._counters.items())
+        if counters:
+            lines.append("  ".join(f"{name} {value}" for name, value in counters))
+        return lines
+
+
+class MetricsLog:
+    """Appends snapshots of metrics to a file as JSON lines every interval seconds
+
+    Every line is one snapshot with an "event" field: "periodic" while
+    running, or whatever write() was called with, such as "trim" or
+    "exit". The file can be followed with tail -f or loaded with pandas.
+    """
+
+    def __init__(self, metrics, path, interval=5.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.write("periodic")
+
+    def write(self, event, **extra):
+        record = {"event": event, **extra, **self.metrics.snapshot()}
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def stop(self):
+        """Stop the periodic snapshots and write a final one"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.write("exit")
+
+
+class SamplingProfiler:
+    """Samples the stack of every thread and writes them in collapsed-stack format
+
+    Unlike cProfile, which only sees the thread that started it, this
+    shows where the decode, audio and trim threads spend their time too.
+    Each output line is a semicolon-separated stack, outermost frame
+    first, followed by the number of samples; flamegraph.pl, speedscope
+    and similar tools read it directly.
+    """
+
+    def __init__(self, path, interval=0.005):
+        self.path = path
+        self.interval = interval
+        self._samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self._samples[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        with open(self.path, "w", encoding="utf-8") as f:
+            for stack, count in self._samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class _CProfiler:
+    def __init__(self, path):
+        self.path = path
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+        self._profile.dump_stats(self.path)
+
+
+def start_profiler(path):
+    """Profile the session into path and return the profiler; call stop() to write it
+
+    A path ending in .prof gets a cProfile of the calling thread, to be
+    read with pstats or snakeviz. Any other path gets a sampling profile
+    of all threads in collapsed-stack format.
+    """
+    profiler = _CProfiler(path) if path.endswith(".prof") else SamplingProfiler(path)
+    profiler.start()
+    return profiler
+
+
+# Shared by the player, the preview and the trim engines of this process
+METRICS = Metrics()
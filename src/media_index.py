@@ -0,0 +1,313 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+from array import array
+from fractions import Fraction
+
+import cv2
+import numpy as np
+
+from src.cache import cache_path
+from src.ffmpeg_utils import FFmpegError, OperationCancelled, get_ffmpeg_binary, start_process
+
+# Bump when the on-disk layout changes so stale caches are rebuilt
+INDEX_VERSION = 4
+
+# Columns stored in the cache, one .npy file each
+COLUMNS = ("pts", "dts", "keyframe", "size", "offset", "frame_times")
+
+
+def index_cache_path(path):
+    """Cache directory of the index of a source file"""
+    return cache_path("index", path, "")
+
+
+class MediaIndex:
+    """Per-file index of the first video stream's frames, in presentation order
+
+    pts          presentation timestamp of every frame, in time_base units
+    dts          decoding timestamp of the frame's packet, in time_base units
+    keyframe     True where the frame starts a GOP
+    size         compressed packet size in bytes
+    offset       byte offset of the packet within the video stream payload
+                 (cumulative in decode order), used to estimate output sizes
+    frame_times  pts in seconds
+
+    A cached index is memory-mapped rather than read, so the per-frame
+    columns of a ten-hour recording cost page cache, not process memory,
+    and only the pages around the frames looked up are ever read.
+    """
+
+    def __init__(self, time_base, pts, dts, keyframe, size, offset, frame_times=None, frame_duration=None):
+        self.time_base = Fraction(time_base)
+        self.pts = pts
+        self.dts = dts
+        self.keyframe = keyframe
+        self.size = size
+        self.offset = offset
+        if frame_times is None:
+            frame_times = pts.astype(np.float64) * float(self.time_base)
+        self.frame_times = frame_times
+        self.keyframe_indices = np.flatnonzero(keyframe)
+        self.keyframe_times = self.frame_times[self.keyframe_indices]
+        if frame_duration is None:
+            frame_duration = _typical_spacing(self.frame_times)
+        # Typical spacing between frames in seconds
+        self.frame_duration = frame_duration
+
+    @classmethod
+    def load_or_build(cls, path, cancel=None):
+        """Return the index for path, building and caching it on first use
+
+        cancel is an optional threading.Event; setting it stops a build in
+        progress with OperationCancelled.
+        """
+        cached = index_cache_path(path)
+        if os.path.isdir(cached):
+            try:
+                return cls.load(cached)
+            except Exception:
+                # Stale or damaged; make room for the new one
+                shutil.rmtree(cached, ignore_errors=True)
+        index = cls.build(path, cancel)
+        try:
+            index.save(cached)
+        except OSError:
+            pass
+        return index
+
+    @classmethod
+    def build(cls, path, cancel=None):
+        """Index path in one demux pass, without decoding any frame
+
+        Uses ffmpeg's framecrc muxer, which prints one line per packet with
+        an "F=" flags column whenever the flags are not just "keyframe".
+        The lines are parsed as they arrive into packed arrays, so building
+        needs a few dozen bytes per frame however long the file is.
+        """
+        cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error",
+               "-i", path, "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"]
+        proc = start_process(cmd, cancel)
+        stderr = []
+        reader = threading.Thread(target=lambda: stderr.append(proc.stderr.read()), daemon=True)
+        reader.start()
+
+        time_base = Fraction(1, 1000)
+        pts, dts, size = array("q"), array("q"), array("q")
+        keyframe = array("b")
+        try:
+            for line in proc.stdout:
+                if line.startswith(b"#tb"):
+                    time_base = Fraction(line.split(b":", 1)[1].strip().decode("ascii"))
+                    continue
+                if not line.strip() or line.startswith(b"#"):
+                    continue
+                cols = line.split(b",")
+                dts.append(int(cols[1]))
+                try:
+                    pts.append(int(cols[2]))
+                except ValueError:
+                    # Packets without a pts fall back to their dts
+                    pts.append(dts[-1])
+                size.append(int(cols[4]))
+                # Trailing columns are F=0x.. packet flags, omitted when
+                # only the keyframe flag is set, and S=.. side data
+                flags = next((col.strip()[2:] for col in cols[6:] if col.strip().startswith(b"F=")), None)
+                keyframe.append(flags is None or bool(int(flags, 16) & 1))
+        finally:
+            if proc.poll() is None and cancel is not None and cancel.is_set():
+                proc.kill()
+            proc.wait()
+            reader.join()
+        if cancel is not None and cancel.is_set():
+            raise OperationCancelled(f"Indexing of {path} cancelled")
+        if proc.returncode != 0:
+            message = stderr[0].decode("utf-8", "replace").strip() if stderr else ""
+            raise FFmpegError(message or "Indexing failed")
+        if not pts:
+            raise FFmpegError(f"No video frames found in {path}")
+
+        # The arrays are wrapped, not copied
+        pts = np.frombuffer(pts, dtype=np.int64)
+        size = np.frombuffer(size, dtype=np.int64)
+        offset = np.concatenate(([0], np.cumsum(size)[:-1]))
+        # framecrc lists packets in decode order; the index is in presentation order
+        order = np.argsort(pts, kind="stable")
+        return cls(time_base,
+                   pts[order],
+                   np.frombuffer(dts, dtype=np.int64)[order],
+                   np.frombuffer(keyframe, dtype=np.int8)[order].astype(bool),
+                   size[order],
+                   offset[order])
+
+    @classmethod
+    def load(cls, cached):
+        with open(os.path.join(cached, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError("Index version mismatch")
+        columns = {name: np.load(os.path.join(cached, name + ".npy"), mmap_mode="r") for name in COLUMNS}
+        return cls(Fraction(meta["time_base"]), frame_duration=meta["frame_duration"], **columns)
+
+    def save(self, cached):
+        """Write the index to the directory cached, replacing it only once complete"""
+        parent, name = os.path.split(cached)
+        tmp = tempfile.mkdtemp(prefix=name + ".", suffix=".tmp", dir=parent)
+        try:
+            for column in COLUMNS:
+                np.save(os.path.join(tmp, column + ".npy"), getattr(self, column))
+            meta = {"version": INDEX_VERSION, "time_base": str(self.time_base),
+                    "frame_duration": self.frame_duration}
+            with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+            os.replace(tmp, cached)
+        except OSError:
+            # Another process may have saved the same index first
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not os.path.isdir(cached):
+                raise
+
+    @property
+    def frame_count(self):
+        return len(self.pts)
+
+    def constant_frame_rate(self):
+        """Exact frame rate as a Fraction when every frame lasts as long, otherwise None"""
+        gaps = np.diff(self.pts)
+        if not len(gaps) or gaps[0] <= 0 or gaps.min() != gaps.max():
+            return None
+        return 1 / (int(gaps[0]) * self.time_base)
+
+    def time_of(self, frame):
+        """Presentation time in seconds of a frame index"""
+        return float(self.frame_times[min(max(frame, 0), self.frame_count - 1)])
+
+    def frame_at(self, time_sec):
+        """Index of the frame on screen at time_sec"""
+        frame = int(np.searchsorted(self.frame_times, time_sec + 1e-6, side="right")) - 1
+        return min(max(frame, 0), self.frame_count - 1)
+
+    def first_frame_from(self, time_sec):
+        """Index of the first frame presented at or after time_sec"""
+        return int(np.searchsorted(self.frame_times, time_sec - 1e-6, side="left"))
+
+    def count_frames(self, start_sec, end_sec):
+        """Number of frames presented in [start_sec, end_sec)"""
+        return max(0, self.first_frame_from(end_sec) - self.first_frame_from(start_sec))
+
+    def keyframe_at_or_before(self, frame):
+        """Frame index of the keyframe that starts frame's GOP"""
+        pos = int(np.searchsorted(self.keyframe_indices, frame, side="right")) - 1
+        return int(self.keyframe_indices[max(pos, 0)])
+
+    def decode_time_of(self, frame):
+        """Decoding timestamp in seconds of a frame index"""
+        return float(self.dts[min(max(frame, 0), self.frame_count - 1)] * self.time_base)
+
+    def keyframe_at_or_after(self, frame):
+        """Frame index of the first keyframe at or after frame, or frame_count if none"""
+        pos = int(np.searchsorted(self.keyframe_indices, frame, side="left"))
+        return int(self.keyframe_indices[pos]) if pos < len(self.keyframe_indices) else self.frame_count
+
+    def byte_size(self, start_sec, end_sec):
+        """Compressed video bytes of the frames in [start_sec, end_sec)"""
+        first, last = self.first_frame_from(start_sec), self.first_frame_from(end_sec)
+        return int(self.size[first:last].sum())
+
+
+def _typical_spacing(frame_times):
+    """Median gap between consecutive frame times, ignoring repeated timestamps"""
+    if len(frame_times) < 2:
+        return 1 / 30
+    gaps = np.diff(frame_times)
+    gaps = gaps[gaps > 0]
+    return float(np.median(gaps)) if len(gaps) else 1 / 30
+
+
+class FrameSeeker:
+    """Positions an OpenCV capture using a MediaIndex
+
+    Targets a little ahead of the current position are reached by grabbing
+    forward, so the demuxer is only asked to seek when jumping backwards or
+    past the next keyframe, and then always straight onto a keyframe.
+
+    OpenCV turns seek positions into frame numbers using the average frame
+    rate, so on variable frame rate sources it lands near, not on, the
+    keyframe asked for. The frame it lands on is therefore looked up by its
+    timestamp, and the seeker steps forward from there.
+    """
+
+    def __init__(self, cap, index):
+        self.cap = cap
+        self.index = index
+        # Index of the frame the next read() will return
+        self.next_frame = 0
+        # True when next_frame has been grabbed by a seek but not retrieved yet
+        self._grabbed = False
+
+    def seek_frame(self, frame):
+        """Position the capture so the next read() returns the given frame index"""
+        keyframe = self.index.keyframe_at_or_before(frame)
+        # Seek only when going backwards or when a keyframe is closer than the current position
+        if frame < self.next_frame or keyframe > self.next_frame:
+            if not self._seek(keyframe, frame):
+                return False
+        while self.next_frame < frame:
+            if self._grabbed:
+                self._grabbed = False
+            elif not self.cap.grab():
+                return False
+            self.next_frame += 1
+        return True
+
+    def _seek(self, keyframe, frame):
+        """Seek to keyframe by time and find out which frame, at or before frame, the capture is on"""
+        origin = self.index.time_of(0)
+        while True:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, (self.index.time_of(keyframe) - origin) * 1000)
+            self._grabbed = False
+            if not self.cap.grab():
+                return False
+            landed = self.index.frame_at(origin + self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+            if landed <= frame:
+                self.next_frame = landed
+                self._grabbed = True
+                return True
+            if keyframe == 0:
+                # Past the target even from the start; decode from the first frame
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                self.next_frame = 0
+                return True
+            keyframe = self.index.keyframe_at_or_before(keyframe - 1)
+
+    def _read(self):
+        if self._grabbed:
+            self._grabbed = False
+            return self.cap.retrieve()
+        return self.cap.read()
+
+    def read_frame(self, frame):
+        """Decode the given frame index; returns (ok, image)"""
+        frame = min(max(frame, 0), self.index.frame_count - 1)
+        if not self.seek_frame(frame):
+            return False, None
+        ret, image = self._read()
+        if ret:
+            self.next_frame = frame + 1
+        return ret, image
+
+    def read_at(self, time_sec):
+        """Decode the frame on screen at time_sec; returns (ok, image, frame_time)"""
+        frame = self.index.frame_at(time_sec)
+        ret, image = self.read_frame(frame)
+        return ret, image, self.index.time_of(frame)
+
+    def read_next(self):
+        """Decode the next frame in order; returns (ok, image, frame_time)"""
+        frame = self.next_frame
+        ret, image = self._read()
+        if ret:
+            self.next_frame += 1
+        return ret, image, self.index.time_of(frame)
@@ -0,0 +1,135 @@
+import os
+import threading
+
+from src.budget import ResourceBudget
+from src.decoder_pool import DecoderPool
+from src.ffmpeg_utils import probe_media
+from src.instrumentation import METRICS
+from src.media_index import MediaIndex
+from src.trim_engine import TrimError, trim_segments
+
+
+class MediaSource:
+    """One open media file shared by preview, audio and trimming
+
+    The file is probed once when it is opened; duration, frame rate and
+    frame size all come from that probe and, once it is loaded, from the
+    frame index, so every component works with the same timing. Frames
+    are decoded through a DecoderPool: the preview and the player each
+    check out their own decoder session, so they never disturb each
+    other's position, and sessions are reused until release_idle() closes
+    the ones unused for idle_timeout seconds. At most max_decoders are
+    open at once, fewer when the frames are too big for the memory of
+    budget. Trims run ffmpeg on the file directly; several can run at
+    once as long as they write different files. large_file tells whether
+    the budget puts the file in large-file mode.
+
+    With use_proxy() the preview decodes a low-res proxy of the file
+    instead; the proxy has the same frames at the same times, so callers
+    do not notice the switch, and trims still cut the original.
+    """
+
+    def __init__(self, path, idle_timeout=30.0, max_decoders=4, budget=None):
+        self.path = path
+        self.idle_timeout = idle_timeout
+        self.budget = budget or ResourceBudget.from_env()
+        self.info = probe_media(path)
+        self.large_file = self.budget.is_large(self.info)
+        self.max_decoders = self.budget.decoder_sessions(self.info, max_decoders)
+        self.index = None
+        self.proxy_path = None
+        self.proxy_index = None
+        self.frame_size = (self.info.width, self.info.height)
+        self.decoders = DecoderPool(path, None, self.max_decoders, idle_timeout)
+        self._closed = False
+        self._lock = threading.Lock()
+        self._trim_outputs = set()
+
+    @property
+    def duration(self):
+        return self.info.duration
+
+    @property
+    def has_audio(self):
+        return self.info.has_audio
+
+    @property
+    def frame_duration(self):
+        if self.index is not None:
+            return self.index.frame_duration
+        return 1 / self.info.fps if self.info.fps else 1 / 30
+
+    @property
+    def preview_path(self):
+        """File the preview decodes: the proxy when one is in use"""
+        return self.proxy_path or self.path
+
+    @property
+    def preview_index(self):
+        """Frame index of preview_path"""
+        return self.proxy_index if self.proxy_path else self.index
+
+    def load_index(self, cancel=None):
+        """Load or build the frame index; safe to call from a worker thread"""
+        return MediaIndex.load_or_build(self.path, cancel)
+
+    def set_index(self, index):
+        """Start using a loaded index for frame-accurate seeking"""
+        with self._lock:
+            self.index = index
+            if not self.proxy_path:
+                self.decoders.set_index(index)
+
+    def use_proxy(self, proxy_path, proxy_index):
+        """Decode previews from a proxy of the file from now on; None goes back to the file"""
+        with self._lock:
+            if self._closed:
+                return
+            self.proxy_path = proxy_path
+            self.proxy_index = proxy_index
+            # Sessions still checked out of the old pool close when they are handed back
+            self.decoders.close()
+            self.decoders = DecoderPool(self.preview_path, self.preview_index, self.max_decoders,
+                                        self.idle_timeout)
+
+    def read_at(self, time_sec):
+        """Decode the frame on screen at time_sec; returns (ret, frame, frame_time)"""
+        with self._lock:
+            if self._closed:
+                raise IOError(f"Media source is closed: {self.path}")
+            decoders = self.decoders
+        with METRICS.timed("seek"), decoders.session(near=time_sec) as session:
+            ret, frame, frame_time = session.read_at(time_sec)
+        # Decoded frames may be rotated or cropped compared to the probe
+        if ret and decoders.path == self.path:
+            self.frame_size = (frame.shape[1], frame.shape[0])
+        return ret, frame, frame_time
+
+    def release_idle(self, max_idle=None):
+        """Close the decoders that have not been used for max_idle (default idle_timeout) seconds"""
+        return self.decoders.evict_idle(max_idle) > 0
+
+    def trim(self, segments, output_path, mode, profile=None, workers=None, progress=None, cancel=None):
+        """Trim the kept segments, reusing the probe and the index when loaded
+
+        Trims of the source may run at the same time; a second trim into
+        an output that is still being written raises TrimError. progress
+        and cancel are passed on to trim_segments().
+        """
+        output = os.path.abspath(output_path)
+        with self._lock:
+            if output in self._trim_outputs:
+                raise TrimError(f"{output_path} is already being written by another trim")
+            self._trim_outputs.add(output)
+        try:
+            return trim_segments(self.path, segments, output_path, mode=mode, index=self.index,
+                                 workers=workers, profile=profile, progress=progress, cancel=cancel,
+                                 budget=self.budget)
+        finally:
+            with self._lock:
+                self._trim_outputs.discard(output)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self.decoders.close()
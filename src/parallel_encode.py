@@ -0,0 +1,98 @@
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+from src.budget import ResourceBudget
+from src.encoder_profiles import get_profile
+from src.ffmpeg_utils import audio_concat_graph, format_seconds
+from src.progress import ProgressTracker
+
+# Chunks shorter than this cost more in seeking and joining than they gain
+MIN_CHUNK_SECONDS = 2.0
+
+
+def plan_chunks(index, spans, workers, chunk_seconds=None):
+    """Split each (start, end) span at keyframes into (start time, frame count) chunks
+
+    Without an explicit chunk_seconds the total duration is divided into
+    about two chunks per worker so that uneven chunks still balance out.
+    """
+    total = sum(end - start for start, end in spans)
+    if not chunk_seconds:
+        chunk_seconds = max(MIN_CHUNK_SECONDS, total / (workers * 2))
+
+    chunks = []
+    for span_start, span_end in spans:
+        first = index.first_frame_from(span_start)
+        last = index.first_frame_from(span_end)
+        chunk_start = first
+        for keyframe in index.keyframe_indices:
+            keyframe = int(keyframe)
+            if keyframe <= chunk_start:
+                continue
+            if keyframe >= last:
+                break
+            if index.time_of(keyframe) - index.time_of(chunk_start) >= chunk_seconds:
+                chunks.append((index.time_of(chunk_start), keyframe - chunk_start))
+                chunk_start = keyframe
+        if last > chunk_start:
+            chunks.append((index.time_of(chunk_start), last - chunk_start))
+    return chunks
+
+
+def encode_parallel(source_path, spans, output_path, index, has_audio, workers=None,
+                    chunk_seconds=None, video_args=None, audio_args=None, tracker=None, budget=None):
+    """Re-encode the frames of spans into output_path using several encoders at once
+
+    Every chunk starts on a keyframe (apart from the very first frame of a
+    span), so each ffmpeg process seeks straight to its chunk and encodes an
+    exact number of frames with identical settings. The chunks are joined
+    without re-encoding and the audio of all spans is encoded in one go
+    while joining, which keeps it continuous and in sync. tracker runs the
+    ffmpeg processes, adding up the progress of the chunks encoding at
+    once; cancelling it stops all of them.
+
+    The chunks are expected to take about as much space as the spans do
+    in the source. They are written to the temporary space of budget, or
+    next to the output when it is too small; when neither has room,
+    TempSpaceError is raised before anything is encoded.
+    """
+    workers = workers or os.cpu_count() or 1
+    video_args = video_args or get_profile().video_args()
+    audio_args = audio_args or get_profile().audio_args()
+    chunks = plan_chunks(index, spans, workers, chunk_seconds)
+    tracker = tracker or ProgressTracker()
+    tracker.total_frames = sum(frames for _, frames in chunks)
+    # Split the cores between the encoders running at the same time
+    threads = max(1, (os.cpu_count() or 1) // max(1, min(workers, len(chunks))))
+    margin = index.frame_duration / 2
+
+    needed = sum(index.byte_size(start, end) for start, end in spans)
+    budget = budget or ResourceBudget()
+    workdir = budget.make_workdir("encode_", needed, os.path.dirname(os.path.abspath(output_path)))
+    try:
+        def encode(number):
+            chunk_start, frames = chunks[number]
+            part = os.path.join(workdir, f"chunk{number:05d}.mkv")
+            tracker.run_ffmpeg(["-ss", format_seconds(chunk_start - margin), "-i", source_path,
+                                "-map", "0:v:0", "-an", "-frames:v", str(frames)]
+                               + video_args + ["-threads", str(threads), "-bsf:v", "dump_extra=freq=keyframe", part])
+            return part
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(encode, range(len(chunks))))
+
+        list_path = os.path.join(workdir, "chunks.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for part in parts:
+                f.write(f"file '{os.path.basename(part)}'\n")
+
+        args = ["-f", "concat", "-safe", "0", "-i", list_path]
+        if has_audio:
+            args += ["-i", os.path.abspath(source_path), "-filter_complex", audio_concat_graph(1, spans),
+                     "-map", "0:v", "-map", "[a]"] + audio_args
+        args += ["-c:v", "copy", os.path.abspath(output_path)]
+        tracker.run_ffmpeg(args, cwd=workdir, counts=False, stage="join")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return len(chunks)
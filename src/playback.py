@@ -0,0 +1,156 @@
+import collections
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from src.decoder_pool import DecoderSession
+from src.instrumentation import METRICS
+
+
+def fit_size(width, height, canvas_width, canvas_height):
+    """Size of a width x height frame scaled to fit the canvas"""
+    scale = min(canvas_width / width, canvas_height / height)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+class PlaybackClock:
+    """Media clock for playback, following the audio when it is playing
+
+    The audio preview knows which media time is audible, which is the most
+    accurate position we have; without audio a monotonic clock is used.
+    """
+
+    def __init__(self, start_time, audio=None):
+        self.start_time = start_time
+        self.audio = audio
+        self.started = time.monotonic()
+
+    def now(self):
+        if self.audio is not None:
+            position = self.audio.position()
+            if position is not None:
+                return position
+        return self.start_time + (time.monotonic() - self.started)
+
+
+class DecodeAheadPlayer:
+    """Decodes, converts and scales frames ahead of playback on a worker thread
+
+    Frames are written into a fixed ring of preallocated RGBA arrays of the
+    display size, ready to be shown without further conversion. The Tk
+    thread takes the frame that is due for the current clock time and
+    hands its slot back with release() once it has been copied; frames
+    the clock overtook before they were shown are skipped and counted as
+    dropped. With a DecoderPool in decoders the player checks a
+    session out of it for as long as it runs, instead of opening its own.
+    Decode and conversion times and the dropped, late and shown frames
+    are recorded in METRICS.
+    """
+
+    def __init__(self, path, index, start_time, display_size, capacity=8, decoders=None):
+        self.path = path
+        self.index = index
+        self.decoders = decoders
+        self.start_time = start_time
+        self.display_size = display_size
+        width, height = display_size
+        self.slots = [np.empty((height, width, 4), dtype=np.uint8) for _ in range(capacity)]
+        self._scaled = np.empty((height, width, 3), dtype=np.uint8)
+        self._free = queue.Queue()
+        for slot in range(capacity):
+            self._free.put(slot)
+        self._ready = collections.deque()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.finished = False
+        self.dropped = 0
+        self.late = 0
+        self.shown = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._produce, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        # Unblock the producer if it is waiting for a free slot
+        self._free.put(None)
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _produce(self):
+        try:
+            if self.decoders is not None:
+                session = self.decoders.acquire(near=self.start_time)
+            else:
+                session = DecoderSession(self.path, self.index)
+        except Exception:
+            self.finished = True
+            raise
+        try:
+            session.seek(self.start_time)
+            while not self._stop.is_set():
+                slot = self._free.get()
+                if slot is None or self._stop.is_set():
+                    break
+                started = time.perf_counter()
+                ret, image, frame_time = session.read_next()
+                if not ret:
+                    break
+                decoded = time.perf_counter()
+                # Scale first so the colour conversion runs on the small image
+                cv2.resize(image, self.display_size, dst=self._scaled)
+                cv2.cvtColor(self._scaled, cv2.COLOR_BGR2RGBA, dst=self.slots[slot])
+                METRICS.record("decode", decoded - started)
+                METRICS.record("convert", time.perf_counter() - decoded)
+                with self._lock:
+                    self._ready.append((slot, frame_time))
+        finally:
+            if self.decoders is not None:
+                self.decoders.release(session)
+            else:
+                session.close()
+            self.finished = True
+
+    def frame_for(self, clock_time, tolerance):
+        """Take the newest decoded frame due at clock_time
+
+        Returns (slot, frame_time), or None when no frame is due yet. Older
+        due frames are dropped, and the frame is counted as late when it is
+        more than tolerance seconds behind the clock. The caller must
+        release() the returned slot.
+        """
+        taken = None
+        with self._lock:
+            while self._ready and self._ready[0][1] <= clock_time:
+                if taken is not None:
+                    self._free.put(taken[0])
+                    self.dropped += 1
+                    METRICS.count("dropped")
+                taken = self._ready.popleft()
+        if taken is not None:
+            self.shown += 1
+            METRICS.count("shown")
+            if clock_time - taken[1] > tolerance:
+                self.late += 1
+                METRICS.count("late")
+        return taken
+
+    def release(self, slot):
+        self._free.put(slot)
+
+    def next_due(self):
+        """Timestamp of the next decoded frame, or None if none is buffered"""
+        with self._lock:
+            return self._ready[0][1] if self._ready else None
+
+    @property
+    def exhausted(self):
+        """True once every decoded frame has been handed out"""
+        with self._lock:
+            return self.finished and not self._ready
@@ -0,0 +1,146 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+
+from src.ffmpeg_utils import run_ffmpeg
+from src.instrumentation import METRICS
+
+
+@dataclass
+class ProgressEvent:
+    """Snapshot of a running trim"""
+    frames: int
+    total_frames: int
+    fps: float
+    bytes_written: int
+    elapsed: float
+    finished: bool = False
+
+    @property
+    def fraction(self):
+        """Share of the frames done, 0 to 1, or None when the total is unknown"""
+        if not self.total_frames:
+            return None
+        return min(1.0, self.frames / self.total_frames)
+
+    @property
+    def eta(self):
+        """Seconds left at the current speed, or None before it is known"""
+        if not self.total_frames or not self.fps:
+            return None
+        return max(0.0, (self.total_frames - self.frames) / self.fps)
+
+    def as_dict(self):
+        data = asdict(self)
+        data["fraction"] = self.fraction
+        data["eta"] = self.eta
+        return data
+
+    def __str__(self):
+        text = f"{self.frames}"
+        if self.total_frames:
+            text += f"/{self.total_frames} frames ({self.fraction * 100:.0f}%)"
+        else:
+            text += " frames"
+        text += f", {self.fps:.1f} fps, {self.bytes_written / 1e6:.1f} MB"
+        if self.eta is not None and not self.finished:
+            text += f", ETA {int(self.eta // 60)}:{int(self.eta % 60):02d}"
+        return text
+
+
+class ProgressTracker:
+    """Runs the ffmpeg processes of one trim, reporting progress and honouring cancel
+
+    Each process started with run_ffmpeg() reports its frames and bytes
+    through ffmpeg's -progress output; the tracker adds them up over all
+    processes of the trim, including ones running in parallel, and calls
+    callback with a ProgressEvent at most every min_interval seconds.
+    Processes that only join already encoded parts pass counts=False so
+    their frames are not counted twice. Setting cancel kills every
+    process of the trim and makes it raise OperationCancelled.
+
+    stages adds up the seconds spent in each step of the trim, such as
+    "encode", "copy" or "join". Every process counts in full, so the
+    stages of a parallel trim can add up to more than its wall time.
+    They are also recorded in METRICS as trim_<stage>.
+    """
+
+    def __init__(self, callback=None, cancel=None, min_interval=0.25):
+        self.callback = callback
+        self.cancel = cancel
+        self.min_interval = min_interval
+        self.total_frames = 0
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._processes = {}
+        self._lock = threading.Lock()
+        self._last_report = 0.0
+
+    @contextmanager
+    def timed(self, stage):
+        """Context manager adding the time its body takes to stage"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.stages[stage] = self.stages.get(stage, 0.0) + elapsed
+            METRICS.record(f"trim_{stage}", elapsed)
+
+    def run_ffmpeg(self, args, cwd=None, counts=True, stage="encode"):
+        """run_ffmpeg for one process of the trim, timed as stage"""
+        with self.timed(stage):
+            if self.callback is None or not counts:
+                return run_ffmpeg(args, cwd, cancel=self.cancel)
+            with self._lock:
+                key = len(self._processes)
+                self._processes[key] = (0, 0)
+            return run_ffmpeg(args, cwd, cancel=self.cancel, progress=lambda fields: self._update(key, fields))
+
+    def _update(self, key, fields):
+        frames, size = _count(fields.get("frame")), _count(fields.get("total_size"))
+        with self._lock:
+            self._processes[key] = (frames, size)
+            now = time.perf_counter()
+            if now - self._last_report < self.min_interval:
+                return
+            self._last_report = now
+            event = self._event()
+        self.callback(event)
+
+    def _event(self, finished=False):
+        frames = sum(frames for frames, _ in self._processes.values())
+        size = sum(size for _, size in self._processes.values())
+        elapsed = time.perf_counter() - self.started
+        fps = frames / elapsed if elapsed > 0 else 0.0
+        return ProgressEvent(frames, self.total_frames, fps, size, elapsed, finished)
+
+    def finish(self, output_path=None):
+        """Report the final state once the trim has completed
+
+        Stream copies do not report frames and the copied middle of a smart
+        cut is never counted, so a completed trim reports all its frames.
+        """
+        if self.callback is None:
+            return
+        with self._lock:
+            event = self._event(finished=True)
+        event.frames = max(event.frames, self.total_frames)
+        event.fps = event.frames / event.elapsed if event.elapsed > 0 else 0.0
+        if output_path:
+            try:
+                event.bytes_written = os.path.getsize(output_path)
+            except OSError:
+                pass
+        self.callback(event)
+
+
+def _count(value):
+    """Integer field of a -progress report; ffmpeg writes N/A until it is known"""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
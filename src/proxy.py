@@ -0,0 +1,82 @@
+import os
+
+from src.budget import TempSpaceError, format_size
+from src.cache import cache_path
+from src.ffmpeg_utils import remove_quietly, run_ffmpeg
+from src.media_index import MediaIndex
+from src.playback import fit_size
+
+# When the preview decodes from a proxy instead of the source
+PROXY_AUTO = "auto"
+PROXY_ALWAYS = "always"
+PROXY_OFF = "off"
+
+# Labels shown in the UI, in display order
+PROXY_MODES = {
+    "Proxy for 4K / HEVC sources": PROXY_AUTO,
+    "Always preview from proxy": PROXY_ALWAYS,
+    "Never use a proxy": PROXY_OFF,
+}
+
+# Bounding box of a proxy frame; the preview canvas is 640x360
+PROXY_MAX_SIZE = (640, 360)
+
+# Frames between proxy keyframes: seeking decodes at most this many small frames
+PROXY_GOP = 8
+
+# Upper estimate of the proxy's bitrate, for checking there is room for it
+PROXY_BYTES_PER_SECOND = 256 * 1024
+
+# Sources that are slow to decode in software get a proxy in auto mode
+HEAVY_CODECS = {"hevc", "av1", "vp9", "prores"}
+HEAVY_PIXELS = 1920 * 1080
+
+
+def wants_proxy(info, mode=PROXY_AUTO):
+    """True when the preview of a probed source should come from a proxy"""
+    if mode == PROXY_ALWAYS:
+        return True
+    if mode == PROXY_OFF:
+        return False
+    return info.video_codec in HEAVY_CODECS or info.width * info.height > HEAVY_PIXELS
+
+
+def proxy_path(path):
+    """Location of the cached proxy of a source file"""
+    return cache_path("proxies", path, ".mp4")
+
+
+def build_proxy(path, info, index, cancel=None, budget=None):
+    """Return (proxy path, proxy index) for path, transcoding it on first use
+
+    The proxy is a small, short-GOP H.264 copy of the first video stream
+    tuned for fast decoding, without audio. Every frame keeps its PTS and
+    the stream keeps the source's time base, so the proxy has the same
+    frames at the same times and the source's frame index describes both.
+    It is written under a temporary name and moved into the cache once
+    complete, so an interrupted build is never picked up. With a
+    ResourceBudget in budget, a proxy the cache disk has no room for
+    raises TempSpaceError before anything is written.
+    """
+    cached = proxy_path(path)
+    if not os.path.exists(cached):
+        needed = int(info.duration * PROXY_BYTES_PER_SECOND)
+        if budget is not None and not budget.fits_on_disk(cached, needed):
+            raise TempSpaceError(f"not enough free disk space for a proxy of about {format_size(needed)}")
+        width, height = fit_size(info.width or PROXY_MAX_SIZE[0], info.height or PROXY_MAX_SIZE[1],
+                                 *PROXY_MAX_SIZE)
+        args = ["-i", path, "-map", "0:v:0", "-an", "-sn", "-dn",
+                # libx264 needs even dimensions
+                "-vf", f"scale={width // 2 * 2}:{height // 2 * 2}",
+                "-c:v", "libx264", "-preset", "ultrafast", "-tune", "fastdecode", "-crf", "28",
+                "-g", str(PROXY_GOP), "-bf", "0", "-pix_fmt", "yuv420p", "-vsync", "passthrough"]
+        if index.time_base.numerator == 1:
+            args += ["-video_track_timescale", str(index.time_base.denominator)]
+        tmp = cached + ".part.mp4"
+        try:
+            run_ffmpeg(args + [tmp], cancel=cancel)
+        except Exception:
+            remove_quietly(tmp)
+            raise
+        os.replace(tmp, cached)
+    return cached, MediaIndex.load_or_build(cached, cancel)
@@ -0,0 +1,265 @@
+import bisect
+import collections
+import os
+import queue
+import re
+import shutil
+import subprocess
+import threading
+
+import numpy as np
+
+from src.cache import cache_dir, file_cache_key
+from src.ffmpeg_utils import get_ffmpeg_binary, remove_quietly
+from src.instrumentation import METRICS
+from src.playback import fit_size
+
+# Bounding box of a scrub thumbnail
+THUMB_MAX_SIZE = (160, 90)
+
+_PTS_TIME_RE = re.compile(r"pts_time:\s*(-?[\d.]+)")
+
+
+class ThumbnailCache:
+    """Memory-bounded LRU of scrub thumbnails keyed by frame index
+
+    Entries evicted from memory are spilled to spill_dir (when given) as
+    .npy files and read back on demand, so a file's thumbnails survive both
+    eviction and reopening: close() keeps them, clear() deletes them. Safe
+    to use from the builder and Tk threads.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, spill_dir=None):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._frames = []  # sorted frame indices available in memory or on disk
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            for name in os.listdir(spill_dir):
+                if name.endswith(".npy"):
+                    self._frames.append(int(name[:-4]))
+            self._frames.sort()
+
+    def _spill_path(self, frame):
+        return os.path.join(self.spill_dir, f"{frame}.npy")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._frames)
+
+    def __contains__(self, frame):
+        with self._lock:
+            pos = bisect.bisect_left(self._frames, frame)
+            return pos < len(self._frames) and self._frames[pos] == frame
+
+    def put(self, frame, thumbnail):
+        with self._lock:
+            if frame in self._entries:
+                return
+            self._entries[frame] = thumbnail
+            self._bytes += thumbnail.nbytes
+            pos = bisect.bisect_left(self._frames, frame)
+            if pos == len(self._frames) or self._frames[pos] != frame:
+                self._frames.insert(pos, frame)
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                old_frame, old = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+                self._spill(old_frame, old)
+
+    def _spill(self, frame, thumbnail):
+        """Write an entry leaving memory to disk; called with the lock held"""
+        if self.spill_dir:
+            if not os.path.exists(self._spill_path(frame)):
+                try:
+                    np.save(self._spill_path(frame), thumbnail)
+                except OSError:
+                    self._forget(frame)
+        else:
+            self._forget(frame)
+
+    def _forget(self, frame):
+        pos = bisect.bisect_left(self._frames, frame)
+        if pos < len(self._frames) and self._frames[pos] == frame:
+            del self._frames[pos]
+
+    def get(self, frame):
+        with self._lock:
+            thumbnail = self._entries.get(frame)
+            if thumbnail is not None:
+                self._entries.move_to_end(frame)
+                self.hits += 1
+                METRICS.count("thumb_hit")
+                return thumbnail
+        if self.spill_dir:
+            try:
+                thumbnail = np.load(self._spill_path(frame))
+            except (OSError, ValueError):
+                thumbnail = None
+            if thumbnail is not None:
+                self.hits += 1
+                METRICS.count("thumb_hit")
+                self.put(frame, thumbnail)
+                return thumbnail
+        self.misses += 1
+        METRICS.count("thumb_miss")
+        return None
+
+    def nearest(self, frame):
+        """Return (frame, thumbnail) for the cached frame closest to frame, or None"""
+        with self._lock:
+            if not self._frames:
+                return None
+            pos = bisect.bisect_left(self._frames, frame)
+            candidates = self._frames[max(pos - 1, 0):pos + 1]
+            best = min(candidates, key=lambda f: abs(f - frame))
+        thumbnail = self.get(best)
+        return (best, thumbnail) if thumbnail is not None else None
+
+    def close(self):
+        """Drop the thumbnails held in memory, keeping the spilled ones for the next open"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def clear(self):
+        """Drop every thumbnail, deleting the spilled ones too"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self._frames = []
+            if self.spill_dir:
+                for name in os.listdir(self.spill_dir):
+                    if name.endswith(".npy"):
+                        remove_quietly(os.path.join(self.spill_dir, name))
+
+    def release_memory(self):
+        """Move every thumbnail held in memory to the spill directory, or forget it without one"""
+        with self._lock:
+            while self._entries:
+                frame, thumbnail = self._entries.popitem(last=False)
+                self._spill(frame, thumbnail)
+            self._bytes = 0
+
+
+class ThumbnailBuilder:
+    """Background pass decoding one low-res thumbnail per keyframe
+
+    A single ffmpeg process decodes only the keyframes (-skip_frame nokey),
+    scales them and pipes raw RGB frames back; showinfo reports the
+    timestamp of each one on stderr. Keyframes closer together than
+    min_interval seconds are not stored.
+    """
+
+    def __init__(self, path, index, cache, source_size, min_interval=1.0):
+        self.path = path
+        self.index = index
+        self.cache = cache
+        self.size = fit_size(*source_size, *THUMB_MAX_SIZE)
+        self.min_interval = min_interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._proc = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._build, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._proc and self._proc.poll() is None:
+            self._proc.kill()
+        if self._thread:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def wait(self, timeout=None):
+        """Block until every keyframe has been processed"""
+        if self._thread:
+            self._thread.join(timeout)
+
+    def _build(self):
+        width, height = self.size
+        cmd = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "info",
+               "-skip_frame", "nokey", "-i", self.path, "-map", "0:v:0", "-an", "-vsync", "0",
+               "-vf", f"scale={width}:{height},showinfo",
+               "-f", "rawvideo", "-pix_fmt", "rgb24", "-"]
+        self._proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        times = queue.Queue()
+
+        def read_times():
+            for line in self._proc.stderr:
+                match = _PTS_TIME_RE.search(line.decode("utf-8", "replace"))
+                if match:
+                    times.put(float(match.group(1)))
+            times.put(None)
+
+        threading.Thread(target=read_times, daemon=True).start()
+        frame_bytes = width * height * 3
+        last_time = None
+        try:
+            while not self._stop.is_set():
+                data = self._proc.stdout.read(frame_bytes)
+                if len(data) < frame_bytes:
+                    break
+                frame_time = times.get()
+                if frame_time is None:
+                    break
+                if last_time is not None and frame_time - last_time < self.min_interval:
+                    continue
+                last_time = frame_time
+                frame = self.index.frame_at(frame_time)
+                if frame not in self.cache:
+                    thumbnail = np.frombuffer(data, dtype=np.uint8).reshape(height, width, 3)
+                    self.cache.put(frame, thumbnail)
+        finally:
+            if self._proc.poll() is None:
+                self._proc.kill()
+            self._proc.wait()
+
+
+def _directory_size(path):
+    try:
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    except OSError:
+        return 0
+
+
+def prune_thumbnail_spill(max_bytes, keep=None):
+    """Delete the spilled thumbnails of the least recently opened files until
+    all of them take at most max_bytes; the directory keep is never deleted"""
+    root = cache_dir("thumbs")
+    dirs = []
+    for entry in os.scandir(root):
+        if entry.is_dir() and entry.path != keep:
+            try:
+                dirs.append((entry.stat().st_mtime, entry.path, _directory_size(entry.path)))
+            except OSError:
+                continue
+    total = sum(size for _, _, size in dirs) + (_directory_size(keep) if keep else 0)
+    for _, path, size in sorted(dirs):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+
+def open_thumbnail_cache(path, max_bytes=64 * 1024 * 1024, spill=True, max_disk_bytes=None):
+    """Create the scrub cache for a file, spilling to its own cache directory
+
+    max_disk_bytes bounds the spilled thumbnails of all files together:
+    those of the files opened longest ago are deleted to make room.
+    """
+    if not spill:
+        return ThumbnailCache(max_bytes=max_bytes)
+    spill_dir = os.path.join(cache_dir("thumbs"), file_cache_key(path))
+    cache = ThumbnailCache(max_bytes=max_bytes, spill_dir=spill_dir)
+    # Mark the directory as just used, so it is pruned last
+    os.utime(spill_dir)
+    if max_disk_bytes is not None:
+        prune_thumbnail_spill(max_disk_bytes, keep=spill_dir)
+    return cache
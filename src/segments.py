@@ -0,0 +1,63 @@
+class SegmentList:
+    """Ordered, non-overlapping list of (start, end) ranges to keep
+
+    Keep ranges are merged with the ranges they overlap or touch. Cut
+    ranges are removed from the kept ranges; cutting from an empty list
+    starts from the whole video. A cut that would remove everything is
+    refused, since an empty list means "trim the start/end range".
+    """
+
+    def __init__(self, duration=0.0):
+        self.duration = duration
+        self.ranges = []
+
+    def __len__(self):
+        return len(self.ranges)
+
+    def __iter__(self):
+        return iter(self.ranges)
+
+    def clear(self):
+        self.ranges = []
+
+    def _check(self, start, end):
+        if start < 0 or end > self.duration:
+            raise ValueError("Range is out of video duration range!")
+        if start >= end:
+            raise ValueError("Start time must be less than end time!")
+
+    def add_keep(self, start, end):
+        """Keep [start, end], merging it with the ranges it overlaps"""
+        self._check(start, end)
+        self.ranges = merge_ranges(self.ranges + [(start, end)])
+
+    def add_cut(self, start, end):
+        """Remove [start, end] from the kept ranges"""
+        self._check(start, end)
+        ranges = self.ranges or [(0.0, self.duration)]
+        kept = []
+        for keep_start, keep_end in ranges:
+            if keep_end <= start or keep_start >= end:
+                kept.append((keep_start, keep_end))
+                continue
+            if keep_start < start:
+                kept.append((keep_start, start))
+            if keep_end > end:
+                kept.append((end, keep_end))
+        if not kept:
+            raise ValueError("Cutting this range would leave nothing to keep!")
+        self.ranges = kept
+
+    def remove(self, position):
+        del self.ranges[position]
+
+
+def merge_ranges(ranges):
+    """Sort ranges and merge those that overlap or touch"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
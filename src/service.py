@@ -0,0 +1,550 @@
+import argparse
+import json
+import multiprocessing
+import os
+import re
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from src.batch import AUTO_PROFILE, MODES, BatchSummary, TrimJob, load_manifest, parse_job, run_job, tune_profiles
+from src.cache import cache_dir
+from src.encoder_profiles import DEFAULT_PROFILE, PROFILES
+from src.trim_engine import MODE_COPY
+
+# Job states, in the order a job goes through them
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+# Manifests the watcher picks up, in the batch manifest format
+MANIFEST_EXTENSIONS = (".csv", ".json")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input TEXT NOT NULL,
+    start REAL NOT NULL,
+    "end" REAL NOT NULL,
+    output TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    source TEXT,
+    submitted REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    elapsed REAL,
+    duration REAL,
+    bytes INTEGER,
+    note TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, id);
+CREATE TABLE IF NOT EXISTS manifests (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    jobs INTEGER NOT NULL,
+    error TEXT
+);
+"""
+
+
+class QueueFull(Exception):
+    """Raised when accepting more jobs would exceed the queue's limit"""
+
+
+class JobQueue:
+    """Persistent priority queue of trim jobs in a SQLite database
+
+    Higher priorities run first and jobs of equal priority run in the order
+    they were submitted. At most max_queued jobs wait at any time; beyond
+    that submit() raises QueueFull, which callers pass back to whoever is
+    producing the jobs. Jobs left running by a crash are queued again when
+    the queue is opened.
+    """
+
+    def __init__(self, path, max_queued=1000):
+        self.path = path
+        self.max_queued = max_queued
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._db.execute("UPDATE jobs SET status = ?, started = NULL WHERE status = ?", (QUEUED, RUNNING))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def submit(self, jobs, source=None):
+        """Queue TrimJobs in one transaction, all or none; returns their ids"""
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+                if queued + len(jobs) > self.max_queued:
+                    raise QueueFull(f"Queue is full ({queued} of {self.max_queued} jobs waiting)")
+                ids = []
+                for job in jobs:
+                    cursor = self._db.execute(
+                        'INSERT INTO jobs (input, start, "end", output, mode, profile, priority, status, source, '
+                        "submitted) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        (job.input, job.start, job.end, job.output, job.mode, job.profile, job.priority, QUEUED,
+                         source, now))
+                    ids.append(cursor.lastrowid)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return ids
+
+    def claim(self):
+        """Mark the next job as running and return (id, TrimJob), or None if none is queued"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE status = ? ORDER BY priority DESC, id LIMIT 1", (QUEUED,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE jobs SET status = ?, started = ? WHERE id = ?", (RUNNING, time.time(), row["id"]))
+        job = TrimJob(str(row["id"]), row["input"], row["start"], row["end"], row["output"], row["mode"],
+                      row["profile"], row["priority"])
+        return row["id"], job
+
+    def finish(self, job_id, entry):
+        """Record the journal entry run_job returned for a job"""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, finished = ?, attempts = ?, elapsed = ?, duration = ?, bytes = ?, "
+                "profile = COALESCE(?, profile), note = ?, error = ? WHERE id = ?",
+                (entry["status"], time.time(), entry.get("attempts", 0), entry.get("elapsed"),
+                 entry.get("duration"), entry.get("bytes"), entry.get("profile"), entry.get("note"),
+                 entry.get("error"), job_id))
+
+    def cancel(self, job_id):
+        """Cancel a job that has not started; returns False if it is not waiting"""
+        with self._lock:
+            cursor = self._db.execute("UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ?",
+                                      (CANCELLED, time.time(), job_id, QUEUED))
+        return cursor.rowcount > 0
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self, status=None, limit=100):
+        """Most recently submitted jobs first"""
+        query, args = "SELECT * FROM jobs", []
+        if status:
+            query += " WHERE status = ?"
+            args.append(status)
+        query += " ORDER BY id DESC LIMIT ?"
+        args.append(limit)
+        with self._lock:
+            return [dict(row) for row in self._db.execute(query, args)]
+
+    def counts(self):
+        """Number of jobs in each state"""
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys((QUEUED, RUNNING, DONE, FAILED, CANCELLED), 0)
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def finished_since(self, since):
+        """Totals of the jobs that finished after the time since"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(bytes), 0), COALESCE(SUM(duration), 0), COALESCE(SUM(elapsed), 0) "
+                "FROM jobs WHERE status = ? AND finished >= ?", (DONE, since)).fetchone()
+            failed = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = ? AND finished >= ?",
+                                      (FAILED, since)).fetchone()[0]
+        done, output_bytes, duration, elapsed = row
+        return done, failed, output_bytes, duration, elapsed
+
+    def manifest_seen(self, path, st):
+        """True when this version of a manifest has already been queued (or rejected)"""
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns FROM manifests WHERE path = ?", (path,)).fetchone()
+        return row is not None and (row[0], row[1]) == (st.st_size, st.st_mtime_ns)
+
+    def record_manifest(self, path, st, jobs, error=None):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO manifests (path, size, mtime_ns, jobs, error) "
+                             "VALUES (?, ?, ?, ?, ?)", (path, st.st_size, st.st_mtime_ns, jobs, error))
+
+
+class TrimService:
+    """Runs queued jobs on a process pool, at most concurrency at a time
+
+    Jobs run through the batch runner's run_job, so they behave exactly like
+    batch jobs, retries included. A dispatcher thread only takes a job off
+    the queue when a worker is free, so waiting jobs stay in the database
+    where they survive restarts and can still be cancelled. Running jobs
+    report their progress and cancel through a multiprocessing manager
+    shared with the workers.
+    """
+
+    def __init__(self, queue, concurrency=2, retries=1, encode_workers=None, default_mode=MODE_COPY,
+                 default_profile=DEFAULT_PROFILE, report=print):
+        self.queue = queue
+        self.concurrency = concurrency
+        # Applied to submitted jobs that do not name a mode or profile
+        self.default_mode = default_mode
+        self.default_profile = default_profile
+        self.retries = retries
+        self.encode_workers = encode_workers or max(1, (os.cpu_count() or 1) // concurrency)
+        self.report = report
+        self.started = time.time()
+        self._slots = threading.Semaphore(concurrency)
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._pool = None
+        self._manager = None
+        self._progress = None
+        self._thread = None
+        self._running = {}
+        self._running_lock = threading.Lock()
+
+    def start(self):
+        # Workers are spawned, not forked, since the service runs several threads
+        context = multiprocessing.get_context("spawn")
+        self._manager = context.Manager()
+        self._progress = self._manager.dict()
+        self._pool = ProcessPoolExecutor(max_workers=self.concurrency, mp_context=context)
+        self._thread = threading.Thread(target=self._dispatch, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop taking jobs and wait for the running ones to finish"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+        if self._pool:
+            self._pool.shutdown(wait=True)
+        if self._manager:
+            self._manager.shutdown()
+
+    def submit(self, jobs, source=None):
+        ids = self.queue.submit(jobs, source)
+        self._wakeup.set()
+        return ids
+
+    def _dispatch(self):
+        while not self._stop.is_set():
+            if not self._slots.acquire(timeout=0.5):
+                continue
+            claimed = None if self._stop.is_set() else self.queue.claim()
+            if claimed is None:
+                self._slots.release()
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+            job_id, job = claimed
+            if job.profile == AUTO_PROFILE:
+                tune_profiles([job], report=self.report)
+            cancel = self._manager.Event()
+            with self._running_lock:
+                self._running[job_id] = (job, time.time(), cancel)
+            self.report(f"[start] job {job_id}: {os.path.basename(job.input)} ({job.mode}, {job.profile})")
+            future = self._pool.submit(run_job, job, self.retries, self.encode_workers, self._progress, cancel)
+            future.add_done_callback(lambda f, job_id=job_id, job=job: self._finished(job_id, job, f))
+
+    def _finished(self, job_id, job, future):
+        try:
+            entry = future.result()
+        except Exception as e:
+            # The worker process itself died
+            entry = {"job_id": str(job_id), "status": FAILED, "output": job.output, "attempts": 1,
+                     "error": str(e) or type(e).__name__}
+        self.queue.finish(job_id, entry)
+        with self._running_lock:
+            self._running.pop(job_id, None)
+        self._progress.pop(job.job_id, None)
+        self._slots.release()
+        if entry["status"] == DONE:
+            self.report(f"[done] job {job_id} -> {job.output} in {entry['elapsed']:.1f}s")
+        elif entry["status"] == CANCELLED:
+            self.report(f"[cancelled] job {job_id}")
+        else:
+            self.report(f"[failed] job {job_id}: {entry['error']}")
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it has already finished
+
+        A running job is stopped at once; it is recorded as cancelled when
+        its worker has cleaned up.
+        """
+        if self.queue.cancel(job_id):
+            return True
+        with self._running_lock:
+            running = self._running.get(job_id)
+        if running is None:
+            return False
+        running[2].set()
+        return True
+
+    def running(self):
+        """Jobs being trimmed right now with the seconds they have been running and their progress"""
+        now = time.time()
+        with self._running_lock:
+            running = list(self._running.items())
+        return [{"id": job_id, "input": job.input, "output": job.output, "mode": job.mode,
+                 "running_for": round(now - started, 1), "progress": self._progress.get(job.job_id)}
+                for job_id, (job, started, _) in running]
+
+    def metrics(self):
+        """Queue depth, running jobs and throughput since the service started"""
+        uptime = time.time() - self.started
+        done, failed, output_bytes, duration, elapsed = self.queue.finished_since(self.started)
+        summary = BatchSummary(total=done + failed, done=done, failed=failed, wall_time=uptime,
+                               output_bytes=output_bytes)
+        return {
+            "uptime": round(uptime, 1),
+            "concurrency": self.concurrency,
+            "max_queued": self.queue.max_queued,
+            "jobs": self.queue.counts(),
+            "running": self.running(),
+            "throughput": {
+                "done": done,
+                "failed": failed,
+                "jobs_per_minute": round(summary.jobs_per_minute, 2),
+                "megabytes_per_second": round(summary.megabytes_per_second, 2),
+                "realtime_factor": round(duration / elapsed, 2) if elapsed else 0.0,
+            },
+        }
+
+
+class FolderWatcher:
+    """Polls directories for batch manifests and queues their jobs
+
+    A manifest is picked up once its size and modification time have not
+    changed for settle seconds, so files still being copied are left
+    alone. Every version of a manifest is queued once, across restarts.
+    When the queue is full the manifest is retried on a later poll.
+    """
+
+    def __init__(self, service, directories, interval=2.0, settle=2.0, report=print):
+        self.service = service
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.interval = interval
+        self.settle = settle
+        self.report = report
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            for directory in self.directories:
+                try:
+                    self.scan(directory)
+                except OSError as e:
+                    self.report(f"Cannot scan {directory}: {e}")
+            self._stop.wait(self.interval)
+
+    def scan(self, directory):
+        queue = self.service.queue
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if not name.lower().endswith(MANIFEST_EXTENSIONS) or name.endswith(".journal.jsonl"):
+                continue
+            st = os.stat(path)
+            if time.time() - st.st_mtime < self.settle or queue.manifest_seen(path, st):
+                continue
+            try:
+                jobs = load_manifest(path, self.service.default_mode, self.service.default_profile)
+            except (OSError, ValueError) as e:
+                queue.record_manifest(path, st, 0, str(e))
+                self.report(f"Rejected manifest {name}: {e}")
+                continue
+            try:
+                ids = self.service.submit(jobs, source=path)
+            except QueueFull as e:
+                self.report(f"Deferred manifest {name}: {e}")
+                continue
+            queue.record_manifest(path, st, len(ids))
+            self.report(f"Queued {len(ids)} job(s) from {name}")
+
+
+_JOB_PATH_RE = re.compile(r"^/jobs/(\d+)$")
+# Most jobs GET /jobs returns at once
+MAX_LIST_LIMIT = 1000
+# Largest id SQLite can store
+_MAX_JOB_ID = 2 ** 63 - 1
+# Largest request body POST /jobs accepts
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+
+class _ApiHandler(BaseHTTPRequestHandler):
+    """JSON API of the service; the server object carries the TrimService"""
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body, indent=2).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        match = _JOB_PATH_RE.match(url.path)
+        if url.path in ("/status", "/metrics"):
+            self._send(200, service.metrics())
+        elif url.path == "/jobs":
+            query = parse_qs(url.query)
+            status = query.get("status", [None])[0]
+            try:
+                limit = int(query.get("limit", ["100"])[0])
+            except ValueError:
+                self._send(400, {"error": "limit must be an integer"})
+                return
+            self._send(200, service.queue.list(status, min(max(limit, 1), MAX_LIST_LIMIT)))
+        elif match:
+            job_id = int(match.group(1))
+            job = service.queue.get(job_id) if job_id <= _MAX_JOB_ID else None
+            if job:
+                self._send(200, job)
+            else:
+                self._send(404, {"error": "No such job"})
+        else:
+            self._send(404, {"error": "Not found"})
+
+    def do_POST(self):
+        service = self.server.service
+        if urlparse(self.path).path != "/jobs":
+            self._send(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or -1)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._send(400, {"error": "Content-Length must be a non-negative integer"})
+            return
+        if length > MAX_BODY_BYTES:
+            self._send(413, {"error": f"Request body is larger than {MAX_BODY_BYTES} bytes"})
+            return
+        try:
+            body = json.loads(self.rfile.read(length) or b"null")
+            entries = body if isinstance(body, list) else [body]
+            # Relative paths are resolved against the service's working directory
+            jobs = [parse_job(entry, number, os.getcwd(), service.default_mode, service.default_profile)
+                    for number, entry in enumerate(entries, start=1)]
+        except ValueError as e:
+            self._send(400, {"error": str(e)})
+            return
+        try:
+            ids = service.submit(jobs, source="api")
+        except QueueFull as e:
+            # Backpressure: the client should retry later
+            self._send(429, {"error": str(e)}, {"Retry-After": "5"})
+            return
+        self._send(201, {"ids": ids})
+
+    def do_DELETE(self):
+        service = self.server.service
+        match = _JOB_PATH_RE.match(urlparse(self.path).path)
+        if not match:
+            self._send(404, {"error": "Not found"})
+        elif int(match.group(1)) > _MAX_JOB_ID:
+            self._send(404, {"error": "No such job"})
+        elif service.cancel(int(match.group(1))):
+            self._send(200, {"status": CANCELLED})
+        else:
+            self._send(409, {"error": "Only queued or running jobs can be cancelled"})
+
+
+def serve_api(service, host="127.0.0.1", port=8765):
+    """Start the HTTP API on a background thread; returns the server"""
+    server = ThreadingHTTPServer((host, port), _ApiHandler)
+    server.daemon_threads = True
+    server.service = service
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run trims from watched folders and a local HTTP API.")
+    parser.add_argument("-w", "--watch", action="append", default=[], metavar="DIR",
+                        help="directory to watch for CSV/JSON manifests (repeatable)")
+    parser.add_argument("--port", type=int, default=8765, help="HTTP API port on localhost (default: 8765)")
+    parser.add_argument("--no-api", action="store_true", help="do not start the HTTP API")
+    parser.add_argument("-j", "--concurrency", type=int, default=2, help="jobs run at once (default: 2)")
+    parser.add_argument("--max-queued", type=int, default=1000,
+                        help="jobs allowed to wait before submissions are refused (default: 1000)")
+    parser.add_argument("--encode-workers", type=int,
+                        help="encoders per parallel job, or encoder threads per other job "
+                             "(default: CPU count / concurrency)")
+    parser.add_argument("--retries", type=int, default=1, help="retries per failed job (default: 1)")
+    parser.add_argument("--mode", choices=MODES, default=MODE_COPY,
+                        help="trim mode for jobs without one (default: copy)")
+    parser.add_argument("--profile", choices=list(PROFILES) + [AUTO_PROFILE], default=DEFAULT_PROFILE,
+                        help="encoder profile for jobs without one (default: balanced)")
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between folder scans (default: 2)")
+    parser.add_argument("--db", help="queue database (default: service/jobs.sqlite3 in the cache directory)")
+    args = parser.parse_args(argv)
+    if not args.watch and args.no_api:
+        parser.error("nothing to do: give --watch or leave the API on")
+
+    queue = JobQueue(args.db or os.path.join(cache_dir("service"), "jobs.sqlite3"), args.max_queued)
+    service = TrimService(queue, args.concurrency, args.retries, args.encode_workers, args.mode, args.profile)
+    service.start()
+    watcher = None
+    if args.watch:
+        watcher = FolderWatcher(service, args.watch, args.interval)
+        watcher.start()
+        print(f"Watching {', '.join(watcher.directories)}")
+    server = None
+    if not args.no_api:
+        try:
+            server = serve_api(service, port=args.port)
+        except OSError as e:
+            print(f"Cannot start the API on port {args.port}: {e}", file=sys.stderr)
+            service.stop()
+            return 2
+        print(f"API on http://127.0.0.1:{args.port}/ (POST /jobs, GET /jobs, GET /status)")
+
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    # Wait with a timeout so signals are handled on every platform
+    while not stop.wait(1.0):
+        pass
+    print("Stopping; waiting for running jobs to finish")
+    if watcher:
+        watcher.stop()
+    if server:
+        server.shutdown()
+    service.stop()
+    queue.close()
+    return 0
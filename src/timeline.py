@@ -0,0 +1,119 @@
+from fractions import Fraction
+
+import numpy as np
+
+# How cut points are snapped
+SNAP_FRAME = "frame"
+SNAP_KEYFRAME = "keyframe"
+SNAP_MARKER = "marker"
+
+# Labels shown in the UI, in display order
+SNAP_MODES = {
+    "Snap to frames": SNAP_FRAME,
+    "Snap to keyframes": SNAP_KEYFRAME,
+    "Snap to suggested cuts": SNAP_MARKER,
+}
+
+
+class Timeline:
+    """Frame-exact positions in a video, backed by its MediaIndex
+
+    Positions are integer frame indices and cut points are frame
+    boundaries: boundary n lies just before frame n, so boundary 0 is the
+    start and boundary frame_count the end of the video. Times are derived
+    from each frame's integer PTS and the stream's rational time base, so
+    converting a cut point to seconds and back always lands on the same
+    frame, however irregular the frame rate.
+
+    markers are suggested cut points, (boundary, kind) pairs in order, as
+    found by MediaAnalysis.markers().
+    """
+
+    def __init__(self, index, duration, markers=()):
+        self.index = index
+        self.duration = duration
+        self.set_markers(markers)
+
+    def set_markers(self, markers):
+        self.markers = list(markers)
+        self._marker_boundaries = np.asarray([boundary for boundary, _ in self.markers], dtype=np.int64)
+
+    @property
+    def frame_count(self):
+        return self.index.frame_count
+
+    @property
+    def time_base(self):
+        return self.index.time_base
+
+    def pts_of(self, boundary):
+        """PTS of the frame starting at boundary, or None for the end of the video"""
+        if boundary >= self.frame_count:
+            return None
+        return int(self.index.pts[max(boundary, 0)])
+
+    def time_of(self, boundary):
+        """Exact time of a boundary in seconds, as a Fraction"""
+        pts = self.pts_of(boundary)
+        if pts is None:
+            return Fraction(self.duration).limit_denominator(1_000_000)
+        return pts * self.time_base
+
+    def seconds(self, boundary):
+        """Time of a boundary in seconds, as a float"""
+        return float(self.time_of(boundary))
+
+    def frame_at(self, time_sec):
+        """Index of the frame on screen at time_sec"""
+        return self.index.frame_at(time_sec)
+
+    def boundary_at(self, time_sec):
+        """Boundary nearest to time_sec"""
+        frame = self.index.frame_at(time_sec)
+        if time_sec - self.seconds(frame) > self.seconds(frame + 1) - time_sec:
+            return frame + 1
+        return frame
+
+    def step(self, frame, count):
+        """Frame index count frames away from frame, kept inside the video"""
+        return min(max(frame + count, 0), self.frame_count - 1)
+
+    def snap(self, boundary, mode=SNAP_FRAME):
+        """Snap a boundary onto the nearest keyframe or suggested cut, as mode selects
+
+        The end of the video also counts as a keyframe boundary, so a range
+        can run to the end and still be stream-copied. SNAP_MARKER keeps
+        the boundary as it is while there are no markers.
+        """
+        boundary = min(max(boundary, 0), self.frame_count)
+        if mode == SNAP_MARKER:
+            return self._nearest_marker(boundary)
+        if mode != SNAP_KEYFRAME or boundary == self.frame_count:
+            return boundary
+        before = self.index.keyframe_at_or_before(boundary)
+        after = self.index.keyframe_at_or_after(boundary)
+        return before if boundary - before <= after - boundary else after
+
+    def _nearest_marker(self, boundary):
+        markers = self._marker_boundaries
+        if not len(markers):
+            return boundary
+        pos = int(np.searchsorted(markers, boundary))
+        nearby = markers[max(pos - 1, 0):pos + 1]
+        return int(nearby[np.argmin(np.abs(nearby - boundary))])
+
+    def next_marker(self, boundary, direction=1):
+        """Boundary of the first marker after boundary, or before it when direction is negative
+
+        Returns None when there is no marker in that direction.
+        """
+        markers = self._marker_boundaries
+        if direction > 0:
+            pos = int(np.searchsorted(markers, boundary, side="right"))
+            return int(markers[pos]) if pos < len(markers) else None
+        pos = int(np.searchsorted(markers, boundary, side="left")) - 1
+        return int(markers[pos]) if pos >= 0 else None
+
+    def frame_range(self, start_time, end_time):
+        """(first, end) boundaries of the frames presented in [start_time, end_time)"""
+        return self.index.first_frame_from(start_time), min(self.index.first_frame_from(end_time), self.frame_count)
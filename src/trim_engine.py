@@ -0,0 +1,488 @@
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from src.budget import ResourceBudget, TempSpaceError
+from src.encoder_profiles import MATCH_SOURCE, get_profile
+from src.ffmpeg_utils import (FFmpegError, OperationCancelled, audio_concat_graph, format_seconds, probe_media,
+                              remove_quietly)
+from src.media_index import MediaIndex
+from src.parallel_encode import encode_parallel
+from src.progress import ProgressTracker
+from src.segments import merge_ranges
+from src.timeline import Timeline
+
+# Trim engines
+MODE_REENCODE = "reencode"
+MODE_COPY = "copy"
+MODE_SMART = "smart"
+MODE_PARALLEL = "parallel"
+
+# Labels shown in the UI, in display order
+TRIM_MODES = {
+    "Re-encode (exact, slow)": MODE_REENCODE,
+    "Fast copy (snap to keyframe)": MODE_COPY,
+    "Smart cut (exact, re-encode edges)": MODE_SMART,
+    "Parallel re-encode (exact, all cores)": MODE_PARALLEL,
+}
+
+# Codecs whose edge GOPs we can re-encode into a bitstream compatible with the copied middle
+SMART_CUT_CODECS = {"h264": "libx264"}
+
+
+class TrimError(Exception):
+    """Raised when a trim cannot be performed"""
+
+
+@dataclass
+class TrimResult:
+    """Outcome of a trim, used to report how long it took"""
+    output_path: str
+    mode: str
+    start: float
+    end: float
+    elapsed: float
+    note: str = ""
+    segments: list = None
+    # Seconds spent in each step, such as {"index": 0.01, "encode": 2.3, "join": 0.2}
+    stages: dict = None
+
+    @property
+    def duration(self):
+        if self.segments:
+            return sum(end - start for start, end in self.segments)
+        return self.end - self.start
+
+    @property
+    def realtime_factor(self):
+        return self.duration / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self):
+        text = f"{self.duration:.2f}s of video in {self.elapsed:.2f}s ({self.realtime_factor:.1f}x realtime)"
+        if self.note:
+            text += f" - {self.note}"
+        return text
+
+    def stages_text(self):
+        """Time per step, longest first, such as: encode 2.31s, join 0.20s"""
+        if not self.stages:
+            return ""
+        ordered = sorted(self.stages.items(), key=lambda item: item[1], reverse=True)
+        return ", ".join(f"{stage} {seconds:.2f}s" for stage, seconds in ordered)
+
+
+def check_trim_range(start_time, end_time, duration):
+    """Raise TrimError unless [start_time, end_time] is a valid range of the video"""
+    if start_time < 0 or end_time > duration:
+        raise TrimError("Trim times are out of video duration range!")
+    if start_time >= end_time:
+        raise TrimError("Start time must be less than end time!")
+
+
+def trim(source_path, start_time, end_time, output_path, mode=MODE_REENCODE, index=None, workers=None,
+         profile=None, progress=None, cancel=None, budget=None):
+    """Cut [start_time, end_time] out of source_path into output_path
+
+    The range keeps exactly the frames presented from start_time up to,
+    but not including, end_time. index is the source's MediaIndex; it is
+    loaded from the cache when not given. workers caps the encoders the
+    parallel engine runs at once. profile is an encoder profile or its
+    name and applies to the engines that re-encode the whole range.
+
+    progress is called with a ProgressEvent a few times a second while
+    the trim runs. Setting the threading.Event cancel stops it: ffmpeg is
+    killed, the partial output removed and OperationCancelled raised.
+
+    budget is the ResourceBudget whose temp_dir and temp_bytes hold the
+    intermediate files of smart and parallel trims; it defaults to the
+    one set in the environment.
+    """
+    started = time.perf_counter()
+    info = probe_media(source_path)
+    check_trim_range(start_time, end_time, info.duration)
+    budget = budget or ResourceBudget.from_env()
+    tracker = ProgressTracker(progress, cancel)
+    try:
+        if mode == MODE_REENCODE:
+            profile = _resolve_profile(profile, source_path, info)
+            result = _segments_reencode(source_path, [(start_time, end_time)], output_path, info, index, profile,
+                                        tracker)
+            result.segments = None
+        elif mode == MODE_COPY:
+            result = _trim_copy(source_path, start_time, end_time, output_path, index, tracker)
+        elif mode == MODE_SMART:
+            result = _trim_smart(source_path, start_time, end_time, output_path, index, tracker, budget, info)
+        elif mode == MODE_PARALLEL:
+            result = _parallel_reencode(source_path, [(start_time, end_time)], output_path, index, workers, info,
+                                        profile=profile, tracker=tracker, budget=budget)
+        else:
+            raise TrimError(f"Unknown trim mode: {mode}")
+    except OperationCancelled:
+        remove_quietly(output_path)
+        raise
+    tracker.finish(output_path)
+    result.elapsed = time.perf_counter() - started
+    result.stages = {stage: round(seconds, 3) for stage, seconds in tracker.stages.items()}
+    return result
+
+
+def _resolve_profile(profile, source_path, info=None):
+    """Look up an encoder profile and fill in the source's settings for match-source"""
+    try:
+        profile = get_profile(profile)
+    except ValueError as e:
+        raise TrimError(str(e)) from None
+    if profile.name == MATCH_SOURCE:
+        profile = profile.for_source(info or probe_media(source_path))
+    return profile
+
+
+def _trim_copy(source_path, start_time, end_time, output_path, index=None, tracker=None):
+    """Remux packets without decoding, starting at the keyframe at or before start_time"""
+    tracker = tracker or ProgressTracker()
+    if index is None:
+        with tracker.timed("index"):
+            index = MediaIndex.load_or_build(source_path, tracker.cancel)
+    snapped = index.time_of(index.keyframe_at_or_before(index.frame_at(start_time)))
+    margin = index.frame_duration / 4
+    frames = tracker.total_frames = index.count_frames(snapped, end_time)
+
+    # -frames:v ends the video on an exact frame; -t bounds the other streams
+    tracker.run_ffmpeg([
+        "-ss", format_seconds(snapped + margin), "-i", source_path,
+        "-t", format_seconds(end_time - snapped),
+        "-map", "0:v:0", "-map", "0:a?",
+        "-frames:v", str(frames),
+        "-c", "copy", "-avoid_negative_ts", "make_zero",
+        output_path,
+    ], stage="copy")
+    note = "stream copy"
+    if snapped < start_time:
+        note += f", start snapped back {start_time - snapped:.2f}s to keyframe"
+    return TrimResult(output_path, MODE_COPY, snapped, end_time, 0.0, note)
+
+
+def _trim_smart(source_path, start_time, end_time, output_path, index=None, tracker=None, budget=None,
+                info=None):
+    """Re-encode only the partial GOPs at each edge and stream-copy the rest
+
+    The parts are written to a temporary directory before being joined:
+    the copied middle takes about its size in the source and each edge
+    is allowed twice its size. When that does not fit the budget's
+    temporary space, the parts go next to the output instead.
+    """
+    tracker = tracker or ProgressTracker()
+    budget = budget or ResourceBudget()
+    if info is None:
+        info = probe_media(source_path)
+    encoder = SMART_CUT_CODECS.get(info.video_codec)
+    if encoder is None:
+        result = _trim_copy(source_path, start_time, end_time, output_path, index, tracker)
+        result.note += f"; smart cut unsupported for {info.video_codec}"
+        return result
+
+    if index is None:
+        with tracker.timed("index"):
+            index = MediaIndex.load_or_build(source_path, tracker.cancel)
+    keyframes = index.keyframe_times
+    margin = index.frame_duration / 2
+
+    # Snap the cut points onto actual frames
+    first = index.first_frame_from(start_time)
+    if first >= index.frame_count:
+        raise TrimError("Start time is past the last frame")
+    start_time = index.time_of(first)
+    tracker.total_frames = index.count_frames(start_time, end_time)
+
+    # First keyframe inside the range and last keyframe before its end
+    k_first = int(np.searchsorted(keyframes, start_time - 1e-6, side="left"))
+    k_last = int(np.searchsorted(keyframes, end_time - 1e-6, side="left")) - 1
+    if k_first >= len(keyframes) or k_last < k_first:
+        # No complete GOP inside the range, so there is nothing to copy
+        spans = [("encode", start_time, end_time)]
+    else:
+        copy_from, copy_to = keyframes[k_first], keyframes[k_last]
+        spans = [("encode", start_time, copy_from),
+                 ("copy", copy_from, copy_to),
+                 ("encode", copy_to, end_time)]
+
+    needed = sum(index.byte_size(span_start, span_end) * (1 if kind == "copy" else 2)
+                 for kind, span_start, span_end in spans)
+    try:
+        workdir = budget.make_workdir("trim_", needed, os.path.dirname(os.path.abspath(output_path)))
+    except TempSpaceError as e:
+        raise TrimError(str(e)) from None
+    try:
+        parts = []
+        for kind, span_start, span_end in spans:
+            frames = index.count_frames(span_start, span_end)
+            if frames <= 0:
+                continue
+            part = os.path.join(workdir, f"part{len(parts):03d}.mkv")
+            if kind == "copy":
+                # Keep SPS/PPS in-band so the parts can be joined with differing headers
+                codec_args = ["-c:v", "copy", "-bsf:v", "h264_mp4toannexb"]
+                seek = span_start + margin / 2
+            else:
+                codec_args = ["-c:v", encoder, "-preset", "veryfast", "-crf", "18",
+                              "-bsf:v", "dump_extra=freq=keyframe"]
+                if info.pix_fmt:
+                    codec_args += ["-pix_fmt", info.pix_fmt]
+                seek = span_start - margin
+            tracker.run_ffmpeg(["-ss", format_seconds(seek), "-i", source_path,
+                                "-map", "0:v:0", "-an", "-frames:v", str(frames)]
+                               + codec_args + [part])
+            parts.append(part)
+
+        list_path = os.path.join(workdir, "parts.txt")
+        with open(list_path, "w", encoding="utf-8") as f:
+            for part in parts:
+                f.write(f"file '{os.path.basename(part)}'\n")
+
+        # Join the video parts and encode the audio of the range in one go,
+        # which keeps it continuous across the part boundaries
+        args = ["-f", "concat", "-safe", "0", "-i", list_path]
+        if info.has_audio:
+            args += ["-ss", format_seconds(start_time), "-t", format_seconds(end_time - start_time),
+                     "-i", os.path.abspath(source_path), "-map", "0:v", "-map", "1:a:0", "-c:a", "aac"]
+        args += ["-c:v", "copy", os.path.abspath(output_path)]
+        tracker.run_ffmpeg(args, cwd=workdir, counts=False, stage="join")
+    except FFmpegError:
+        remove_quietly(output_path)
+        raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    copied = sum(1 for span in spans if span[0] == "copy")
+    note = "smart cut" if copied else "smart cut (range shorter than one GOP, fully re-encoded)"
+    return TrimResult(output_path, MODE_SMART, start_time, end_time, 0.0, note)
+
+
+def trim_segments(source_path, segments, output_path, mode=MODE_REENCODE, index=None, workers=None,
+                  profile=None, progress=None, cancel=None, budget=None):
+    """Write every kept (start, end) range of source_path into one output
+
+    The source is read once and the output written once, without
+    intermediate files. Copy mode widens each range out to keyframes and
+    stream-copies the video; smart mode does the same when every cut
+    already lies on a keyframe and otherwise re-encodes in a single pass.
+    progress, cancel and budget work as for trim().
+    """
+    segments = merge_ranges(segments)
+    if not segments:
+        raise TrimError("No segments to keep!")
+    if len(segments) == 1:
+        return trim(source_path, segments[0][0], segments[0][1], output_path, mode, index, workers, profile,
+                    progress, cancel, budget)
+
+    started = time.perf_counter()
+    info = probe_media(source_path)
+    for start_time, end_time in segments:
+        check_trim_range(start_time, end_time, info.duration)
+    profile = _resolve_profile(profile, source_path, info)
+    budget = budget or ResourceBudget.from_env()
+    tracker = ProgressTracker(progress, cancel)
+    try:
+        result = _trim_segments(source_path, segments, output_path, mode, index, workers, info, profile, tracker,
+                                budget)
+    except OperationCancelled:
+        remove_quietly(output_path)
+        raise
+    tracker.finish(output_path)
+    result.elapsed = time.perf_counter() - started
+    result.stages = {stage: round(seconds, 3) for stage, seconds in tracker.stages.items()}
+    return result
+
+
+def _trim_segments(source_path, segments, output_path, mode, index, workers, info, profile, tracker, budget):
+    if mode in (MODE_COPY, MODE_SMART):
+        if index is None:
+            with tracker.timed("index"):
+                index = MediaIndex.load_or_build(source_path, tracker.cancel)
+        snapped = _snap_segments_to_keyframes(index, segments)
+        if mode == MODE_COPY or _is_aligned(snapped, segments, index):
+            result = _segments_copy(source_path, snapped, output_path, index, info, tracker, budget)
+            result.mode = mode
+            if mode == MODE_SMART:
+                result.note = "smart cut (all cuts on keyframes, stream copy)"
+        else:
+            result = _segments_reencode(source_path, segments, output_path, info, index, profile, tracker)
+            result.mode = mode
+            result.note = "smart cut (cuts between keyframes, re-encoded in one pass)"
+    elif mode == MODE_REENCODE:
+        result = _segments_reencode(source_path, segments, output_path, info, index, profile, tracker)
+    elif mode == MODE_PARALLEL:
+        result = _parallel_reencode(source_path, segments, output_path, index, workers, info, profile, tracker,
+                                    budget)
+    else:
+        raise TrimError(f"Unknown trim mode: {mode}")
+    return result
+
+
+def _snap_segments_to_keyframes(index, segments):
+    """Widen each range to start and end on keyframes; an end of None means end of file"""
+    snapped = []
+    for start_time, end_time in segments:
+        first = index.keyframe_at_or_before(index.frame_at(start_time))
+        last = index.keyframe_at_or_after(index.first_frame_from(end_time))
+        start = index.time_of(first)
+        end = index.time_of(last) if last < index.frame_count else None
+        # Widening can make neighbouring ranges overlap
+        if snapped and (snapped[-1][1] is None or start <= snapped[-1][1]):
+            snapped[-1] = (snapped[-1][0], end)
+        else:
+            snapped.append((start, end))
+    return snapped
+
+
+def _is_aligned(snapped, segments, index):
+    """True when snapping to keyframes left every range unchanged"""
+    if len(snapped) != len(segments):
+        return False
+    tolerance = index.frame_duration / 2
+    last_frame = index.time_of(index.frame_count - 1)
+    for (snap_start, snap_end), (start_time, end_time) in zip(snapped, segments):
+        if abs(snap_start - start_time) > tolerance:
+            return False
+        if snap_end is None:
+            if end_time <= last_frame:
+                return False
+        elif abs(snap_end - end_time) > tolerance:
+            return False
+    return True
+
+
+def _segments_copy(source_path, segments, output_path, index, info, tracker=None, budget=None):
+    """Stream-copy keyframe-aligned ranges through the concat demuxer
+
+    The concat demuxer ends a file at the first packet whose decoding
+    timestamp reaches outpoint, so each range ends just before the dts of
+    the keyframe that follows it, and duration places the next range.
+    Audio is re-encoded from the same ranges in the same ffmpeg process.
+    """
+    margin = index.frame_duration / 2
+    source = os.path.abspath(source_path).replace("'", "'\\''")
+    lines = ["ffconcat version 1.0"]
+    for start_time, end_time in segments:
+        lines += [f"file '{source}'", f"inpoint {format_seconds(start_time)}"]
+        if end_time is not None:
+            next_key = index.frame_at(end_time)
+            lines += [f"outpoint {format_seconds(index.decode_time_of(next_key) - margin)}",
+                      f"duration {format_seconds(end_time - start_time)}"]
+
+    ends = [info.duration if end is None else end for _, end in segments]
+    spans = [(start, end) for (start, _), end in zip(segments, ends)]
+    tracker = tracker or ProgressTracker()
+    tracker.total_frames = sum(index.count_frames(start, end) for start, end in spans)
+    # The list only names the source file; no media is written besides the output
+    temp_dir = budget.temp_dir if budget else None
+    with tempfile.NamedTemporaryFile("w", suffix=".ffconcat", delete=False, encoding="utf-8", dir=temp_dir) as f:
+        f.write("\n".join(lines) + "\n")
+        list_path = f.name
+    args = ["-f", "concat", "-safe", "0", "-i", list_path]
+    if info.has_audio:
+        args += ["-i", source_path, "-filter_complex", audio_concat_graph(1, spans),
+                 "-map", "0:v:0", "-map", "[a]", "-c:a", "aac"]
+    else:
+        args += ["-map", "0:v:0"]
+    args += ["-c:v", "copy", output_path]
+    try:
+        tracker.run_ffmpeg(args, stage="copy")
+    except FFmpegError:
+        remove_quietly(output_path)
+        raise
+    finally:
+        remove_quietly(list_path)
+    return TrimResult(output_path, MODE_COPY, spans[0][0], spans[-1][1], 0.0,
+                      f"stream copy of {len(spans)} segments, widened to keyframes", spans)
+
+
+def _segments_reencode(source_path, segments, output_path, info, index=None, profile=None, tracker=None):
+    """Decode the source once and re-encode the kept ranges as one stream
+
+    Video is cut on the exact PTS of the first frame of each range and of
+    the frame that follows it, so the cuts land on the same frames
+    whatever the frame rate. Sources with a constant frame rate are
+    written at that rate, which gives the last frame its full duration;
+    other sources keep their frame timestamps on output.
+    """
+    profile = get_profile(profile)
+    tracker = tracker or ProgressTracker()
+    if index is None:
+        with tracker.timed("index"):
+            index = MediaIndex.load_or_build(source_path, tracker.cancel)
+    timeline = Timeline(index, info.duration)
+    tracker.total_frames = 0
+    parts, labels = [], []
+    for n, (start_time, end_time) in enumerate(segments):
+        first, end = timeline.frame_range(start_time, end_time)
+        if first >= timeline.frame_count:
+            raise TrimError("Start time is past the last frame")
+        tracker.total_frames += end - first
+        video_span = f"start_pts={timeline.pts_of(first)}"
+        audio_span = f"start={format_seconds(timeline.seconds(first))}"
+        if end < timeline.frame_count:
+            video_span += f":end_pts={timeline.pts_of(end)}"
+            audio_span += f":end={format_seconds(timeline.seconds(end))}"
+        parts.append(f"[0:v:0]trim={video_span},setpts=PTS-STARTPTS[v{n}]")
+        labels.append(f"[v{n}]")
+        if info.has_audio:
+            # Audio follows the exact times of the cut frames
+            parts.append(f"[0:a:0]atrim={audio_span},asetpts=PTS-STARTPTS[a{n}]")
+            labels.append(f"[a{n}]")
+    audio = 1 if info.has_audio else 0
+    parts.append(f"{''.join(labels)}concat=n={len(segments)}:v=1:a={audio}[v]" + ("[a]" if audio else ""))
+
+    args = ["-i", source_path, "-filter_complex", ";".join(parts), "-map", "[v]"]
+    if audio:
+        args += ["-map", "[a]"] + profile.audio_args()
+    # Passed-through timestamps leave the last frame without a duration,
+    # and the mp4 edit list then hides it
+    rate = index.constant_frame_rate()
+    sync = ["-vsync", "cfr", "-r", str(rate)] if rate else ["-vsync", "passthrough"]
+    args += profile.video_args() + sync + [output_path]
+    try:
+        tracker.run_ffmpeg(args)
+    except FFmpegError:
+        remove_quietly(output_path)
+        raise
+    note = f"{profile.name} profile"
+    if len(segments) > 1:
+        note = f"{len(segments)} segments re-encoded in one pass, " + note
+    return TrimResult(output_path, MODE_REENCODE, segments[0][0], segments[-1][1], 0.0, note, segments)
+
+
+def _parallel_reencode(source_path, segments, output_path, index=None, workers=None, info=None, profile=None,
+                       tracker=None, budget=None):
+    """Re-encode the ranges in keyframe-aligned chunks, one encoder per chunk
+
+    Without temporary space for the chunks the ranges are re-encoded in
+    one pass straight into the output instead.
+    """
+    if info is None:
+        info = probe_media(source_path)
+    profile = _resolve_profile(profile, source_path, info)
+    tracker = tracker or ProgressTracker()
+    if index is None:
+        with tracker.timed("index"):
+            index = MediaIndex.load_or_build(source_path, tracker.cancel)
+    try:
+        chunks = encode_parallel(source_path, segments, output_path, index, info.has_audio, workers,
+                                 video_args=profile.video_args(), audio_args=profile.audio_args(), tracker=tracker,
+                                 budget=budget)
+    except TempSpaceError:
+        result = _segments_reencode(source_path, segments, output_path, info, index, profile, tracker)
+        result.note += "; no temporary space for parallel chunks, re-encoded in one pass"
+        if len(segments) == 1:
+            result.segments = None
+        return result
+    except FFmpegError:
+        remove_quietly(output_path)
+        raise
+    return TrimResult(output_path, MODE_PARALLEL, segments[0][0], segments[-1][1], 0.0,
+                      f"re-encoded as {chunks} parallel chunks, {profile.name} profile",
+                      segments if len(segments) > 1 else None)
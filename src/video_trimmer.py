@@ -2,34 +2,98 @@ import tkinter as tk
 from tkinter import filedialog, messagebox
 from tkinter import ttk
 import os
-from moviepy.editor import VideoFileClip
 import threading
-from PIL import Image, ImageTk
-import cv2
-import tempfile
+import time
 import pygame
+from src.analysis import MARKER_SCENE, MARKER_SILENCE, MediaAnalysis
+from src.audio_stream import StreamingAudio
+from src.budget import ResourceBudget, format_size
+from src.ffmpeg_utils import OperationCancelled
+from src.frame_display import FrameDisplay
+from src.instrumentation import METRICS
+from src.media_source import MediaSource
+from src.playback import DecodeAheadPlayer, PlaybackClock
+from src.proxy import PROXY_AUTO, PROXY_MODES, build_proxy, wants_proxy
+from src.scrub_cache import ThumbnailBuilder, open_thumbnail_cache
+from src.segments import SegmentList
+from src.timeline import SNAP_FRAME, SNAP_MARKER, SNAP_MODES, Timeline
+from src.encoder_profiles import DEFAULT_PROFILE, PROFILES
+from src.trim_engine import TRIM_MODES, MODE_REENCODE, TrimError, check_trim_range
+
+# Delay after the last slider movement before the exact frame is decoded
+SCRUB_SETTLE_MS = 120
+
+# How often to check whether the preview decoder has been idle long enough to close
+IDLE_CHECK_MS = 5000
+
+# How often the performance overlay is redrawn during playback
+OVERLAY_REFRESH_S = 0.5
+
+# Stages shown in the performance overlay, in this order
+OVERLAY_STAGES = ("decode", "convert", "display", "tick", "tk_late", "seek")
+
+# Colours of the suggested cut points under the timeline
+MARKER_COLORS = {MARKER_SCENE: "orange", MARKER_SILENCE: "steelblue"}
+
 
 class VideoTrimmer:
-    def __init__(self, root):
+    def __init__(self, root, show_stats=False, metrics_log=None, budget=None):
         self.root = root
         self.root.title("Video Trimmer")
         self.root.geometry("900x700")
         
+        # Memory and temporary disk space the preview, the caches and the trims may use
+        self.budget = budget or ResourceBudget.from_env()
+        # Set once the user has been told caches were dropped, until memory is back under budget
+        self.memory_warned = False
+        
         # Variables to store video info
         self.video_path = None
         self.video_duration = 0
-        self.clip = None
-        self.cap = None
-        self.current_frame = None
+        self.source = None
+        self.index = None
+        # Frame-exact positions and cut points, once the index is loaded
+        self.frame_timeline = None
+        
+        # Loading happens in the background; setting load_cancel abandons it
+        self.load_cancel = threading.Event()
+        self.load_started = 0.0
+        self.time_to_first_frame = None
+        # Set while a preview proxy is being built; setting it abandons the build
+        self.proxy_cancel = None
+        # Set while a trim runs; setting it stops the trim and removes its output
+        self.trim_cancel = None
+        # Set while cut points are being found; setting it stops the analysis
+        self.analysis_cancel = None
         self.is_playing = False
         self.current_time = 0
+        self.source_size = (640, 360)
+        
+        # Performance overlay and the optional --metrics log that trims and playback are written to
+        self.metrics_log = metrics_log
+        self.stats_var = tk.BooleanVar(value=show_stats)
+        self.overlay_updated = 0.0
+        # perf_counter time the next playback tick was scheduled for
+        self.tick_due = None
+        
+        # Playback
+        self.player = None
+        self.clock = None
+        
+        # Scrub preview
+        self.thumbnails = None
+        self.thumbnail_builder = None
+        self.scrub_after_id = None
+        
+        self.segments = SegmentList()
         
         # Audio-related
-        self.temp_audio_path = None
+        self.audio = None
         self.audio_ready = False
         
         # Create UI components
         self.create_widgets()
+        self.root.after(IDLE_CHECK_MS, self._release_idle)
     
     def create_widgets(self):
         # Main container
@@ -57,28 +121,64 @@ class VideoTrimmer:
         # Canvas for video display
         self.canvas = tk.Canvas(self.video_frame, width=640, height=360, bg="black")
         self.canvas.grid(row=0, column=0, pady=5)
+        self.display = FrameDisplay(self.canvas, (640, 360))
         
         # Video controls
         controls_frame = ttk.Frame(self.video_frame)
         controls_frame.grid(row=1, column=0, pady=5)
         
         self.play_button = ttk.Button(controls_frame, text="▶ Play", command=self.toggle_play, state=tk.DISABLED)
-        self.play_button.grid(row=0, column=1, padx=5)
+        self.play_button.grid(row=0, column=2, padx=5)
         
         # Jump buttons: back and forward 5s
         self.jump_back_button = ttk.Button(controls_frame, text="<< 5s", command=lambda: self.jump(-5), state=tk.DISABLED)
         self.jump_back_button.grid(row=0, column=0, padx=5)
         self.jump_forward_button = ttk.Button(controls_frame, text="5s >>", command=lambda: self.jump(5), state=tk.DISABLED)
-        self.jump_forward_button.grid(row=0, column=2, padx=5)
+        self.jump_forward_button.grid(row=0, column=4, padx=5)
+        
+        # Frame step buttons, enabled once the frame index is loaded
+        self.step_back_button = ttk.Button(controls_frame, text="< 1f", width=5, command=lambda: self.step_frame(-1), state=tk.DISABLED)
+        self.step_back_button.grid(row=0, column=1, padx=5)
+        self.step_forward_button = ttk.Button(controls_frame, text="1f >", width=5, command=lambda: self.step_frame(1), state=tk.DISABLED)
+        self.step_forward_button.grid(row=0, column=3, padx=5)
         
         self.time_label = ttk.Label(controls_frame, text="00:00.00 / 00:00.00")
-        self.time_label.grid(row=0, column=3, padx=10)
+        self.time_label.grid(row=0, column=5, padx=10)
         
         # Timeline slider
         self.timeline = ttk.Scale(self.video_frame, from_=0, to=100, orient=tk.HORIZONTAL, command=self.on_timeline_change)
         self.timeline.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=5)
         self.timeline.state(['disabled'])
         
+        # Suggested cut points, drawn as ticks under the slider; click one to go there
+        self.marker_canvas = tk.Canvas(self.video_frame, height=10, highlightthickness=0)
+        self.marker_canvas.grid(row=3, column=0, sticky=(tk.W, tk.E))
+        self.marker_canvas.bind("<Configure>", lambda event: self.draw_markers())
+        self.marker_canvas.bind("<Button-1>", self.on_marker_click)
+        
+        markers_frame = ttk.Frame(self.video_frame)
+        markers_frame.grid(row=4, column=0, pady=5)
+        self.analyze_button = ttk.Button(markers_frame, text="Find Cut Points", command=self.find_cut_points, state=tk.DISABLED)
+        self.analyze_button.grid(row=0, column=0, padx=5)
+        self.prev_marker_button = ttk.Button(markers_frame, text="◀ Cut", width=6, command=lambda: self.jump_to_marker(-1), state=tk.DISABLED)
+        self.prev_marker_button.grid(row=0, column=1, padx=5)
+        self.next_marker_button = ttk.Button(markers_frame, text="Cut ▶", width=6, command=lambda: self.jump_to_marker(1), state=tk.DISABLED)
+        self.next_marker_button.grid(row=0, column=2, padx=5)
+        self.markers_label = ttk.Label(markers_frame, text="", foreground="gray")
+        self.markers_label.grid(row=0, column=3, padx=10)
+        
+        # Decode the preview from the source or from a low-res proxy of it
+        preview_frame = ttk.Frame(self.video_frame)
+        preview_frame.grid(row=5, column=0, pady=5)
+        ttk.Label(preview_frame, text="Preview:").grid(row=0, column=0, padx=(0, 10))
+        self.proxy_combo = ttk.Combobox(preview_frame, values=list(PROXY_MODES), state="readonly", width=30)
+        self.proxy_combo.grid(row=0, column=1)
+        self.proxy_combo.current(0)
+        self.proxy_combo.bind("<<ComboboxSelected>>", lambda event: self.update_proxy())
+        ttk.Checkbutton(preview_frame, text="Show stats", variable=self.stats_var,
+                        command=self.update_overlay).grid(row=0, column=2, padx=(10, 0))
+        ttk.Button(preview_frame, text="Reset stats", command=self.reset_stats).grid(row=0, column=3, padx=(5, 0))
+        
         # Separator
         ttk.Separator(main_frame, orient='horizontal').grid(row=4, column=0, columnspan=2, sticky=(tk.W, tk.E), pady=15)
         
@@ -96,6 +196,8 @@ class VideoTrimmer:
         
         self.set_start_button = ttk.Button(trim_frame, text="Set to Current", command=self.set_start_to_current, state=tk.DISABLED)
         self.set_start_button.grid(row=0, column=2, padx=10)
+        self.start_frame_label = ttk.Label(trim_frame, text="", foreground="gray")
+        self.start_frame_label.grid(row=0, column=3, sticky=tk.W)
         
         # End time
         ttk.Label(trim_frame, text="End Time (seconds):").grid(row=1, column=0, sticky=tk.W, pady=5, padx=(0, 10))
@@ -105,15 +207,51 @@ class VideoTrimmer:
         
         self.set_end_button = ttk.Button(trim_frame, text="Set to Current", command=self.set_end_to_current, state=tk.DISABLED)
         self.set_end_button.grid(row=1, column=2, padx=10)
+        self.end_frame_label = ttk.Label(trim_frame, text="", foreground="gray")
+        self.end_frame_label.grid(row=1, column=3, sticky=tk.W)
+        
+        # Cut points land on frame boundaries; keyframe boundaries allow stream copy
+        ttk.Label(trim_frame, text="Cut Points:").grid(row=2, column=0, sticky=tk.W, pady=5, padx=(0, 10))
+        self.snap_combo = ttk.Combobox(trim_frame, values=list(SNAP_MODES), state="readonly", width=35)
+        self.snap_combo.grid(row=2, column=1, columnspan=2, sticky=tk.W, pady=5)
+        self.snap_combo.current(0)
         
         # Output filename
-        ttk.Label(trim_frame, text="Output Filename:").grid(row=2, column=0, sticky=tk.W, pady=5, padx=(0, 10))
+        ttk.Label(trim_frame, text="Output Filename:").grid(row=3, column=0, sticky=tk.W, pady=5, padx=(0, 10))
         self.output_entry = ttk.Entry(trim_frame, width=30)
-        self.output_entry.grid(row=2, column=1, columnspan=2, sticky=tk.W, pady=5)
+        self.output_entry.grid(row=3, column=1, columnspan=2, sticky=tk.W, pady=5)
+        
+        # Trim engine
+        ttk.Label(trim_frame, text="Trim Mode:").grid(row=4, column=0, sticky=tk.W, pady=5, padx=(0, 10))
+        self.mode_combo = ttk.Combobox(trim_frame, values=list(TRIM_MODES), state="readonly", width=35)
+        self.mode_combo.grid(row=4, column=1, columnspan=2, sticky=tk.W, pady=5)
+        self.mode_combo.current(0)
+        
+        # Encoder settings for the modes that re-encode
+        ttk.Label(trim_frame, text="Encoder Profile:").grid(row=5, column=0, sticky=tk.W, pady=5, padx=(0, 10))
+        self.profile_combo = ttk.Combobox(trim_frame, values=list(PROFILES), state="readonly", width=35)
+        self.profile_combo.grid(row=5, column=1, columnspan=2, sticky=tk.W, pady=5)
+        self.profile_combo.set(DEFAULT_PROFILE)
+        
+        # Segments to keep; when empty the start/end range above is trimmed
+        ttk.Label(trim_frame, text="Segments:").grid(row=6, column=0, sticky=(tk.W, tk.N), pady=5, padx=(0, 10))
+        self.segment_listbox = tk.Listbox(trim_frame, height=4, width=35)
+        self.segment_listbox.grid(row=6, column=1, sticky=tk.W, pady=5)
+        
+        segment_buttons = ttk.Frame(trim_frame)
+        segment_buttons.grid(row=6, column=2, sticky=tk.NW, padx=10, pady=5)
+        self.keep_button = ttk.Button(segment_buttons, text="Keep Range", command=self.keep_range, state=tk.DISABLED)
+        self.keep_button.grid(row=0, column=0, padx=2, pady=1)
+        self.cut_button = ttk.Button(segment_buttons, text="Cut Range", command=self.cut_range, state=tk.DISABLED)
+        self.cut_button.grid(row=0, column=1, padx=2, pady=1)
+        ttk.Button(segment_buttons, text="Remove", command=self.remove_segment).grid(row=1, column=0, padx=2, pady=1)
+        ttk.Button(segment_buttons, text="Clear", command=self.clear_segments).grid(row=1, column=1, padx=2, pady=1)
         
         # Trim button
         self.trim_button = ttk.Button(main_frame, text="Trim Video", command=self.trim_video, state=tk.DISABLED)
         self.trim_button.grid(row=7, column=0, pady=20)
+        self.cancel_trim_button = ttk.Button(main_frame, text="Cancel Trim", command=self.cancel_trim, state=tk.DISABLED)
+        self.cancel_trim_button.grid(row=7, column=1, pady=20, sticky=tk.W)
         
         # Progress label
         self.progress_label = ttk.Label(main_frame, text="", foreground="green")
@@ -133,154 +271,403 @@ class VideoTrimmer:
             self.load_video(file_path)
     
     def load_video(self, file_path):
-        """Load the selected video and update UI"""
+        """Start loading the selected video in the background
+        
+        Probing, the first frame, audio and the frame index are prepared on a
+        worker thread and each control is enabled as soon as what it needs
+        has arrived. Picking another file cancels a load still in progress.
+        """
+        # Abandon the previous load, whatever stage it reached
+        self.load_cancel.set()
+        cancel = self.load_cancel = threading.Event()
+        self.load_started = time.perf_counter()
+        self.time_to_first_frame = None
+        
+        self.close_video()
+        # Session stats cover one file; playing and seeking add to them
+        METRICS.reset()
+        self.set_controls_state(tk.DISABLED)
+        self.file_label.config(text=os.path.basename(file_path), foreground="black")
+        self.progress_label.config(text="Loading video...")
+        threading.Thread(target=self._load_worker, args=(file_path, cancel), daemon=True).start()
+    
+    def _load_worker(self, file_path, cancel):
+        """Open, decode, prepare audio and index the file, handing each result to the UI (background)"""
+        def post(callback, *args):
+            self.root.after(0, callback, cancel, *args)
+        
+        stage = "open"
         try:
-            self.progress_label.config(text="Loading video...")
-            self.root.update()
-            
-            # Clean up previous video and audio
-            if self.cap:
-                self.cap.release()
-                self.cap = None
-            if self.clip:
-                self.clip.close()
-                self.clip = None
-            try:
-                pygame.mixer.stop()
-            except Exception:
-                pass
-            try:
-                pygame.mixer.quit()
-            except Exception:
-                pass
-            if self.temp_audio_path:
-                try:
-                    os.remove(self.temp_audio_path)
-                except Exception:
-                    pass
-                self.temp_audio_path = None
-                self.audio_ready = False
-            
-            # Load video with OpenCV for playback
-            self.cap = cv2.VideoCapture(file_path)
-            
-            # Load video clip for trimming
-            self.clip = VideoFileClip(file_path)
-            self.video_path = file_path
-            self.video_duration = self.clip.duration
-            self.current_time = 0
-            
-            # Get video properties
-            fps = self.cap.get(cv2.CAP_PROP_FPS)
-            total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            
-            # Update UI
-            filename = os.path.basename(file_path)
-            self.file_label.config(text=filename, foreground="black")
-            
-            # Display first frame
-            self.display_frame_at_time(0)
-            
-            # Update time label
-            self.update_time_label()
-            
-            # Set default trim values
-            self.start_entry.delete(0, tk.END)
-            self.start_entry.insert(0, "0.00")
+            # Probe once; preview, audio and trims all share this source
+            source = MediaSource(file_path, budget=self.budget)
+            post(self._on_probed, source)
             
-            self.end_entry.delete(0, tk.END)
-            self.end_entry.insert(0, f"{self.video_duration:.2f}")
+            # The first frame also gives the size decoded frames really have
+            stage = "decode"
+            ret, frame, _ = source.read_at(0)
+            if not ret:
+                raise IOError("Cannot decode the first frame")
+            post(self._on_first_frame, frame)
             
-            # Suggest output filename
-            name_without_ext = os.path.splitext(filename)[0]
-            extension = os.path.splitext(filename)[1]
-            self.output_entry.delete(0, tk.END)
-            self.output_entry.insert(0, f"output{extension}")
-            
-            # Enable controls
-            self.play_button.config(state=tk.NORMAL)
-            self.trim_button.config(state=tk.NORMAL)
-            self.set_start_button.config(state=tk.NORMAL)
-            self.set_end_button.config(state=tk.NORMAL)
-            self.jump_back_button.config(state=tk.NORMAL)
-            self.jump_forward_button.config(state=tk.NORMAL)
-            self.timeline.state(['!disabled'])
-            self.timeline.config(to=self.video_duration)
-            
-            # If audio exists, extract in background
-            if self.clip.audio is not None:
-                self.progress_label.config(text="Extracting audio (background)...")
-                tmp = tempfile.NamedTemporaryFile(delete=False, suffix=".wav")
-                tmp.close()
-                self.temp_audio_path = tmp.name
-                threading.Thread(target=self._extract_audio, args=(self.clip, self.temp_audio_path), daemon=True).start()
-            else:
-                self.audio_ready = False
-                self.temp_audio_path = None
-            
-            self.progress_label.config(text="Video loaded successfully!")
+            # If audio exists, it is decoded on demand around the playhead
+            if source.has_audio and not cancel.is_set():
+                try:
+                    if not pygame.mixer.get_init():
+                        pygame.mixer.init(frequency=44100, size=-16, channels=2)
+                    post(self._on_audio_ready, StreamingAudio(file_path))
+                except Exception as e:
+                    post(self._on_load_note, f"Audio preview unavailable: {e}")
             
+            # Load the keyframe index from the cache, or build it in one demux pass
+            stage = "index"
+            post(self._on_index_ready, source.load_index(cancel))
+        except OperationCancelled:
+            pass
+        except Exception as e:
+            post(self._on_load_failed, stage, str(e))
+    
+    def _on_probed(self, cancel, source):
+        """Duration is known: set up the trim settings and allow trimming"""
+        if cancel.is_set():
+            source.close()
+            return
+        self.source = source
+        self.video_path = source.path
+        self.video_duration = source.duration
+        self.current_time = 0
+        self.update_time_label()
+        
+        # Set default trim values
+        self.start_entry.delete(0, tk.END)
+        self.start_entry.insert(0, "0.000")
+        
+        self.end_entry.delete(0, tk.END)
+        self.end_entry.insert(0, f"{self.video_duration:.3f}")
+        self.start_frame_label.config(text="")
+        self.end_frame_label.config(text="")
+        
+        # Segments belong to the previous video
+        self.segments = SegmentList(self.video_duration)
+        self.refresh_segments()
+        
+        # Suggest output filename
+        extension = os.path.splitext(source.path)[1]
+        self.output_entry.delete(0, tk.END)
+        self.output_entry.insert(0, f"output{extension}")
+        
+        # Trimming needs nothing but the file; the engine indexes it if needed
+        self.trim_button.config(state=tk.NORMAL)
+        self.keep_button.config(state=tk.NORMAL)
+        self.cut_button.config(state=tk.NORMAL)
+        self.timeline.config(to=self.video_duration)
+    
+    def _on_first_frame(self, cancel, frame):
+        """First frame decoded: show it and enable preview, seeking and playback"""
+        if cancel.is_set() or not self.source:
+            return
+        self.source_size = self.source.frame_size
+        # Buffers and canvas item are set up once per video
+        self.display.configure(self.source_size)
+        self.display.show_bgr(frame)
+        self.time_to_first_frame = time.perf_counter() - self.load_started
+        
+        self.play_button.config(state=tk.NORMAL)
+        self.set_start_button.config(state=tk.NORMAL)
+        self.set_end_button.config(state=tk.NORMAL)
+        self.jump_back_button.config(state=tk.NORMAL)
+        self.jump_forward_button.config(state=tk.NORMAL)
+        self.timeline.state(['!disabled'])
+        self.progress_label.config(text=f"First frame in {self.time_to_first_frame * 1000:.0f} ms, indexing...")
+    
+    def _on_audio_ready(self, cancel, audio):
+        if cancel.is_set():
+            return
+        self.audio = audio
+        self.audio_ready = True
+    
+    def _on_index_ready(self, cancel, index):
+        """Frame index loaded: frame-accurate seeking and scrub thumbnails"""
+        if cancel.is_set() or not self.source:
+            return
+        self.index = index
+        self.source.set_index(index)
+        self.frame_timeline = Timeline(index, self.video_duration)
+        self.step_back_button.config(state=tk.NORMAL)
+        self.step_forward_button.config(state=tk.NORMAL)
+        self.analyze_button.config(state=tk.NORMAL)
+        self.update_time_label()
+        # Cut points found in an earlier session show up at once
+        analysis = MediaAnalysis.load_cached(self.source.path, index)
+        if analysis is not None:
+            self._show_markers(analysis)
+        
+        # Fill the scrub cache with one thumbnail per keyframe
+        self.start_thumbnails(self.source.path)
+        
+        ready = time.perf_counter() - self.load_started
+        first_frame = f"first frame in {self.time_to_first_frame * 1000:.0f} ms, " if self.time_to_first_frame else ""
+        text = f"Video loaded successfully! ({first_frame}ready in {ready * 1000:.0f} ms)"
+        if self.source.large_file:
+            text += " - large-file mode"
+        self.progress_label.config(text=text)
+        # Heavy sources switch to a low-res proxy once it is ready
+        self.update_proxy()
+    
+    def update_proxy(self):
+        """Start or stop previewing from a proxy to match the selected preview mode"""
+        if not self.source or not self.index:
+            return
+        mode = PROXY_MODES.get(self.proxy_combo.get(), PROXY_AUTO)
+        if wants_proxy(self.source.info, mode):
+            if not self.source.proxy_path and self.proxy_cancel is None:
+                cancel = self.proxy_cancel = threading.Event()
+                self.progress_label.config(text="Building preview proxy...")
+                threading.Thread(target=self._proxy_worker, args=(self.source, cancel), daemon=True).start()
+        else:
+            self.cancel_proxy()
+            if self.source.proxy_path:
+                self.source.use_proxy(None, None)
+                self._preview_source_changed()
+    
+    def _proxy_worker(self, source, cancel):
+        """Transcode the proxy, or find it in the cache, and hand it to the UI (background)"""
+        started = time.perf_counter()
+        try:
+            proxy_path, proxy_index = build_proxy(source.path, source.info, source.index, cancel, self.budget)
+            self.root.after(0, self._on_proxy_ready, cancel, source, proxy_path, proxy_index,
+                            time.perf_counter() - started)
+        except OperationCancelled:
+            pass
         except Exception as e:
-            messagebox.showerror("Error", f"Failed to load video:\n{str(e)}")
-            self.progress_label.config(text="")
+            self.root.after(0, self._on_proxy_failed, cancel, str(e))
+    
+    def cancel_proxy(self):
+        """Abandon the proxy build in progress, if any"""
+        if self.proxy_cancel:
+            self.proxy_cancel.set()
+            self.proxy_cancel = None
+    
+    def _on_proxy_ready(self, cancel, source, proxy_path, proxy_index, elapsed):
+        """Proxy ready: preview, scrub and seek decode it from now on"""
+        if cancel.is_set() or source is not self.source:
+            return
+        self.proxy_cancel = None
+        self.source.use_proxy(proxy_path, proxy_index)
+        self._preview_source_changed()
+        # Thumbnails still missing come from the proxy's keyframes, which decode much faster
+        self.stop_thumbnails()
+        self.start_thumbnails(proxy_path)
+        self.progress_label.config(text=f"Previewing from proxy (ready in {elapsed:.1f}s); trims use the original")
+    
+    def _on_proxy_failed(self, cancel, error_msg):
+        if cancel.is_set():
+            return
+        # The preview keeps decoding the original
+        self.proxy_cancel = None
+        self.progress_label.config(text=f"Preview proxy unavailable: {error_msg}")
     
-    def _extract_audio(self, clip, path):
-        """Extract audio to a WAV file (background)"""
+    def find_cut_points(self):
+        """Look for scene changes and silences in the background, or stop looking"""
+        if self.analysis_cancel is not None:
+            self.cancel_analysis()
+            self.progress_label.config(text="Finding cut points stopped")
+            return
+        if not self.source or not self.index:
+            return
+        cancel = self.analysis_cancel = threading.Event()
+        self.analyze_button.config(text="Stop Finding")
+        self.progress_label.config(text="Finding cut points...")
+        threading.Thread(target=self._analysis_worker, args=(self.source, cancel), daemon=True).start()
+    
+    def _analysis_worker(self, source, cancel):
+        """Analyze the whole file once and hand the result to the UI (background)"""
+        def progress(fraction):
+            self.root.after(0, self._on_analysis_progress, cancel, fraction)
+        
+        started = time.perf_counter()
         try:
-            # Write audio to a wav file. This may take time for long files.
-            clip.audio.write_audiofile(path, fps=44100, codec='pcm_s16le', verbose=False, logger=None)
-            self.temp_audio_path = path
-            # Initialize pygame mixer
-            try:
-                pygame.mixer.init(frequency=44100)
-            except Exception:
-                pass
-            # Load into pygame.mixer on main thread
-            def _load():
-                try:
-                    pygame.mixer.music.load(self.temp_audio_path)
-                    self.audio_ready = True
-                    self.progress_label.config(text="Audio ready for preview.")
-                except Exception as e:
-                    self.audio_ready = False
-                    self.progress_label.config(text=f"Audio load failed: {e}")
-            self.root.after(0, _load)
+            # A proxy has the same frames and decodes much faster
+            analysis = MediaAnalysis.load_or_analyze(source.path, source.index, source.has_audio,
+                                                     video_path=source.proxy_path, cancel=cancel,
+                                                     progress=progress)
+            self.root.after(0, self._on_analysis_ready, cancel, source, analysis, time.perf_counter() - started)
+        except OperationCancelled as e:
+            # Only the user stops an analysis; anything else is a failure
+            if not cancel.is_set():
+                self.root.after(0, self._on_analysis_failed, cancel, str(e))
         except Exception as e:
-            self.audio_ready = False
-            self.root.after(0, lambda: self.progress_label.config(text=f"Audio extraction failed: {e}"))
+            self.root.after(0, self._on_analysis_failed, cancel, str(e))
+    
+    def cancel_analysis(self):
+        """Stop the analysis in progress, if any"""
+        if self.analysis_cancel:
+            self.analysis_cancel.set()
+            self.analysis_cancel = None
+            self.analyze_button.config(text="Find Cut Points")
+    
+    def _on_analysis_progress(self, cancel, fraction):
+        if cancel is self.analysis_cancel and not cancel.is_set():
+            self.progress_label.config(text=f"Finding cut points... {fraction * 100:.0f}%")
+    
+    def _on_analysis_ready(self, cancel, source, analysis, elapsed):
+        if cancel.is_set() or source is not self.source:
+            return
+        self.analysis_cancel = None
+        self.analyze_button.config(text="Find Cut Points")
+        self._show_markers(analysis)
+        speed = self.video_duration / elapsed if elapsed > 0 else 0.0
+        self.progress_label.config(text=f"Cut points found in {elapsed:.1f}s ({speed:.1f}x realtime)")
+    
+    def _on_analysis_failed(self, cancel, error_msg):
+        if cancel.is_set():
+            return
+        self.analysis_cancel = None
+        self.analyze_button.config(text="Find Cut Points")
+        self.progress_label.config(text=f"Finding cut points failed: {error_msg}")
+    
+    def _show_markers(self, analysis):
+        """Put the suggested cut points of an analysis on the timeline"""
+        if not self.frame_timeline:
+            return
+        self.frame_timeline.set_markers(analysis.markers(self.index))
+        markers = self.frame_timeline.markers
+        scenes = sum(1 for _, kind in markers if kind == MARKER_SCENE)
+        self.markers_label.config(text=f"{scenes} scene changes, {len(markers) - scenes} silences")
+        state = tk.NORMAL if markers else tk.DISABLED
+        self.prev_marker_button.config(state=state)
+        self.next_marker_button.config(state=state)
+        self.draw_markers()
+    
+    def draw_markers(self):
+        """Draw a tick per suggested cut point, lined up with the slider"""
+        self.marker_canvas.delete("all")
+        if not self.frame_timeline or not self.video_duration:
+            return
+        width = self.marker_canvas.winfo_width()
+        for boundary, kind in self.frame_timeline.markers:
+            x = self.frame_timeline.seconds(boundary) / self.video_duration * width
+            self.marker_canvas.create_line(x, 0, x, 10, fill=MARKER_COLORS.get(kind, "gray"), width=2)
+    
+    def on_marker_click(self, event):
+        """Go to the suggested cut point nearest to the click"""
+        if not self.frame_timeline or not self.frame_timeline.markers or not self.video_duration:
+            return
+        width = max(1, self.marker_canvas.winfo_width())
+        boundary = self.frame_timeline.boundary_at(event.x / width * self.video_duration)
+        self.seek_to_boundary(self.frame_timeline.snap(boundary, SNAP_MARKER))
+    
+    def jump_to_marker(self, direction):
+        """Go to the next suggested cut point after, or before, the frame on screen"""
+        if not self.frame_timeline:
+            return
+        boundary = self.frame_timeline.next_marker(self.frame_timeline.frame_at(self.current_time), direction)
+        if boundary is not None:
+            self.seek_to_boundary(boundary)
+    
+    def seek_to_boundary(self, boundary):
+        """Pause and show the frame starting at a cut point"""
+        if self.is_playing:
+            self.toggle_play()
+        self.current_time = self.frame_timeline.seconds(min(boundary, self.frame_timeline.frame_count - 1))
+        self.timeline.set(self.current_time)
+        if self.scrub_after_id:
+            self.root.after_cancel(self.scrub_after_id)
+            self.scrub_after_id = None
+        self.display_frame_at_time(self.current_time)
+        self.update_time_label()
+    
+    def _preview_source_changed(self):
+        """Redraw the current frame and restart playback from the file the preview now decodes"""
+        if self.is_playing:
+            self.start_player(self.current_time)
+        else:
+            self.display_frame_at_time(self.current_time)
+    
+    def _on_load_note(self, cancel, text):
+        if not cancel.is_set():
+            self.progress_label.config(text=text)
+    
+    def _on_load_failed(self, cancel, stage, error_msg):
+        if cancel.is_set():
+            return
+        if stage == "index":
+            # Preview and trimming work without the index, only less precisely
+            reason = error_msg.splitlines()[0] if error_msg else "unknown error"
+            self.progress_label.config(text=f"Video loaded (frame index unavailable: {reason})")
+            return
+        self.close_video()
+        self.set_controls_state(tk.DISABLED)
+        messagebox.showerror("Error", f"Failed to load video:\n{error_msg}")
+        self.progress_label.config(text="")
+    
+    def close_video(self):
+        """Stop playback and release everything belonging to the current video"""
+        self.is_playing = False
+        self.play_button.config(text="▶ Play")
+        self.cancel_proxy()
+        self.cancel_analysis()
+        self.stop_player()
+        self.stop_thumbnails()
+        self._stop_audio()
+        self.audio = None
+        self.audio_ready = False
+        if self.source:
+            self.source.close()
+            self.source = None
+        self.index = None
+        self.frame_timeline = None
+        self.marker_canvas.delete("all")
+        self.markers_label.config(text="")
+        for widget in (self.analyze_button, self.prev_marker_button, self.next_marker_button):
+            widget.config(state=tk.DISABLED)
+    
+    def set_controls_state(self, state):
+        """Enable or disable every control that needs a loaded video"""
+        for widget in (self.play_button, self.trim_button, self.set_start_button, self.set_end_button,
+                       self.keep_button, self.cut_button, self.jump_back_button, self.jump_forward_button,
+                       self.step_back_button, self.step_forward_button):
+            widget.config(state=state)
+        self.timeline.state(['!disabled' if state == tk.NORMAL else 'disabled'])
+    
+    def start_thumbnails(self, decode_path):
+        """Build scrub thumbnails of the video from decode_path, within the memory budget"""
+        self.thumbnails = open_thumbnail_cache(self.source.path, self.budget.thumbnail_bytes(),
+                                               max_disk_bytes=self.budget.thumbnail_disk_bytes())
+        self.thumbnail_builder = ThumbnailBuilder(decode_path, self.index, self.thumbnails, self.source_size,
+                                                  self.budget.thumbnail_interval(self.source.info))
+        self.thumbnail_builder.start()
+    
+    def _release_idle(self):
+        """Close the decoders nobody has used for a while, and drop caches when over the memory budget"""
+        if self.source:
+            self.source.release_idle()
+            if self.budget.over_memory():
+                self.drop_caches()
+            else:
+                self.memory_warned = False
+        self.root.after(IDLE_CHECK_MS, self._release_idle)
+    
+    def drop_caches(self):
+        """Give memory back when the process is over its budget; whatever is dropped comes back on demand"""
+        if self.thumbnails:
+            self.thumbnails.release_memory()
+        self.source.release_idle(0)
+        METRICS.count("cache_drops")
+        if not self.memory_warned:
+            self.memory_warned = True
+            self.progress_label.config(
+                text=f"Over the {format_size(self.budget.memory_bytes)} memory budget: preview caches dropped")
     
     def display_frame_at_time(self, time_sec):
         """Display a specific frame from the video"""
         try:
             # Set video to specific time
-            self.cap.set(cv2.CAP_PROP_POS_MSEC, time_sec * 1000)
-            ret, frame = self.cap.read()
+            ret, frame, _ = self.source.read_at(time_sec)
             
             if ret:
-                # Convert BGR to RGB
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                
-                # Resize frame to fit canvas
-                height, width = frame.shape[:2]
-                canvas_width = 640
-                canvas_height = 360
-                
-                # Calculate scaling
-                scale = min(canvas_width / width, canvas_height / height)
-                new_width = int(width * scale)
-                new_height = int(height * scale)
-                
-                frame = cv2.resize(frame, (new_width, new_height))
-                
-                # Convert to PhotoImage
-                img = Image.fromarray(frame)
-                self.current_frame = ImageTk.PhotoImage(image=img)
-                
-                # Display on canvas
-                self.canvas.delete("all")
-                x = (canvas_width - new_width) // 2
-                y = (canvas_height - new_height) // 2
-                self.canvas.create_image(x, y, anchor=tk.NW, image=self.current_frame)
+                self.display.show_bgr(frame)
+                if self.stats_var.get():
+                    self.update_overlay()
                 
         except Exception as e:
             print(f"Error displaying frame: {e}")
@@ -290,108 +677,155 @@ class VideoTrimmer:
         if self.is_playing:
             self.is_playing = False
             self.play_button.config(text="▶ Play")
+            self.stop_player()
             # Stop audio if playing
-            try:
-                pygame.mixer.music.stop()
-            except Exception:
-                pass
+            self._stop_audio()
         else:
             self.is_playing = True
             self.play_button.config(text="⏸ Pause")
-            # Start audio (if ready) at current time
-            if self.audio_ready and self.temp_audio_path:
-                try:
-                    self.play_audio_from(self.current_time)
-                except Exception:
-                    pass
+            self.start_player(self.current_time)
             self.play_video()
     
+    def stop_thumbnails(self):
+        """Stop building scrub thumbnails and drop the in-memory cache"""
+        if self.thumbnail_builder:
+            self.thumbnail_builder.stop()
+            self.thumbnail_builder = None
+        if self.thumbnails:
+            self.thumbnails.close()
+            self.thumbnails = None
+    
+    def start_player(self, start_time):
+        """Start decoding ahead from start_time, with audio (if ready) as the clock"""
+        self.stop_player()
+        self.player = DecodeAheadPlayer(self.source.preview_path, self.source.preview_index, start_time,
+                                        self.display.size, decoders=self.source.decoders)
+        self.display.reset_stats()
+        self.tick_due = None
+        self.player.start()
+        audio_started = False
+        if self.audio_ready:
+            try:
+                self.play_audio_from(start_time)
+                audio_started = True
+            except Exception:
+                pass
+        self.clock = PlaybackClock(start_time, audio=self.audio if audio_started else None)
+    
+    def stop_player(self):
+        """Stop the decode-ahead thread and report dropped frames"""
+        if not self.player:
+            return
+        self.player.stop()
+        if self.metrics_log:
+            self.metrics_log.write("playback", shown=self.player.shown, dropped=self.player.dropped,
+                                   late=self.player.late)
+        if self.player.dropped or self.player.late:
+            self.progress_label.config(
+                text=f"Playback: {self.player.shown} frames shown, "
+                     f"{self.player.dropped} dropped, {self.player.late} late, {self.display.stats_text()}")
+        # Let go of the wrappers of the player's frame buffers
+        self.display.clear()
+        self.player = None
+    
     def play_audio_from(self, start_time):
-        """Play audio WAV starting from given time (non-blocking) using pygame."""
-        if not self.audio_ready or not self.temp_audio_path:
+        """Play audio starting from given time (non-blocking), decoding only from there on"""
+        if not self.audio_ready or not self.audio:
             return
         try:
+            self.audio.play(start_time)
+        except Exception as e:
+            print(f"Audio playback error: {e}")
+    
+    def _stop_audio(self):
+        """Stop the audio preview if it is playing"""
+        if self.audio:
             try:
-                pygame.mixer.music.stop()
+                self.audio.stop()
             except Exception:
                 pass
-            # pygame 2 supports 'start' parameter
-            try:
-                pygame.mixer.music.play(loops=0, start=start_time)
-            except TypeError:
-                # fallback: play then set position (may not work for all formats)
-                pygame.mixer.music.play(loops=0)
-                try:
-                    pygame.mixer.music.set_pos(start_time)
-                except Exception:
-                    pass
-        except Exception as e:
-            print(f"Audio playback error: {e}")
     
     def play_video(self):
-        """Play video frames"""
-        if not self.is_playing or not self.cap:
+        """Show the frame due at the playback clock and schedule the next tick"""
+        if not self.is_playing or not self.player:
             return
         
-        fps = self.cap.get(cv2.CAP_PROP_FPS)
-        try:
-            frame_delay = int(1000 / fps) if fps and fps > 0 else 33
-        except Exception:
-            frame_delay = 33
-        
-        ret, frame = self.cap.read()
+        started = time.perf_counter()
+        # How much later than asked Tk ran this tick
+        if self.tick_due is not None:
+            METRICS.record("tk_late", max(0.0, started - self.tick_due))
+        now = self.clock.now()
+        frame_duration = self.source.frame_duration
+        taken = self.player.frame_for(now, frame_duration)
         
-        if ret:
-            self.current_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+        if taken is not None:
+            slot, frame_time = taken
+            self.current_time = frame_time
             
-            # Display frame
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            height, width = frame.shape[:2]
-            canvas_width = 640
-            canvas_height = 360
-            scale = min(canvas_width / width, canvas_height / height)
-            new_width = int(width * scale)
-            new_height = int(height * scale)
-            frame = cv2.resize(frame, (new_width, new_height))
-            
-            img = Image.fromarray(frame)
-            self.current_frame = ImageTk.PhotoImage(image=img)
-            
-            self.canvas.delete("all")
-            x = (canvas_width - new_width) // 2
-            y = (canvas_height - new_height) // 2
-            self.canvas.create_image(x, y, anchor=tk.NW, image=self.current_frame)
+            # Display frame; PhotoImage copies the pixels so the slot can be reused at once
+            self.display.show_rgba(self.player.slots[slot])
+            self.player.release(slot)
             
             # Update timeline and time label
             self.timeline.set(self.current_time)
             self.update_time_label()
-            
-            # Schedule next frame
-            self.root.after(frame_delay, self.play_video)
-        else:
+        elif self.player.exhausted:
             # Video ended
             self.is_playing = False
             self.play_button.config(text="▶ Play")
+            self.stop_player()
             self.current_time = 0
-            self.cap.set(cv2.CAP_PROP_POS_MSEC, 0)
             # Stop audio
-            try:
-                pygame.mixer.music.stop()
-            except Exception:
-                pass
+            self._stop_audio()
+            return
+        
+        if self.stats_var.get() and started - self.overlay_updated >= OVERLAY_REFRESH_S:
+            self.update_overlay()
+        
+        # Wake up when the next buffered frame is due
+        due = self.player.next_due()
+        delay = max(1, min(int((due - self.clock.now()) * 1000) if due is not None else 5, 50))
+        finished = time.perf_counter()
+        METRICS.record("tick", finished - started)
+        self.tick_due = finished + delay / 1000
+        self.root.after(delay, self.play_video)
+    
+    def update_overlay(self):
+        """Draw the live stage timings over the preview, or remove them when stats are off"""
+        self.overlay_updated = time.perf_counter()
+        if self.stats_var.get():
+            self.display.set_overlay(METRICS.overlay_lines(OVERLAY_STAGES))
+        else:
+            self.display.set_overlay([])
+    
+    def reset_stats(self):
+        """Start the stage timings and counters over"""
+        METRICS.reset()
+        self.display.reset_stats()
+        self.update_overlay()
     
     def on_timeline_change(self, value):
         """Handle timeline slider change"""
         if not self.is_playing:
             time_sec = float(value)
             self.current_time = time_sec
-            self.display_frame_at_time(time_sec)
+            # Show the nearest cached thumbnail now and decode the exact frame once the slider settles
+            if self.thumbnails and self.index:
+                nearest = self.thumbnails.nearest(self.index.frame_at(time_sec))
+                if nearest is not None:
+                    self.display.show_thumbnail(nearest[1])
+            if self.scrub_after_id:
+                self.root.after_cancel(self.scrub_after_id)
+            self.scrub_after_id = self.root.after(SCRUB_SETTLE_MS, self._settle_scrub)
             self.update_time_label()
             # Stop audio if it was playing (we are not in playing mode here)
-            try:
-                pygame.mixer.music.stop()
-            except Exception:
-                pass
+            self._stop_audio()
+    
+    def _settle_scrub(self):
+        """Decode the exact frame under the slider once scrubbing pauses"""
+        self.scrub_after_id = None
+        if self.source and not self.is_playing:
+            self.display_frame_at_time(self.current_time)
     
     def update_time_label(self):
         """Update the time display label"""
@@ -401,60 +835,151 @@ class VideoTrimmer:
         total_min = int(self.video_duration // 60)
         total_sec = self.video_duration % 60
         
-        self.time_label.config(text=f"{current_min:02d}:{current_sec:05.2f} / {total_min:02d}:{total_sec:05.2f}")
+        text = f"{current_min:02d}:{current_sec:05.2f} / {total_min:02d}:{total_sec:05.2f}"
+        if self.frame_timeline:
+            text += f"  frame {self.frame_timeline.frame_at(self.current_time)} / {self.frame_timeline.frame_count}"
+        self.time_label.config(text=text)
     
     def set_start_to_current(self):
-        """Set start time to current playback position"""
-        self.start_entry.delete(0, tk.END)
-        self.start_entry.insert(0, f"{self.current_time:.2f}")
+        """Set start to the frame on screen, snapped as selected"""
+        self._set_cut_entry(self.start_entry, self.start_frame_label)
     
     def set_end_to_current(self):
-        """Set end time to current playback position"""
-        self.end_entry.delete(0, tk.END)
-        self.end_entry.insert(0, f"{self.current_time:.2f}")
+        """Set end to the frame on screen, snapped as selected; that frame is not kept"""
+        self._set_cut_entry(self.end_entry, self.end_frame_label)
+    
+    def _set_cut_entry(self, entry, label):
+        if self.frame_timeline:
+            boundary = self._cut_point(self.frame_timeline.frame_at(self.current_time))
+            cut_time = self.frame_timeline.seconds(boundary)
+            label.config(text=f"frame {boundary}")
+        else:
+            cut_time = self.current_time
+            label.config(text="")
+        entry.delete(0, tk.END)
+        entry.insert(0, f"{cut_time:.3f}")
+    
+    def _cut_point(self, boundary):
+        """Snap a frame boundary to the selected kind of cut point"""
+        return self.frame_timeline.snap(boundary, SNAP_MODES.get(self.snap_combo.get(), SNAP_FRAME))
+    
+    def _entry_range(self):
+        """Read and validate the start/end entries; shows an error and returns None if invalid
+        
+        With the frame index loaded both entries are moved onto the nearest
+        frame boundary (or keyframe), and the exact times of those
+        boundaries are returned, so the trim cuts exactly those frames.
+        """
+        try:
+            start_time = float(self.start_entry.get())
+            end_time = float(self.end_entry.get())
+        except ValueError:
+            messagebox.showerror("Error", "Please enter valid numbers for start and end times!")
+            return None
+        if self.frame_timeline:
+            start = self._cut_point(self.frame_timeline.boundary_at(start_time))
+            end = self._cut_point(self.frame_timeline.boundary_at(end_time))
+            start_time, end_time = self.frame_timeline.seconds(start), self.frame_timeline.seconds(end)
+            self.start_frame_label.config(text=f"frame {start}")
+            self.end_frame_label.config(text=f"frame {end}")
+        try:
+            check_trim_range(start_time, end_time, self.video_duration)
+        except TrimError as e:
+            messagebox.showerror("Error", str(e))
+            return None
+        return start_time, end_time
+    
+    def keep_range(self):
+        """Add the start/end range to the segments to keep"""
+        entry_range = self._entry_range()
+        if entry_range:
+            self.segments.add_keep(*entry_range)
+            self.refresh_segments()
+    
+    def cut_range(self):
+        """Remove the start/end range from the segments to keep"""
+        entry_range = self._entry_range()
+        if entry_range:
+            try:
+                self.segments.add_cut(*entry_range)
+            except ValueError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            self.refresh_segments()
+    
+    def remove_segment(self):
+        """Remove the selected segment"""
+        selection = self.segment_listbox.curselection()
+        if selection:
+            self.segments.remove(selection[0])
+            self.refresh_segments()
+    
+    def clear_segments(self):
+        """Remove all segments, going back to a single start/end trim"""
+        self.segments.clear()
+        self.refresh_segments()
+    
+    def refresh_segments(self):
+        """Show the kept segments in the list"""
+        self.segment_listbox.delete(0, tk.END)
+        for start_time, end_time in self.segments:
+            text = f"{start_time:.3f} - {end_time:.3f}  ({end_time - start_time:.3f}s"
+            if self.frame_timeline:
+                first, end = self.frame_timeline.frame_range(start_time, end_time)
+                text += f", {end - first} frames"
+            self.segment_listbox.insert(tk.END, text + ")")
     
     def jump(self, seconds):
         """Jump forward or backward by seconds, updating audio/video"""
-        if not self.clip or not self.cap:
+        if not self.source:
             return
         new_time = self.current_time + seconds
         new_time = max(0.0, min(self.video_duration, new_time))
         self.current_time = new_time
-        self.cap.set(cv2.CAP_PROP_POS_MSEC, new_time * 1000)
         self.display_frame_at_time(new_time)
         self.timeline.set(new_time)
         self.update_time_label()
-        # If currently playing, restart audio from new position
-        if self.is_playing and self.audio_ready and self.temp_audio_path:
-            try:
-                pygame.mixer.music.stop()
-            except Exception:
-                pass
-            try:
-                self.play_audio_from(new_time)
-            except Exception:
-                pass
+        # If currently playing, restart decoding and audio from the new position
+        if self.is_playing:
+            self.start_player(new_time)
+    
+    def step_frame(self, count):
+        """Pause and move count frames forward or backward, showing the exact frame"""
+        if not self.source or not self.frame_timeline:
+            return
+        if self.is_playing:
+            self.toggle_play()
+        frame = self.frame_timeline.step(self.frame_timeline.frame_at(self.current_time), count)
+        self.current_time = self.frame_timeline.seconds(frame)
+        self.timeline.set(self.current_time)
+        # Show the exact frame now instead of after the scrub delay
+        if self.scrub_after_id:
+            self.root.after_cancel(self.scrub_after_id)
+            self.scrub_after_id = None
+        self.display_frame_at_time(self.current_time)
+        self.update_time_label()
     
     def trim_video(self):
         """Trim the video based on start and end times"""
-        if not self.clip:
+        if not self.source:
             messagebox.showwarning("Warning", "Please select a video first!")
             return
+        if self.trim_cancel is not None:
+            messagebox.showwarning("Warning", "A trim is already running!")
+            return
         
         try:
-            # Get trim times
-            start_time = float(self.start_entry.get())
-            end_time = float(self.end_entry.get())
             output_name = self.output_entry.get()
+            mode = TRIM_MODES.get(self.mode_combo.get(), MODE_REENCODE)
+            profile = self.profile_combo.get() or DEFAULT_PROFILE
             
-            # Validate inputs
-            if start_time < 0 or end_time > self.video_duration:
-                messagebox.showerror("Error", "Trim times are out of video duration range!")
-                return
-            
-            if start_time >= end_time:
-                messagebox.showerror("Error", "Start time must be less than end time!")
-                return
+            # Get trim times; the start/end entries are ignored when segments are listed
+            segments = list(self.segments)
+            if not segments:
+                entry_range = self._entry_range()
+                if entry_range is None:
+                    return
+                segments = [entry_range]
             
             if not output_name:
                 messagebox.showerror("Error", "Please enter an output filename!")
@@ -466,10 +991,12 @@ class VideoTrimmer:
             
             # Disable button during processing
             self.trim_button.config(state=tk.DISABLED)
+            self.cancel_trim_button.config(state=tk.NORMAL)
             self.progress_label.config(text="Trimming video... This may take a while.")
             
             # Run trimming in a separate thread to keep UI responsive
-            thread = threading.Thread(target=self.process_trim, args=(start_time, end_time, output_path))
+            cancel = self.trim_cancel = threading.Event()
+            thread = threading.Thread(target=self.process_trim, args=(segments, output_path, mode, profile, cancel))
             thread.start()
             
         except ValueError:
@@ -479,57 +1006,73 @@ class VideoTrimmer:
             messagebox.showerror("Error", f"An error occurred:\n{str(e)}")
             self.trim_button.config(state=tk.NORMAL)
     
-    def process_trim(self, start_time, end_time, output_path):
+    def process_trim(self, segments, output_path, mode=MODE_REENCODE, profile=DEFAULT_PROFILE, cancel=None):
         """Process the video trimming in a separate thread"""
+        def progress(event):
+            self.root.after(0, self._on_trim_progress, cancel, event)
+        
         try:
-            # Create trimmed clip
-            trimmed_clip = self.clip.subclip(start_time, end_time)
-            
-            # Write to file
-            trimmed_clip.write_videofile(output_path, codec="libx264", audio_codec="aac")
-            
-            # Close clips
-            trimmed_clip.close()
+            # All kept segments go into one output in a single pass
+            result = self.source.trim(segments, output_path, mode, profile=profile, progress=progress,
+                                      cancel=cancel)
             
             # Update UI on main thread
-            self.root.after(0, self.trim_complete, output_path)
+            self.root.after(0, self.trim_complete, output_path, result)
             
+        except OperationCancelled:
+            self.root.after(0, self.trim_cancelled)
         except Exception as e:
             self.root.after(0, self.trim_error, str(e))
     
-    def trim_complete(self, output_path):
+    def _on_trim_progress(self, cancel, event):
+        if cancel is self.trim_cancel and not cancel.is_set():
+            self.progress_label.config(text=f"Trimming video... {event}")
+    
+    def cancel_trim(self):
+        """Stop the running trim; its partial output is removed"""
+        if self.trim_cancel is not None:
+            self.trim_cancel.set()
+            self.cancel_trim_button.config(state=tk.DISABLED)
+            self.progress_label.config(text="Cancelling trim...")
+    
+    def _trim_finished(self):
+        self.trim_cancel = None
+        self.cancel_trim_button.config(state=tk.DISABLED)
+        self.trim_button.config(state=tk.NORMAL)
+    
+    def trim_cancelled(self):
+        """Called when the trim was stopped with Cancel Trim"""
+        self._trim_finished()
+        self.progress_label.config(text="Trim cancelled")
+    
+    def trim_complete(self, output_path, result=None):
         """Called when trimming is complete"""
-        self.progress_label.config(text=f"Video trimmed successfully!")
+        self._trim_finished()
+        if result is not None:
+            text = f"Video trimmed successfully! {result.summary()}"
+            if self.stats_var.get() and result.stages:
+                text += f" [{result.stages_text()}]"
+            self.progress_label.config(text=text)
+            if self.metrics_log:
+                self.metrics_log.write("trim", output=output_path, mode=result.mode,
+                                       elapsed=round(result.elapsed, 3), trim_stages=result.stages)
+        else:
+            self.progress_label.config(text="Video trimmed successfully!")
         messagebox.showinfo("Success", f"Video saved to:\n{output_path}")
-        self.trim_button.config(state=tk.NORMAL)
     
     def trim_error(self, error_msg):
         """Called when trimming fails"""
+        self._trim_finished()
         self.progress_label.config(text="Trimming failed!")
         messagebox.showerror("Error", f"Failed to trim video:\n{error_msg}")
-        self.trim_button.config(state=tk.NORMAL)
     
     def cleanup(self):
         """Clean up resources when closing"""
-        self.is_playing = False
-        if self.cap:
-            self.cap.release()
-            self.cap = None
-        if self.clip:
-            self.clip.close()
-            self.clip = None
-        try:
-            pygame.mixer.music.stop()
-        except Exception:
-            pass
+        self.load_cancel.set()
+        if self.trim_cancel is not None:
+            self.trim_cancel.set()
+        self.close_video()
         try:
             pygame.mixer.quit()
         except Exception:
-            pass
-        if self.temp_audio_path:
-            try:
-                os.remove(self.temp_audio_path)
-            except Exception:
-                pass
-            self.temp_audio_path = None
-            self.audio_ready = False
\ No newline at end of file
+            pass
\ No newline at end of file
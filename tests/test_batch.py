@@ -0,0 +1,31 @@
+import json
+import os
+
+from src.batch import Journal, TrimJob, run_batch
+from src.trim_engine import MODE_COPY
+from tests.test_trim_engine import make_source
+
+
+def test_resume_skips_jobs_the_journal_marks_done(tmp_path, monkeypatch):
+    monkeypatch.setenv("VIDEO_TRIMMER_CACHE", str(tmp_path / "cache"))
+    source = str(tmp_path / "source.mp4")
+    make_source(source)
+    jobs = [TrimJob(str(n), source, 0.0, 2.0, str(tmp_path / f"out{n}.mp4"), MODE_COPY) for n in range(1, 4)]
+
+    # A crash after job 1 finished, while job 2 was being recorded
+    open(jobs[0].output, "wb").close()
+    journal_path = str(tmp_path / "jobs.journal.jsonl")
+    with open(journal_path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"job_id": "1", "status": "done", "output": jobs[0].output}) + "\n")
+        f.write('{"job_id": "2", "status": "do')
+
+    events = []
+    summary = run_batch(jobs, Journal(journal_path), workers=1, report=lambda message: None,
+                        progress=lambda job, event: events.append(job.job_id))
+
+    assert (summary.skipped, summary.done, summary.failed) == (1, 2, 0)
+    # The finished job was not run again
+    assert os.path.getsize(jobs[0].output) == 0
+    assert all(os.path.getsize(job.output) > 0 for job in jobs[1:])
+    assert set(Journal(journal_path).done) == {"1", "2", "3"}
+    assert "1" not in events
@@ -0,0 +1,81 @@
+import http.client
+import json
+
+import pytest
+
+from src.batch import TrimJob
+from src.service import MAX_BODY_BYTES, JobQueue, QueueFull, TrimService, serve_api
+from src.trim_engine import MODE_COPY
+
+
+def make_job(name, priority=0):
+    return TrimJob(name, f"{name}.mp4", 0.0, 1.0, f"{name}_cut.mp4", MODE_COPY, priority=priority)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.db"), max_queued=3)
+    yield queue
+    queue.close()
+
+
+def test_queue_claims_by_priority_then_submission(queue):
+    queue.submit([make_job("low"), make_job("high", priority=5)])
+    queue.submit([make_job("middle", priority=1)])
+
+    claimed = [queue.claim()[1].input for _ in range(3)]
+
+    assert claimed == ["high.mp4", "middle.mp4", "low.mp4"]
+    assert queue.claim() is None
+
+
+def test_queue_full_rejects_the_whole_submission(queue):
+    queue.submit([make_job("a"), make_job("b")])
+
+    with pytest.raises(QueueFull):
+        queue.submit([make_job("c"), make_job("d")])
+    assert queue.counts()["queued"] == 2
+
+    # Claimed jobs no longer count against the limit
+    queue.claim()
+    queue.submit([make_job("c"), make_job("d")])
+    assert queue.counts()["queued"] == 3
+
+
+@pytest.fixture
+def api(queue):
+    # The service is never started, so submitted jobs only go into the queue
+    server = serve_api(TrimService(queue), port=0)
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def post_jobs(address, body, length):
+    connection = http.client.HTTPConnection(*address, timeout=5)
+    connection.putrequest("POST", "/jobs")
+    if length is not None:
+        connection.putheader("Content-Length", str(length))
+    connection.endheaders(body)
+    response = connection.getresponse()
+    status, data = response.status, json.loads(response.read())
+    connection.close()
+    return status, data
+
+
+@pytest.mark.parametrize("length, status", [(None, 400), (-1, 400), ("x", 400), (MAX_BODY_BYTES + 1, 413)])
+def test_post_rejects_bad_content_length(api, queue, length, status):
+    body = json.dumps({"input": "a.mp4", "start": 0, "end": 1, "output": "b.mp4"}).encode()
+
+    assert post_jobs(api, body, length)[0] == status
+    assert queue.counts()["queued"] == 0
+
+
+def test_post_queues_jobs(api, queue):
+    body = json.dumps([{"input": "a.mp4", "start": 0, "end": 1, "output": "b.mp4"}]).encode()
+
+    status, data = post_jobs(api, body, len(body))
+
+    assert status == 201
+    assert len(data["ids"]) == 1
+    assert queue.counts()["queued"] == 1
@@ -0,0 +1,154 @@
+import os
+
+import cv2
+import pytest
+
+from src.ffmpeg_utils import probe_media, run_ffmpeg
+from src.media_index import MediaIndex
+from src.segments import SegmentList
+from src.timeline import SNAP_FRAME, SNAP_KEYFRAME, Timeline
+from src.trim_engine import MODE_COPY, MODE_PARALLEL, MODE_REENCODE, MODE_SMART, TrimError, trim, trim_segments
+
+FPS = 25
+
+
+def make_source(path, seconds=6):
+    """Short H.264 + AAC clip with a keyframe every two seconds"""
+    run_ffmpeg(["-f", "lavfi", "-i", f"testsrc=size=160x90:rate={FPS}:duration={seconds}",
+                "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+                "-c:v", "libx264", "-g", str(2 * FPS), "-pix_fmt", "yuv420p", "-c:a", "aac", "-shortest", path])
+
+
+def decoded_frames(path):
+    """Number of frames a player shows, which leaves out packets the edit list hides"""
+    cap = cv2.VideoCapture(path)
+    count = 0
+    while cap.grab():
+        count += 1
+    cap.release()
+    return count
+
+
+def test_smart_trim_with_relative_paths(tmp_path, monkeypatch):
+    monkeypatch.setenv("VIDEO_TRIMMER_CACHE", str(tmp_path / "cache"))
+    monkeypatch.chdir(tmp_path)
+    make_source("source.mp4")
+
+    # Cut points away from the keyframes, so both edges are re-encoded
+    result = trim("source.mp4", 0.6, 4.6, "out.mp4", mode=MODE_SMART)
+
+    assert result.mode == MODE_SMART
+    assert os.path.isfile(tmp_path / "out.mp4")
+    assert MediaIndex.build("out.mp4").frame_count == 4 * FPS
+
+
+def test_reencode_keeps_the_last_frame(tmp_path, monkeypatch):
+    monkeypatch.setenv("VIDEO_TRIMMER_CACHE", str(tmp_path / "cache"))
+    source = str(tmp_path / "source.mp4")
+    make_source(source, seconds=12)
+
+    for n, segments in enumerate(([(2.6, 8.4)], [(1, 3), (5, 7.2), (9, 12)])):
+        events = []
+        output = str(tmp_path / f"out{n}.mp4")
+        trim_segments(source, segments, output, mode=MODE_REENCODE, progress=events.append)
+
+        total_frames = events[-1].total_frames
+        assert total_frames == round(sum(end - start for start, end in segments) * FPS)
+        assert decoded_frames(output) == total_frames
+
+
+def test_segment_list_merges_kept_ranges():
+    segments = SegmentList(10.0)
+    segments.add_keep(4.0, 6.0)
+    segments.add_keep(1.0, 2.0)
+    # Overlapping and touching ranges merge into one
+    segments.add_keep(5.0, 7.0)
+    segments.add_keep(2.0, 3.0)
+
+    assert list(segments) == [(1.0, 3.0), (4.0, 7.0)]
+
+
+def test_segment_list_cuts():
+    segments = SegmentList(10.0)
+    # Cutting from an empty list starts from the whole video
+    segments.add_cut(2.0, 3.0)
+    assert list(segments) == [(0.0, 2.0), (3.0, 10.0)]
+
+    segments.add_cut(1.0, 4.0)
+    segments.add_cut(8.0, 10.0)
+    assert list(segments) == [(0.0, 1.0), (4.0, 8.0)]
+
+    with pytest.raises(ValueError):
+        segments.add_cut(0.0, 9.0)
+    assert list(segments) == [(0.0, 1.0), (4.0, 8.0)]
+
+    with pytest.raises(ValueError):
+        segments.add_keep(5.0, 11.0)
+
+
+@pytest.mark.parametrize("mode, segments, frames", [
+    (MODE_REENCODE, [(1, 3), (5, 7.2), (9, 12)], 180),
+    (MODE_PARALLEL, [(1, 3), (5, 7.2), (9, 12)], 180),
+    # Cuts between keyframes are re-encoded, cuts on keyframes copied
+    (MODE_SMART, [(1, 3), (5, 7.2), (9, 12)], 180),
+    (MODE_SMART, [(2, 4), (6, 8)], 100),
+    # Copy widens every range out to keyframes: (0, 4) and (4, 8)
+    (MODE_COPY, [(1, 3), (5, 7.2)], 200),
+    (MODE_COPY, [(2, 4), (6, 8)], 100),
+])
+def test_trim_segments_frame_counts(tmp_path, monkeypatch, mode, segments, frames):
+    monkeypatch.setenv("VIDEO_TRIMMER_CACHE", str(tmp_path / "cache"))
+    source = str(tmp_path / "source.mp4")
+    output = str(tmp_path / "out.mp4")
+    make_source(source, seconds=12)
+
+    result = trim_segments(source, segments, output, mode=mode)
+
+    assert result.mode == mode
+    assert decoded_frames(output) == frames
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    monkeypatch.setenv("VIDEO_TRIMMER_CACHE", str(tmp_path / "cache"))
+    path = str(tmp_path / "source.mp4")
+    make_source(path)
+    return path
+
+
+@pytest.fixture
+def timeline(source):
+    return Timeline(MediaIndex.build(source), probe_media(source).duration)
+
+
+def test_timeline_snaps_to_the_nearest_boundary(timeline):
+    frame = 1 / FPS
+    assert timeline.boundary_at(1.0 + 0.4 * frame) == FPS
+    assert timeline.boundary_at(1.0 + 0.6 * frame) == FPS + 1
+    assert timeline.snap(60, SNAP_FRAME) == 60
+    # Keyframes every 2 * FPS frames
+    assert timeline.snap(60, SNAP_KEYFRAME) == 50
+    assert timeline.snap(80, SNAP_KEYFRAME) == 100
+    assert timeline.snap(timeline.frame_count + 5, SNAP_KEYFRAME) == timeline.frame_count
+
+
+def test_timeline_end_boundary_is_the_duration(timeline):
+    end = timeline.frame_count
+    assert timeline.pts_of(end) is None
+    assert timeline.seconds(end) == pytest.approx(timeline.duration)
+    assert timeline.frame_range(0.0, timeline.seconds(end)) == (0, end)
+    # Every boundary maps back onto itself
+    for boundary in range(end + 1):
+        assert timeline.boundary_at(timeline.seconds(boundary)) == boundary
+
+
+def test_start_at_the_last_boundary_is_rejected(source, timeline):
+    end = timeline.seconds(timeline.frame_count)
+    # Past the start of the last frame, so no frame starts in the range
+    start = timeline.seconds(timeline.frame_count - 1) + 0.5 / FPS
+    assert timeline.frame_range(start, end) == (timeline.frame_count, timeline.frame_count)
+
+    with pytest.raises(TrimError, match="past the last frame"):
+        trim(source, start, end, source + ".out.mp4", mode=MODE_REENCODE)
+    with pytest.raises(TrimError):
+        trim(source, end, end, source + ".out.mp4", mode=MODE_REENCODE)